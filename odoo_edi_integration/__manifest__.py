@@ -35,9 +35,14 @@
         'views/edi_config_table_view.xml',
         'views/edi_transactions_view.xml',
         'views/translation_table.xml',
+        'views/edi_xref_view.xml',
         'views/logs_details.xml',
+        'views/res_company_view.xml',
+        'views/res_partner_view.xml',
         'views/ftp_list_view.xml',
         'views/sftp_syncing_view.xml',
+        'views/edi_schedule_view.xml',
+        'views/edi_partial_transfer_view.xml',
         'views/ftp_attachment_view.xml',
         'views/http_route_mapping_table.xml',
         'wizard/edi_export_records_wizard.xml',
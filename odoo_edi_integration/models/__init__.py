@@ -8,4 +8,10 @@ from . import ftp_list
 from . import sftp_syncing
 from . import ir_cron
 from . import translation_table
+from . import edi_xref
+from . import edi_schedule
+from . import edi_partial_transfer
+from . import res_company
+from . import res_partner
+from . import ir_model_fields_selection
 from .import http_rounte_mapping_table
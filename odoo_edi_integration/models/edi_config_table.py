@@ -1,4 +1,4 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from odoo.tools.convert import safe_eval
 from odoo.exceptions import ValidationError
 from xml.etree import ElementTree as ET
@@ -6,6 +6,10 @@ from xml.dom.minidom import parseString
 from ast import literal_eval
 import base64
 import logging
+import xmltodict
+from .edi_tools import EDIRunBudget
+from .edi_xml import parse_xml_document, get_xml_value, compile_xsd, get_xsd_errors, get_structure_errors
+from lxml import etree
 
 _logger = logging.getLogger(__name__)
 
@@ -152,6 +156,61 @@ class EDIConfigTable(models.Model):
         default=False,
         tracking=True
     )
+    import_engine = fields.Selection(
+        selection=[('xmltodict', 'Dictionary (xmltodict)'), ('lxml', 'XPath (lxml)')],
+        string="Import Engine",
+        default='xmltodict',
+        required=True,
+        help="Dictionary engine converts whole file into nested dictionaries. "
+             "XPath engine keeps file as lxml tree & reads each mapped element with a compiled XPath, "
+             "it's faster & uses less memory on large files. Both give the same values."
+    )
+    import_validation = fields.Selection(
+        selection=[('none', 'No Validation'), ('xsd', 'XSD Schema'), ('structure', 'Mapped Elements')],
+        string="Validate Incoming Files",
+        default='none',
+        required=True,
+        help="Incoming file is validated before anything is imported, invalid file is rejected with one report.\n"
+             "- XSD Schema: file must be valid as per the given XSD, file is parsed with XPath engine "
+             "& the same tree is validated and imported.\n"
+             "- Mapped Elements: required elements must have a value, value elements must occur once "
+             "& one2many elements must have child elements, as per mapping lines."
+    )
+    validation_xsd = fields.Binary(
+        string="XSD Schema",
+        attachment=False
+    )
+    validation_xsd_name = fields.Char(
+        string="XSD Schema File Name"
+    )
+    import_batch_size = fields.Integer(
+        string="Import Batch Size",
+        default=500,
+        help="When a file has multiple records, this many records are searched, created and updated together."
+    )
+    commit_batch_size = fields.Integer(
+        string="Commit Every N Records",
+        default=1000,
+        help="When a file has multiple records, imported records are committed after every N records "
+             "and the transaction remembers where to resume from. Set 0 to commit once at the end of the file."
+    )
+    retry_max_attempts = fields.Integer(
+        string="Max Attempts",
+        default=5,
+        help="Transaction is retried automatically on transient errors (connection, timeout, temporary server "
+             "replies) until this many attempts are made, after that it is set as Failed."
+    )
+    retry_base_delay = fields.Integer(
+        string="Retry Delay (Minutes)",
+        default=5,
+        help="Delay before first retry, it is doubled on each next attempt."
+    )
+    transaction_priority = fields.Integer(
+        string="Transaction Priority",
+        default=0,
+        help="EDI transactions of this table are processed before transactions with lower priority. "
+             "Priority of trading partner is used when it is higher."
+    )
 
     @api.model_create_multi
     def create(self, vals_list):
@@ -173,10 +232,19 @@ class EDIConfigTable(models.Model):
                     'state': 'manual',
                     'copied': False
                 })
+        self.env.registry.clear_cache()
         return res
 
     def write(self, vals):
+        # Pending transactions which still have default priority follow the new transaction priority.
+        transactions = self.env['edi.transactions']
+        if 'transaction_priority' in vals:
+            transactions = transactions._get_transactions_with_default_priority(
+                [('edi_config_table_id', 'in', self.ids)])
         res = super(EDIConfigTable, self).write(vals)
+        if {'xml_header', 'sequence', 'import_validation', 'validation_xsd', 'file_type', 'line_ids',
+                'is_translation_required'} & set(vals):
+            self.env.registry.clear_cache()
         is_processed_exists = self.env['ir.model.fields'].search(
             [('model_id', '=', self.model_id.id), ('name', '=', 'x_is_processed')])
         if not is_processed_exists:
@@ -189,8 +257,150 @@ class EDIConfigTable(models.Model):
                 'state': 'manual',
                 'copied': False
             })
+        transactions._update_default_priority()
+        return res
+
+    def unlink(self):
+        """
+        This method is used to drop cached XML header routing of deleted mapping tables.
+        Author: DG
+        """
+        res = super(EDIConfigTable, self).unlink()
+        self.env.registry.clear_cache()
         return res
 
+    def _parse_import_content(self, xml_content):
+        """
+        This method is used to parse XML content of incoming file with import engine of the table.
+        With XSD validation, file is parsed with lxml whatever the engine is (both engines give same values),
+        so the same tree is validated & imported.
+        Author: DG
+        """
+        self.ensure_one()
+        if self.import_engine == 'lxml' or (self.import_validation == 'xsd' and self.validation_xsd):
+            return parse_xml_document(xml_content)
+        return xmltodict.parse(xml_content)
+
+    @api.constrains('import_validation', 'validation_xsd')
+    def _check_validation_xsd(self):
+        """
+        This method is used to check XSD schema can be compiled, when it's saved.
+        Author: DG
+        """
+        for rec in self.filtered(lambda table: table.import_validation == 'xsd'):
+            if not rec.validation_xsd:
+                raise ValidationError("Please upload XSD schema of mapping table [{}].".format(rec.name))
+            try:
+                compile_xsd(base64.b64decode(rec.validation_xsd))
+            except etree.Error as e:
+                raise ValidationError("XSD schema of mapping table [{}] is not valid:\n{}".format(rec.name, e))
+
+    @tools.ormcache('self.id')
+    def _get_compiled_xsd(self):
+        """
+        This method is used to get compiled XSD schema of the table, it's compiled once per worker.
+        Author: DG
+        """
+        return compile_xsd(base64.b64decode(self.sudo().validation_xsd))
+
+    def _prepare_structure_spec(self, seen_tables=None):
+        """
+        This method is used to prepare structure spec from mapping lines, one2many lines have spec of their sub-table.
+        Author: DG
+        """
+        seen_tables = (seen_tables or set()) | {self.id}
+        spec = []
+        for line in self.line_ids.filtered('xml_element'):
+            sub_spec = None
+            if line.odoo_field.ttype == 'one2many' and line.sub_edi_config_table_id:
+                sub_table = line.sub_edi_config_table_id
+                sub_spec = sub_table._prepare_structure_spec(seen_tables) if sub_table.id not in seen_tables else ()
+            spec.append((line.xml_element, line.required, sub_spec))
+        return tuple(spec)
+
+    @tools.ormcache('self.id')
+    def _get_structure_spec(self):
+        """
+        This method is used to get structure spec of the table, it's prepared once per worker.
+        For multiple records file, spec is for each record of record element (first mapping line).
+        Author: DG
+        """
+        table = self.sudo()
+        if table.file_type == 'multiple' and table.main_table and table.line_ids:
+            record_line = table.line_ids[0]
+            return record_line.xml_element, record_line.sub_edi_config_table_id._prepare_structure_spec()
+        return False, table._prepare_structure_spec()
+
+    def _get_import_validation_errors(self, document, data):
+        """
+        This method is used to validate incoming file before import, as per validation of the table.
+        document is parsed file (as given by _parse_import_content) & data is parsed content from header element,
+        nothing is parsed again. It returns list of (message, row).
+        Author: DG
+        """
+        self.ensure_one()
+        if self.import_validation == 'xsd' and self.validation_xsd:
+            return [(message, False) for message in get_xsd_errors(self._get_compiled_xsd(), document)]
+        if self.import_validation == 'structure':
+            record_element, spec = self._get_structure_spec()
+            if not record_element:
+                return list(get_structure_errors(data, spec))
+            records = get_xml_value(data, record_element)
+            if records is None:
+                return [("[%s] record element not found" % record_element, False)]
+            errors = []
+            for row, record in enumerate(records if isinstance(records, list) else [records], 1):
+                errors.extend(get_structure_errors(record, spec, row))
+            return errors
+        return []
+
+    @tools.ormcache('self.id')
+    def _get_translation_map(self):
+        """
+        This method is used to get translations of the table as (XML element, XML value) => Odoo value,
+        loaded once per worker instead of searching translation table for each value of file.
+        First translation wins as in search.
+        Author: DG
+        """
+        translation_map = {}
+        for translation in self.env['translation.table'].sudo().search([('edi_config_table_id', '=', self.id)]):
+            if translation.corresponding_odoo_value:
+                translation_map.setdefault((translation.xml_element, translation.xml_value),
+                                           translation.corresponding_odoo_value)
+        return translation_map
+
+    def _translate_value(self, xml_element, value):
+        """
+        This method is used to get corresponding Odoo value of XML value from translation table,
+        value is returned as it is when there is no translation.
+        Author: DG
+        """
+        self.ensure_one()
+        if not isinstance(value, str):
+            return value
+        return self._get_translation_map().get((xml_element, value), value)
+
+    @api.model
+    @tools.ormcache()
+    def _get_xml_header_config_map(self):
+        """
+        This method is used to get XML header => mapping table id, first table in sequence wins as in search.
+        It's cached in memory of every worker & cleared when a mapping table is created, changed or deleted.
+        Author: DG
+        """
+        config_map = {}
+        for config in self.sudo().search_read([('xml_header', '!=', False)], ['xml_header']):
+            config_map.setdefault(config['xml_header'], config['id'])
+        return config_map
+
+    @api.model
+    def _get_config_by_xml_header(self, xml_header):
+        """
+        This method is used to get mapping table of XML header, from the cached map.
+        Author: DG
+        """
+        return self.browse(self._get_xml_header_config_map().get(xml_header or '', []))
+
     @api.onchange('model_id')
     def onchange_model_id(self):
         self.field_for_location_visible = False
@@ -230,6 +440,8 @@ class EDIConfigTable(models.Model):
             parent_dict, final_key = self._get_nested_dict_ref(value_to_update, line_field)
 
             if line.odoo_field.ttype in ["char", "text", "html", "selection"]:
+                if value and line.odoo_field.ttype == "selection" and line.selection_export_as == 'label':
+                    value = line._get_selection_maps()[1].get(value, value)
                 if value and line.char_length:
                     value = value[0: line.char_length]
                 parent_dict[final_key] = value or ""
@@ -272,6 +484,29 @@ class EDIConfigTable(models.Model):
                 dict_vals = {header: dict_vals}
         return dict_vals
 
+    def _prepare_search_key_from_record(self, record):
+        """
+        This method is used to prepare search key of exported record from search_record_from_this_value elements,
+        with the values which are written in XML file. It is used to link record in EDI cross-reference table,
+        where values are normalized same as values of incoming files.
+        Author: DG
+        """
+        self.ensure_one()
+        search_key = []
+        for value in (self.search_record_from_this_value or "").split(','):
+            field_line = self.line_ids.filtered(lambda line: line.xml_element == value.strip() and line.odoo_field)
+            if not field_line:
+                continue
+            field_line = field_line[0]
+            field_value = record[field_line.odoo_field.name]
+            if field_line.odoo_field.ttype == "many2one":
+                field_value = field_value[field_line.field_of_m2o_field.name or 'name'] if field_value else False
+                if isinstance(field_value, models.BaseModel):
+                    field_value = field_value.display_name
+            if field_value:
+                search_key.append((field_line.odoo_field.name, field_value))
+        return tuple(search_key) or False
+
     def export_process(self, record, edi_transaction=False):
         """
         This method is specifically for single record in single file.
@@ -341,6 +576,9 @@ class EDIConfigTable(models.Model):
             edi_transaction.write(vals)
         else:
             edi_transaction = edi_transaction_obj.create(vals)
+        if not exception_info:
+            self.env['edi.xref'].sudo().register_records(self, edi_partner,
+                                                         [(self._prepare_search_key_from_record(record), record)])
         if exception_info and edi_transaction:
             edi_transaction.write({
                 'state': 'Failed',
@@ -352,13 +590,16 @@ class EDIConfigTable(models.Model):
         if main_log_id and not main_log_id.log_detail_ids:
             main_log_id.unlink()
 
-    def export_edi_transactions(self):
+    def export_edi_transactions(self, time_budget=None, item_budget=None):
         """
         This method is used through cronjob. It retrieves configuration records with EDI type 'Outgoing'
         and the main table flag enabled, then finds all related records from the specified model.
         Based on the configuration, it creates attachments and EDI transaction records.
+        Every exported file is committed, when time/item budget is used up then the cronjob is triggered again
+        & records which already have a pending transaction are skipped in next run.
         Author: DG
         """
+        budget = EDIRunBudget(time_budget=time_budget, item_budget=item_budget)
         outgoing_config_tables = self.search([
             ('model_id.model', '!=', 'product.product'),
             ('edi_type', '=', 'Outgoing'),
@@ -420,11 +661,38 @@ class EDIConfigTable(models.Model):
 
             # Process records based on file type
             if rec.file_type == 'multiple':
+                # Records of a pending file are not exported again, e.g. when run is continued after reschedule.
+                pending_transactions = self.env['edi.transactions'].search([
+                    ('edi_config_table_id', '=', rec.id),
+                    ('edi_type', '=', 'Outgoing'),
+                    ('state', 'in', ['Draft', 'Processing']),
+                ])
+                pending_record_ids = {
+                    record_id for transaction in pending_transactions
+                    for record_id in (transaction.reference_data or {}).get(rec.model_id.model, [])
+                }
+                records_need_to_export = records_need_to_export.filtered(lambda r: r.id not in pending_record_ids)
                 if records_need_to_export:
                     rec.export_process_for_multiple_records(records_need_to_export)
+                    budget.consume()
+                    self._cr.commit()
             else:
-                for record in records_need_to_export:
+                pending_transactions = self.env['edi.transactions'].search([
+                    ('edi_config_table_id', '=', rec.id),
+                    ('edi_type', '=', 'Outgoing'),
+                    ('state', 'in', ['Draft', 'Processing']),
+                    ('reference', 'in', ["%s,%s" % (record._name, record.id) for record in records_need_to_export]),
+                ])
+                pending_record_ids = {transaction.reference.id for transaction in pending_transactions}
+                for record in records_need_to_export.filtered(lambda r: r.id not in pending_record_ids):
+                    if budget.exhausted():
+                        break
                     rec.export_process(record)
+                    budget.consume()
+                    self._cr.commit()
+            if budget.exhausted():
+                budget.reschedule(self.env, cron_xml_id='odoo_edi_integration.export_edi_transactions_cronjob')
+                return
 
     def export_process_for_multiple_records(self, records_need_to_export, edi_transaction=False):
         """
@@ -509,6 +777,10 @@ class EDIConfigTable(models.Model):
             edi_transaction.write(create_vals)
         else:
             edi_transaction = edi_transaction_obj.create(create_vals)
+        if not exception_info:
+            self.env['edi.xref'].sudo().register_records(
+                self, edi_partner,
+                [(self._prepare_search_key_from_record(record), record) for record in records_need_to_export])
         if exception_info and edi_transaction:
             edi_transaction.write({
                 'state': 'Failed',
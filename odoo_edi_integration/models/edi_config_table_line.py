@@ -1,4 +1,4 @@
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from odoo.exceptions import ValidationError
 
 
@@ -72,7 +72,19 @@ class EDIConfigTableLine(models.Model):
     )
     required = fields.Boolean(
         string="Required",
-        help="If it's enable, The Element is required and will cause an error if value is not there.",
+        help="If it's enable, The Element is required and will cause an error if value is not there. "
+             "For incoming files it's checked when mapping table validates 'Mapped Elements'.",
+    )
+    date_format = fields.Char(
+        string="Date Format",
+        help="Format of date/datetime values of incoming files, e.g. %d.%m.%Y, %Y%m%d or 'iso' for ISO 8601. "
+             "If it's empty, format is detected from the values (year first, then month before day).",
+    )
+    selection_export_as = fields.Selection(
+        selection=[('value', 'Code'), ('label', 'Label')],
+        string="Export Selection As",
+        default='value',
+        help="For selection fields of outgoing files, write either the technical code or the label of the value.",
     )
 
     @api.onchange('odoo_field')
@@ -103,3 +115,48 @@ class EDIConfigTableLine(models.Model):
         else:
             raise ValidationError("Please select the Odoo model first.")
         return res
+
+    @tools.ormcache('self.id', 'self.env.lang')
+    def _get_selection_maps(self):
+        """
+        This method is used to get lookup maps of selection field values of the line, built once per line & language
+        instead of reading selection records for each value of file.
+        It returns dict of value/label/translation alias to value & dict of value to label. Codes win over labels,
+        labels win over aliases of translation table (XML values of the line's element, when table uses translation).
+        Author: DG
+        """
+        line = self.sudo()
+        selections = line.odoo_field.selection_ids
+        to_label = {selection.value: selection.name for selection in selections}
+        to_value = {}
+        table = line.edi_config_table_id
+        if table.is_translation_required:
+            for (xml_element, xml_value), odoo_value in table._get_translation_map().items():
+                if xml_element == line.xml_element and xml_value:
+                    selection_value = odoo_value if odoo_value in to_label else next(
+                        (value for value, label in to_label.items() if label == odoo_value), None)
+                    if selection_value is not None:
+                        to_value[xml_value] = selection_value
+        to_value.update({selection.name: selection.value for selection in selections})
+        to_value.update({selection.value: selection.value for selection in selections})
+        return to_value, to_label
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        This method is used to drop cached structure spec of mapping tables, when mapping lines are added.
+        Author: DG
+        """
+        res = super(EDIConfigTableLine, self).create(vals_list)
+        self.env.registry.clear_cache()
+        return res
+
+    def write(self, vals):
+        res = super(EDIConfigTableLine, self).write(vals)
+        self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super(EDIConfigTableLine, self).unlink()
+        self.env.registry.clear_cache()
+        return res
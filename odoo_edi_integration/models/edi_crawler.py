@@ -0,0 +1,245 @@
+import calendar
+import fnmatch
+import ftplib
+import logging
+import queue
+import stat
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+_logger = logging.getLogger(__name__)
+
+
+def join_remote_path(path, name):
+    """
+    This method is used to join remote directory path & entry name.
+    Author: DG
+    """
+    return f"{path}/{name}".replace('//', '/')
+
+
+def list_ftp_subdirectories(ftp, path):
+    """
+    This method is used to list sub directories of FTP path with their modification time.
+    MLSD 'type' fact is trusted, so no 'cwd' is needed to confirm a directory. When server doesn't support MLSD,
+    NLST entries are confirmed with 'cwd' & their modification time is unknown.
+    Author: DG
+    """
+    ftp.encoding = 'latin-1'
+    try:
+        entries = list(ftp.mlsd(path, facts=['type', 'modify']))
+    except ftplib.all_errors as e:
+        _logger.info(f"MLSD failed, falling back to NLST.\n{e}")
+        directories = {}
+        for entry in ftp.nlst(path):
+            name = entry.rstrip('/').rsplit('/', 1)[-1]
+            if name in ('.', '..'):
+                continue
+            entry_path = entry if entry.startswith('/') else join_remote_path(path, entry)
+            try:
+                ftp.cwd(entry_path)
+                directories[entry_path] = None
+            except ftplib.all_errors:
+                continue
+        return directories
+    return {
+        join_remote_path(path, name): facts.get('modify')
+        for name, facts in entries if facts.get('type') == 'dir'
+    }
+
+
+def ftp_directory_mtime(ftp, path):
+    """
+    This method is used to get modification time of FTP directory with MLST, None if server doesn't give it.
+    Author: DG
+    """
+    ftp.encoding = 'latin-1'
+    try:
+        response = ftp.sendcmd('MLST %s' % path)
+    except ftplib.all_errors:
+        return None
+    for line in response.splitlines()[1:-1]:
+        facts = dict(
+            fact.split('=', 1) for fact in line.strip().split(' ', 1)[0].split(';') if '=' in fact
+        )
+        return facts.get('modify')
+    return None
+
+
+def list_sftp_subdirectories(sftp, path):
+    """
+    This method is used to list sub directories of SFTP path with their modification time, from 'st_mode' facts.
+    Author: DG
+    """
+    return {
+        join_remote_path(path, file_attr.filename): file_attr.st_mtime
+        for file_attr in sftp.listdir_attr(path) if stat.S_ISDIR(file_attr.st_mode)
+    }
+
+
+def sftp_directory_mtime(sftp, path):
+    """
+    This method is used to get modification time of SFTP directory, None if it can't be read.
+    Author: DG
+    """
+    try:
+        return sftp.stat(path).st_mtime
+    except (IOError, OSError):
+        return None
+
+
+def ftp_time_to_timestamp(value):
+    """
+    This method is used to convert FTP time value (YYYYMMDDHHMMSS[.sss], UTC) into epoch seconds, None if invalid.
+    Author: DG
+    """
+    try:
+        return float(calendar.timegm(time.strptime(value[:14], '%Y%m%d%H%M%S')))
+    except (TypeError, ValueError):
+        return None
+
+
+def list_ftp_files(ftp, path):
+    """
+    This method is used to list files of FTP path with their (size, modification time).
+    When server doesn't support MLSD, NLST entries are asked with SIZE & MDTM, facts are None if not given.
+    Connection encoding is kept, so names match names listed by NLST on the same connection.
+    Author: DG
+    """
+    try:
+        entries = list(ftp.mlsd(path, facts=['type', 'size', 'modify']))
+    except ftplib.all_errors as e:
+        _logger.info(f"MLSD failed, falling back to NLST.\n{e}")
+        ftp.voidcmd('TYPE I')
+        files = {}
+        for entry in ftp.nlst(path):
+            name = entry.rstrip('/').rsplit('/', 1)[-1]
+            if name in ('.', '..'):
+                continue
+            entry_path = join_remote_path(path, name)
+            try:
+                size = ftp.size(entry_path)
+            except ftplib.all_errors:
+                size = None
+            try:
+                mtime = ftp_time_to_timestamp(ftp.voidcmd('MDTM %s' % entry_path)[4:].strip())
+            except ftplib.all_errors:
+                mtime = None
+            files[name] = (size, mtime)
+        return files
+    return {
+        name: (int(facts['size']) if facts.get('size', '').isdigit() else None,
+               ftp_time_to_timestamp(facts.get('modify')))
+        for name, facts in entries if facts.get('type') == 'file'
+    }
+
+
+def list_sftp_files(sftp, path):
+    """
+    This method is used to list files of SFTP path with their (size, modification time).
+    Author: DG
+    """
+    return {
+        file_attr.filename: (file_attr.st_size, file_attr.st_mtime)
+        for file_attr in sftp.listdir_attr(path) if not stat.S_ISDIR(file_attr.st_mode or 0)
+    }
+
+
+class RemoteTreeCrawler:
+    """
+    Breadth-first crawler of a remote directory tree. Directories of one level are listed in parallel, each listing
+    uses one of the given connections. Listing of each directory is cached with its modification time,
+    a directory whose modification time is not changed since last crawl is not listed again.
+    Author: DG
+    """
+
+    def __init__(self, connections, list_directory, directory_mtime, max_depth=0, exclude_patterns=(), cache=None):
+        self.connections = queue.Queue()
+        for connection in connections:
+            self.connections.put(connection)
+        self.workers = len(connections)
+        self.list_directory = list_directory
+        self.directory_mtime = directory_mtime
+        self.max_depth = max_depth or 0
+        self.exclude_patterns = [pattern.strip() for pattern in exclude_patterns if pattern and pattern.strip()]
+        self.cache = cache or {}
+        self.new_cache = {}
+        self.changed_directories = set()
+        self.failed_directories = set()
+        self.directories = []
+        self.listed_count = 0
+        self.reused_count = 0
+
+    def _is_excluded(self, path):
+        """
+        This method is used to check whether directory matches any exclude pattern, by full path or by name.
+        Author: DG
+        """
+        name = path.rstrip('/').rsplit('/', 1)[-1]
+        return any(fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(name, pattern)
+                   for pattern in self.exclude_patterns)
+
+    def _visit(self, path, mtime):
+        """
+        This method is used to get sub directories of a directory, from cache when it's not modified.
+        mtime is modification time known from fresh listing of parent directory, otherwise it's read here.
+        When listing fails, directory is added in failed_directories & its cached sub directories are used,
+        so its subtree is not lost. Returns (path, mtime, sub directories, listed), sub directories are None
+        when listing failed & directory isn't cached.
+        Author: DG
+        """
+        connection = self.connections.get()
+        try:
+            if mtime is None:
+                mtime = self.directory_mtime(connection, path)
+            cached = self.cache.get(path)
+            if cached and mtime is not None and cached.get('mtime') == mtime:
+                return path, mtime, dict(cached.get('children') or {}), False
+            try:
+                return path, mtime, self.list_directory(connection, path), True
+            except Exception as e:
+                _logger.warning(f"Listing of {path} failed: {e}")
+                self.failed_directories.add(path)
+                if cached:
+                    # Old modification time is kept in cache, so directory is listed again on next crawl.
+                    return path, cached.get('mtime'), dict(cached.get('children') or {}), False
+                return path, mtime, None, True
+        finally:
+            self.connections.put(connection)
+
+    def crawl(self, root):
+        """
+        This method is used to crawl the tree under root directory, level by level.
+        Returns sorted list of directory paths (also kept in directories), root itself is not included.
+        Author: DG
+        """
+        directories = []
+        level = [(root, None)]
+        depth = 0
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+            while level:
+                next_level = []
+                for path, mtime, children, listed in executor.map(lambda item: self._visit(*item), level):
+                    if children is None:
+                        continue
+                    if listed:
+                        self.listed_count += 1
+                        if self.cache.get(path, {}).get('children') != children:
+                            self.changed_directories.add(path)
+                    elif path not in self.failed_directories:
+                        self.reused_count += 1
+                    self.new_cache[path] = {'mtime': mtime, 'children': children}
+                    if self.max_depth and depth + 1 > self.max_depth:
+                        continue
+                    for child, child_mtime in sorted(children.items()):
+                        if self._is_excluded(child):
+                            continue
+                        directories.append(child)
+                        # Modification time of a child is fresh only when this directory is just listed.
+                        next_level.append((child, child_mtime if listed else None))
+                level = next_level
+                depth += 1
+        _logger.info(f"Crawled {len(directories)} directories under {root}: "
+                     f"{self.listed_count} listed, {self.reused_count} reused from cache.")
+        self.directories = sorted(directories)
+        return self.directories
@@ -0,0 +1,91 @@
+import functools
+import re
+from datetime import datetime, timezone
+from dateutil import parser
+
+# Formats tried for a value shape, only the ones read same as dateutil reads them (year first, month before day),
+# day first files need explicit format on mapping line. 'iso' means datetime.fromisoformat.
+DATE_FORMATS = (
+    'iso',
+    '%Y%m%d',
+    '%Y%m%d%H%M%S',
+    '%Y/%m/%d',
+    '%Y/%m/%d %H:%M:%S',
+    '%Y.%m.%d',
+    '%m/%d/%Y',
+    '%m/%d/%Y %H:%M:%S',
+    '%m/%d/%Y %H:%M',
+    '%m-%d-%Y',
+    '%m.%d.%Y',
+    '%d-%b-%Y',
+    '%d %b %Y',
+    '%b %d, %Y',
+)
+_DIGITS = re.compile(r'\d')
+_LETTERS = re.compile(r'[A-Za-z]')
+# Detected format of each value shape (digits as 9, letters as a) in this process.
+_detected_formats = {}
+
+
+def _parse_with_format(value, date_format):
+    """
+    This method is used to parse value with strptime format or ISO 8601 ('iso'), it raises ValueError if not matched.
+    Author: DG
+    """
+    if date_format == 'iso':
+        if value.endswith(('Z', 'z')):
+            value = value[:-1] + '+00:00'
+        return datetime.fromisoformat(value)
+    return datetime.strptime(value, date_format)
+
+
+def detect_date_format(value):
+    """
+    This method is used to detect format of date value. Format is remembered for shape of the value
+    (digits as 9, letters as a), so it's detected once for all values of a file having same shape.
+    Author: DG
+    """
+    shape = _LETTERS.sub('a', _DIGITS.sub('9', value))
+    date_format = _detected_formats.get(shape)
+    if date_format:
+        return date_format
+    for date_format in DATE_FORMATS:
+        try:
+            _parse_with_format(value, date_format)
+        except ValueError:
+            continue
+        if len(_detected_formats) >= 1024:
+            _detected_formats.clear()
+        _detected_formats[shape] = date_format
+        return date_format
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def parse_date_value(value, date_format=False):
+    """
+    This method is used to parse date/datetime value of incoming file.
+    Value is parsed with explicit format of mapping line, or with format detected from shape of value,
+    dateutil (year first, month before day) is used only when fast parsing fails. Repeated values are memoized.
+    Author: DG
+    """
+    value = value.strip()
+    if not date_format:
+        date_format = detect_date_format(value)
+    if date_format:
+        try:
+            return _parse_with_format(value, date_format)
+        except ValueError:
+            pass
+    return parser.parse(value, yearfirst=True, dayfirst=False)
+
+
+def to_utc_naive(value):
+    """
+    This method is used to convert datetime having timezone into UTC without timezone, as Odoo stores datetimes.
+    Datetime without timezone is kept as it is.
+    Author: DG
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
@@ -0,0 +1,408 @@
+import ftplib
+import hashlib
+import logging
+import os
+from contextlib import contextmanager
+import paramiko
+from odoo import api, fields, models
+from odoo.exceptions import ValidationError
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Size of blocks read from/written to remote file.
+TRANSFER_BLOCK_SIZE = 64 * 1024
+# Hash names given by FTP HASH command & hashlib names of them.
+FTP_HASH_ALGORITHMS = {'SHA-256': 'sha256', 'SHA-512': 'sha512', 'SHA-1': 'sha1', 'MD5': 'md5'}
+# Algorithms of SFTP 'check-file' extension, in order of preference.
+SFTP_CHECKSUM_ALGORITHMS = ('sha256', 'sha1', 'md5')
+# Checksum algorithm supported by each SFTP server in this process, (database, model, id) => algorithm or False.
+_sftp_checksum_algorithms = {}
+
+
+def _file_digest(path, algorithm):
+    """
+    This method is used to get hex digest of local file.
+    Author: DG
+    """
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as fp:
+        for block in iter(lambda: fp.read(TRANSFER_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class EDIPartialTransfer(models.Model):
+    _name = "edi.partial.transfer"
+    _description = "EDI Partial File Transfer"
+    _rec_name = "remote_path"
+    _order = "id desc"
+
+    ftp_syncing_id = fields.Many2one(
+        comodel_name="ftp.syncing",
+        string="FTP",
+        ondelete="cascade"
+    )
+    sftp_syncing_id = fields.Many2one(
+        comodel_name="sftp.syncing",
+        string="SFTP",
+        ondelete="cascade"
+    )
+    direction = fields.Selection(
+        selection=[('download', 'Download'), ('upload', 'Upload')],
+        string="Direction",
+        required=True
+    )
+    remote_path = fields.Char(
+        string="Remote Path",
+        required=True,
+        index=True
+    )
+    local_path = fields.Char(
+        string="Local Path",
+        required=True
+    )
+    remote_size = fields.Float(
+        string="Remote Size (Bytes)",
+        digits=(20, 0)
+    )
+    remote_mtime = fields.Char(
+        string="Remote Modification Time"
+    )
+    offset = fields.Float(
+        string="Transferred (Bytes)",
+        digits=(20, 0),
+        help="Number of bytes already transferred, next attempt resumes from here."
+    )
+    last_error = fields.Text(
+        string="Last Error"
+    )
+
+
+    @contextmanager
+    def _autonomous(self):
+        """
+        This method is used to read & write transfer records on a cursor of their own, which is committed at the end.
+        Progress is kept when the caller rolls back, caller's half-done work is never committed, and the caller
+        never locks transfer rows which this cursor updates.
+        Author: DG
+        """
+        with self.env.registry.cursor() as cr:
+            yield self.with_env(self.env(cr=cr))
+
+    @api.model
+    def _get_partial_directory(self):
+        """
+        This method is used to get persistent directory of partial files, it's kept across restarts unlike /tmp.
+        Author: DG
+        """
+        directory = os.path.join(config['data_dir'], 'edi_partial', self.env.cr.dbname)
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    @api.model
+    def _get_transfer(self, server, direction, remote_path, local_path=False):
+        """
+        This method is used to find or create transfer record of a remote file.
+        Local path of a download is in the partial directory & it's derived from server & remote path.
+        Author: DG
+        """
+        server_field = 'ftp_syncing_id' if server._name == 'ftp.syncing' else 'sftp_syncing_id'
+        transfer = self.search([
+            (server_field, '=', server.id),
+            ('direction', '=', direction),
+            ('remote_path', '=', remote_path),
+        ], limit=1)
+        if transfer:
+            return transfer
+        if not local_path:
+            local_name = "%s_%s_%s.part" % (server._table, server.id, hashlib.sha1(remote_path.encode()).hexdigest())
+            local_path = os.path.join(self._get_partial_directory(), local_name)
+        return self.create({
+            server_field: server.id,
+            'direction': direction,
+            'remote_path': remote_path,
+            'local_path': local_path,
+        })
+
+    def _reset(self):
+        """
+        This method is used to start transfer again from the first byte.
+        Author: DG
+        """
+        self.ensure_one()
+        if self.direction == 'download' and os.path.exists(self.local_path):
+            os.remove(self.local_path)
+        self.offset = 0
+
+    def _record_failure(self, error, offset):
+        """
+        This method is used to store reached offset of a failed transfer on a separate cursor, so next attempt
+        resumes even if the caller rolls back its transaction. No remote call is made here, as the connection
+        may be broken, offset is the last one known locally.
+        Author: DG
+        """
+        with self._autonomous() as transfer:
+            transfer.write({'offset': offset, 'last_error': str(error)})
+            _logger.warning("Transfer of [{}] stopped at {} bytes => {}".format(transfer.remote_path, int(offset),
+                                                                                error))
+
+    def _finish(self):
+        """
+        This method is used to remove local partial file of download & the transfer record, after file is used.
+        Author: DG
+        """
+        if not self:
+            return
+        with self._autonomous() as transfers:
+            for transfer in transfers.exists():
+                if transfer.direction == 'download' and os.path.exists(transfer.local_path):
+                    os.remove(transfer.local_path)
+            transfers.exists().unlink()
+
+    # Remote file facts & checksums.
+
+    @staticmethod
+    def _ftp_remote_facts(ftp, remote_path):
+        """
+        This method is used to get size & modification time of FTP file, None when server doesn't give them.
+        Author: DG
+        """
+        ftp.voidcmd('TYPE I')
+        try:
+            size = ftp.size(remote_path)
+        except ftplib.all_errors:
+            size = None
+        try:
+            mtime = ftp.voidcmd('MDTM %s' % remote_path)[4:].strip()
+        except ftplib.all_errors:
+            mtime = None
+        return size, mtime
+
+    @staticmethod
+    def _ftp_remote_checksum(ftp, remote_path):
+        """
+        This method is used to get (hashlib name, hex digest) of FTP file with HASH command, None if not supported.
+        Author: DG
+        """
+        try:
+            response = ftp.sendcmd('HASH %s' % remote_path)
+        except ftplib.all_errors:
+            return None
+        parts = response.split()
+        if len(parts) >= 4 and parts[1].upper() in FTP_HASH_ALGORITHMS:
+            return FTP_HASH_ALGORITHMS[parts[1].upper()], parts[3].lower()
+        return None
+
+    @staticmethod
+    def _sftp_remote_checksum(server, sftp, remote_path):
+        """
+        This method is used to get (hashlib name, hex digest) of SFTP file with 'check-file' extension,
+        None if server doesn't support it. Supported algorithm is probed once per server (on one open of the file)
+        & remembered in this process, later files are checked with it directly.
+        Author: DG
+        """
+        key = (server.env.cr.dbname, server._name, server.id)
+        algorithms = SFTP_CHECKSUM_ALGORITHMS
+        if key in _sftp_checksum_algorithms:
+            if not _sftp_checksum_algorithms[key]:
+                return None
+            algorithms = (_sftp_checksum_algorithms[key],)
+        try:
+            with sftp.open(remote_path, 'rb') as remote_file:
+                for algorithm in algorithms:
+                    try:
+                        checksum = remote_file.check(algorithm).hex()
+                    except (IOError, OSError, paramiko.SSHException):
+                        continue
+                    _sftp_checksum_algorithms[key] = algorithm
+                    return algorithm, checksum
+        except (IOError, OSError, paramiko.SSHException):
+            return None
+        _sftp_checksum_algorithms[key] = False
+        return None
+
+    def _verify(self, size, checksum):
+        """
+        This method is used to verify transferred file by size, and by checksum when server gives it.
+        If it doesn't match, then transfer is reset so next attempt starts again.
+        Author: DG
+        """
+        self.ensure_one()
+        local_size = os.path.getsize(self.local_path)
+        error = False
+        if size is not None and local_size != size:
+            error = "size is {} bytes instead of {}".format(local_size, size)
+        elif checksum and _file_digest(self.local_path, checksum[0]) != checksum[1]:
+            error = "{} checksum doesn't match".format(checksum[0])
+        if error:
+            self._reset()
+            raise ValidationError("Transferred file [{}] is not valid, {}.".format(self.remote_path, error))
+
+    @api.model
+    def _start_download(self, server, remote_path, size, mtime):
+        """
+        This method is used to find download of remote file & get offset to resume from, on a cursor of its own.
+        If remote file is changed since the last attempt, then download starts again.
+        Returns transfer (of caller's environment), its local path & offset.
+        Author: DG
+        """
+        with self._autonomous() as transfer_obj:
+            transfer = transfer_obj._get_transfer(server, 'download', remote_path)
+            if transfer.remote_size != (size or 0) or transfer.remote_mtime != mtime:
+                transfer._reset()
+                transfer.write({'remote_size': size or 0, 'remote_mtime': mtime})
+            offset = os.path.getsize(transfer.local_path) if os.path.exists(transfer.local_path) else 0
+            if size is None or offset > size:
+                transfer._reset()
+                offset = 0
+            return self.browse(transfer.id), transfer.local_path, offset
+
+    def _end_download(self, size, checksum):
+        """
+        This method is used to verify finished download & store its offset, on a cursor of its own.
+        Returns local path of the complete file.
+        Author: DG
+        """
+        error = False
+        with self._autonomous() as transfer:
+            local_path = transfer.local_path
+            try:
+                transfer._verify(size, checksum)
+            except ValidationError as e:
+                # Reset of invalid file is committed, then error is raised to the caller.
+                error = e
+            transfer.offset = os.path.getsize(local_path) if os.path.exists(local_path) else 0
+        if error:
+            raise error
+        return local_path
+
+    # Downloads.
+
+    @api.model
+    def download_ftp(self, server, ftp, remote_path):
+        """
+        This method is used to download FTP file into partial directory, resuming with REST from
+        already downloaded bytes. Returns the transfer & local path of the complete file.
+        Author: DG
+        """
+        size, mtime = self._ftp_remote_facts(ftp, remote_path)
+        transfer, local_path, offset = self._start_download(server, remote_path, size, mtime)
+        if size is None or offset < size:
+            try:
+                with open(local_path, 'ab') as fp:
+                    ftp.retrbinary("RETR %s" % remote_path, fp.write, blocksize=TRANSFER_BLOCK_SIZE,
+                                   rest=offset or None)
+            except Exception as e:
+                transfer._record_failure(e, os.path.getsize(local_path))
+                raise
+        return transfer, transfer._end_download(size, self._ftp_remote_checksum(ftp, remote_path))
+
+    @api.model
+    def download_sftp(self, server, sftp, remote_path):
+        """
+        This method is used to download SFTP file into partial directory, resuming with seek from
+        already downloaded bytes. Returns the transfer & local path of the complete file.
+        Author: DG
+        """
+        remote_attr = sftp.stat(remote_path)
+        size, mtime = remote_attr.st_size, str(remote_attr.st_mtime)
+        transfer, local_path, offset = self._start_download(server, remote_path, size, mtime)
+        if offset < size:
+            try:
+                with sftp.open(remote_path, 'rb') as remote_file, open(local_path, 'ab') as fp:
+                    remote_file.seek(offset)
+                    if server.sftp_prefetch and server.sftp_max_concurrent_requests:
+                        remote_file.prefetch(size, max_concurrent_requests=server.sftp_max_concurrent_requests)
+                    elif server.sftp_prefetch:
+                        remote_file.prefetch(size)
+                    for block in iter(lambda: remote_file.read(TRANSFER_BLOCK_SIZE), b''):
+                        fp.write(block)
+            except Exception as e:
+                transfer._record_failure(e, os.path.getsize(local_path))
+                raise
+        return transfer, transfer._end_download(size, self._sftp_remote_checksum(server, sftp, remote_path))
+
+    # Uploads.
+
+    @api.model
+    def _start_upload(self, server, local_path, remote_path):
+        """
+        This method is used to find upload of remote file on a cursor of its own.
+        Returns transfer (of caller's environment) & whether a previous upload of it was interrupted.
+        Author: DG
+        """
+        with self._autonomous() as transfer_obj:
+            transfer = transfer_obj._get_transfer(server, 'upload', remote_path, local_path=local_path)
+            return self.browse(transfer.id), bool(transfer.offset)
+
+    @api.model
+    def upload_ftp(self, server, ftp, local_path, remote_path):
+        """
+        This method is used to upload local file to FTP. When a previous upload of this file was interrupted,
+        it resumes with REST from bytes which server has at the start of this attempt, then upload is verified by size.
+        Author: DG
+        """
+        transfer, interrupted = self._start_upload(server, local_path, remote_path)
+        local_size = os.path.getsize(local_path)
+        offset = 0
+        if interrupted:
+            offset = self._ftp_remote_facts(ftp, remote_path)[0] or 0
+            if offset > local_size:
+                offset = 0
+        sent = offset
+
+        def _count_sent(block):
+            nonlocal sent
+            sent += len(block)
+
+        try:
+            with open(local_path, 'rb') as fp:
+                fp.seek(offset)
+                ftp.storbinary("STOR %s" % remote_path, fp, blocksize=TRANSFER_BLOCK_SIZE, callback=_count_sent,
+                               rest=offset or None)
+        except Exception as e:
+            transfer._record_failure(e, sent)
+            raise
+        remote_size = self._ftp_remote_facts(ftp, remote_path)[0]
+        if remote_size is not None and remote_size != local_size:
+            transfer._record_failure("uploaded size is {} bytes instead of {}".format(remote_size, local_size),
+                                     remote_size)
+            raise ValidationError("Uploaded file [{}] is not complete.".format(remote_path))
+        transfer._finish()
+
+    @api.model
+    def upload_sftp(self, server, sftp, local_path, remote_path):
+        """
+        This method is used to upload local file to SFTP. When a previous upload of this file was interrupted,
+        it resumes with seek from bytes which server has at the start of this attempt, then upload is verified by size.
+        Author: DG
+        """
+        transfer, interrupted = self._start_upload(server, local_path, remote_path)
+        local_size = os.path.getsize(local_path)
+        offset = 0
+        if interrupted:
+            try:
+                offset = sftp.stat(remote_path).st_size
+            except (IOError, OSError):
+                offset = 0
+            if offset > local_size:
+                offset = 0
+        sent = offset
+        try:
+            with open(local_path, 'rb') as fp, sftp.open(remote_path, 'r+b' if offset else 'wb') as remote_file:
+                fp.seek(offset)
+                remote_file.seek(offset)
+                remote_file.set_pipelined(True)
+                for block in iter(lambda: fp.read(TRANSFER_BLOCK_SIZE), b''):
+                    remote_file.write(block)
+                    sent += len(block)
+        except Exception as e:
+            transfer._record_failure(e, sent)
+            raise
+        remote_size = sftp.stat(remote_path).st_size
+        if remote_size != local_size:
+            transfer._record_failure("uploaded size is {} bytes instead of {}".format(remote_size, local_size),
+                                     remote_size)
+            raise ValidationError("Uploaded file [{}] is not complete.".format(remote_path))
+        transfer._finish()
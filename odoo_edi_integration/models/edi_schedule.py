@@ -0,0 +1,399 @@
+import logging
+import re
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from dateutil.relativedelta import relativedelta
+from odoo import api, fields, models
+from .edi_tools import EDIRunBudget
+
+_logger = logging.getLogger(__name__)
+
+# Weight of the last poll in average files per poll.
+ARRIVAL_EWMA_ALPHA = 0.3
+# Directory with at least this average files per poll is busy, its interval is not backed off before
+# IDLE_POLL_STREAK empty polls in a row.
+BUSY_FILES_PER_POLL = 0.5
+IDLE_POLL_STREAK = 3
+
+# Code of per server & per directory crons which were created before the dispatcher.
+LEGACY_CRON_CODE = re.compile(r"model\.(sync_inner_files_directory_wise|sync_inner_files|sync_sftp_inner_files)\((\d+)\)")
+
+
+def _run_schedule_lane(registry, uid, context, schedule_ids, budget):
+    """
+    This method is used to run schedules of one lane one after another in a worker thread.
+    Each schedule is run with its own cursor, as cursors & environments can't be shared between threads.
+    Author: DG
+    """
+    for schedule_id in schedule_ids:
+        if budget.exhausted():
+            break
+        try:
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                env['edi.schedule'].browse(schedule_id)._run_schedule(budget)
+        except Exception as e:
+            _logger.exception("EDI schedule [{}] failed => {}".format(schedule_id, e))
+
+
+class EDISchedule(models.Model):
+    _name = "edi.schedule"
+    _description = "EDI Sync Schedule"
+    _order = "next_run, id"
+
+    name = fields.Char(
+        string="Name",
+        compute="_compute_name",
+        store=True
+    )
+    active = fields.Boolean(
+        default=True
+    )
+    ftp_list_id = fields.Many2one(
+        comodel_name="ftp.list",
+        string="Directory",
+        ondelete="cascade",
+        help="If empty, all directories with download option of the server are synced."
+    )
+    ftp_syncing_id = fields.Many2one(
+        comodel_name="ftp.syncing",
+        string="FTP",
+        ondelete="cascade"
+    )
+    sftp_syncing_id = fields.Many2one(
+        comodel_name="sftp.syncing",
+        string="SFTP",
+        ondelete="cascade"
+    )
+    interval_number = fields.Integer(
+        string="Interval",
+        default=40,
+        required=True
+    )
+    interval_type = fields.Selection(
+        selection=[('minutes', 'Minutes'), ('hours', 'Hours'), ('days', 'Days')],
+        string="Interval Unit",
+        default='minutes',
+        required=True
+    )
+    next_run = fields.Datetime(
+        string="Next Run",
+        default=fields.Datetime.now,
+        required=True,
+        index=True
+    )
+    last_run = fields.Datetime(
+        string="Last Run",
+        readonly=True,
+        copy=False
+    )
+    last_duration = fields.Float(
+        string="Last Duration (Seconds)",
+        readonly=True,
+        copy=False
+    )
+    last_error = fields.Text(
+        string="Last Error",
+        readonly=True,
+        copy=False
+    )
+    concurrency_group = fields.Char(
+        string="Concurrency Group",
+        help="Schedules of the same server with the same group are never run at the same time."
+    )
+    adaptive_interval = fields.Boolean(
+        string="Adaptive Interval",
+        default=False,
+        help="Poll faster while files are arriving and back off while directory stays empty, "
+             "between minimum & maximum interval."
+    )
+    min_interval_minutes = fields.Integer(
+        string="Minimum Interval (Minutes)",
+        default=5
+    )
+    max_interval_minutes = fields.Integer(
+        string="Maximum Interval (Minutes)",
+        default=240
+    )
+    current_interval_minutes = fields.Float(
+        string="Current Interval (Minutes)",
+        readonly=True,
+        copy=False
+    )
+    poll_count = fields.Integer(
+        string="Polls",
+        readonly=True,
+        copy=False
+    )
+    last_file_count = fields.Integer(
+        string="Files in Last Poll",
+        readonly=True,
+        copy=False
+    )
+    avg_files_per_poll = fields.Float(
+        string="Average Files per Poll",
+        readonly=True,
+        copy=False,
+        help="Exponentially weighted average of new files found per poll."
+    )
+    empty_poll_streak = fields.Integer(
+        string="Empty Polls in a Row",
+        readonly=True,
+        copy=False
+    )
+    arrival_hour_histogram = fields.Json(
+        string="Files per Hour (UTC)",
+        readonly=True,
+        copy=False
+    )
+
+    @api.depends('ftp_list_id.name', 'ftp_syncing_id.name', 'sftp_syncing_id.name')
+    def _compute_name(self):
+        """
+        This method is used to prepare name of schedule from server & directory.
+        Author: DG
+        """
+        for record in self:
+            server = record._get_server()
+            if record.ftp_list_id:
+                record.name = "EDI [{0}] Directory: [{1}]".format(server.name, record.ftp_list_id.name)
+            else:
+                record.name = "EDI: [{0}] All Download Directories".format(server.name)
+
+    def _get_server(self):
+        """
+        This method is used to get FTP/SFTP server record of schedule.
+        Author: DG
+        """
+        self.ensure_one()
+        return self.ftp_syncing_id or self.sftp_syncing_id
+
+    def _get_next_run(self, from_date):
+        """
+        This method is used to get next run date of schedule from given date.
+        Author: DG
+        """
+        self.ensure_one()
+        return from_date + relativedelta(**{self.interval_type: max(self.interval_number, 1)})
+
+    def _get_base_interval_minutes(self):
+        """
+        This method is used to get configured interval of schedule in minutes.
+        Author: DG
+        """
+        self.ensure_one()
+        return max(self.interval_number, 1) * {'minutes': 1, 'hours': 60, 'days': 1440}[self.interval_type]
+
+    def _is_active_hour(self, hour):
+        """
+        This method is used to check whether files usually arrive in given UTC hour,
+        i.e. the hour has at least as many files as an average hour with arrivals.
+        Author: DG
+        """
+        self.ensure_one()
+        histogram = self.arrival_hour_histogram or {}
+        counts = [count for count in histogram.values() if count]
+        if not counts:
+            return False
+        return histogram.get(str(hour), 0) >= sum(counts) / len(counts)
+
+    def _record_poll_statistics(self, file_count, poll_date):
+        """
+        This method is used to store arrival statistics of a poll & to adapt polling interval.
+        After a poll with files interval is divided by (1 + average files per poll), at least halved.
+        After an empty poll interval is doubled, except for a busy directory (by average files per poll)
+        until it has some empty polls in a row. Interval is kept between minimum & maximum interval,
+        and not longer than configured interval in hours where files usually arrive.
+        Returns values to write on schedule.
+        Author: DG
+        """
+        self.ensure_one()
+        histogram = dict(self.arrival_hour_histogram or {})
+        if file_count:
+            hour = str(poll_date.hour)
+            histogram[hour] = histogram.get(hour, 0) + file_count
+        vals = {
+            'poll_count': self.poll_count + 1,
+            'last_file_count': file_count,
+            'avg_files_per_poll': (ARRIVAL_EWMA_ALPHA * file_count + (1 - ARRIVAL_EWMA_ALPHA) * self.avg_files_per_poll
+                                   if self.poll_count else float(file_count)),
+            'empty_poll_streak': 0 if file_count else self.empty_poll_streak + 1,
+            'arrival_hour_histogram': histogram,
+        }
+        if not self.adaptive_interval:
+            return vals
+
+        base_interval = self._get_base_interval_minutes()
+        min_interval = max(self.min_interval_minutes, 1)
+        max_interval = max(self.max_interval_minutes, min_interval)
+        interval = self.current_interval_minutes or base_interval
+        avg_files_per_poll = vals['avg_files_per_poll']
+        if file_count:
+            interval = interval / max(2.0, 1 + avg_files_per_poll)
+        elif avg_files_per_poll < BUSY_FILES_PER_POLL or vals['empty_poll_streak'] >= IDLE_POLL_STREAK:
+            interval = interval * 2
+        interval = min(max(interval, min_interval), max_interval)
+        next_run = poll_date + timedelta(minutes=interval)
+        if self._is_active_hour(next_run.hour):
+            interval = max(min(interval, base_interval), min_interval)
+            next_run = poll_date + timedelta(minutes=interval)
+        vals.update({
+            'current_interval_minutes': interval,
+            'next_run': next_run,
+        })
+        return vals
+
+    @api.model
+    def _ensure_schedule(self, directory=False, server=False, interval_number=40, interval_type='minutes',
+                         first_run_minutes=20):
+        """
+        This method is used to find or create schedule of a directory, or of a server when directory isn't given.
+        Author: DG
+        """
+        if directory:
+            server = directory.ftp_syncing_id or directory.sftp_syncing_id
+        ftp_server = server if server and server._name == 'ftp.syncing' else self.env['ftp.syncing']
+        sftp_server = server if server and server._name == 'sftp.syncing' else self.env['sftp.syncing']
+        existing_schedule = self.with_context(active_test=False).search([
+            ('ftp_list_id', '=', directory and directory.id or False),
+            ('ftp_syncing_id', '=', ftp_server.id or False),
+            ('sftp_syncing_id', '=', sftp_server.id or False),
+        ], limit=1)
+        if existing_schedule:
+            return existing_schedule
+        return self.create({
+            'ftp_list_id': directory and directory.id or False,
+            'ftp_syncing_id': ftp_server.id or False,
+            'sftp_syncing_id': sftp_server.id or False,
+            'interval_number': interval_number,
+            'interval_type': interval_type,
+            'next_run': fields.Datetime.now() + timedelta(minutes=first_run_minutes),
+        })
+
+    @api.model
+    def _convert_legacy_crons(self):
+        """
+        This method is used to replace per server & per directory sync crons with schedules of dispatcher.
+        Interval, next call & active state of cron are kept on the schedule.
+        Author: DG
+        """
+        legacy_crons = self.env['ir.cron'].with_context(active_test=False).search([
+            '|', ('ftp_syncing_id', '!=', False), ('sftp_syncing_id', '!=', False)
+        ])
+        for cron in legacy_crons:
+            match = LEGACY_CRON_CODE.search(cron.code or '')
+            if not match or cron.interval_type not in ('minutes', 'hours', 'days'):
+                continue
+            method, record_id = match.group(1), int(match.group(2))
+            if method == 'sync_inner_files_directory_wise':
+                directory = self.env['ftp.list'].browse(record_id).exists()
+                if not directory:
+                    continue
+                schedule = self._ensure_schedule(directory=directory)
+            else:
+                server_model = 'ftp.syncing' if method == 'sync_inner_files' else 'sftp.syncing'
+                server = self.env[server_model].browse(record_id).exists()
+                if not server:
+                    continue
+                schedule = self._ensure_schedule(server=server)
+            schedule.write({
+                'active': cron.active,
+                'interval_number': cron.interval_number,
+                'interval_type': cron.interval_type,
+                'next_run': cron.nextcall,
+            })
+            cron.unlink()
+
+    def _plan_lanes(self):
+        """
+        This method is used to divide schedules into lanes, each lane is run by one worker thread.
+        A server gets at most as many lanes as its allowed sessions & schedules of one concurrency group are kept
+        in the same lane. Groups are given to the lane with least expected duration (from last duration).
+        Author: DG
+        """
+        schedules_by_server = defaultdict(lambda: self.browse())
+        for schedule in self:
+            schedules_by_server[schedule._get_server()] |= schedule
+
+        lanes = []
+        for server, schedules in schedules_by_server.items():
+            units = defaultdict(lambda: self.browse())
+            for schedule in schedules:
+                units[schedule.concurrency_group or schedule.id] |= schedule
+            server_lanes = [[0.0, []] for _ in range(min(max(server.max_sessions, 1), len(units)))]
+            for unit in sorted(units.values(), key=lambda u: -sum(u.mapped('last_duration'))):
+                lane = min(server_lanes, key=lambda l: l[0])
+                lane[0] += sum(unit.mapped('last_duration'))
+                lane[1].extend(unit.ids)
+            lanes.extend(schedule_ids for duration, schedule_ids in server_lanes)
+        return lanes
+
+    def _run_schedule(self, budget):
+        """
+        This method is used to sync files of scheduled directory/server & store duration & arrival statistics of run.
+        If the budget is used up before all files are downloaded, then schedule is due again immediately.
+        Author: DG
+        """
+        self.ensure_one()
+        started_at = time.monotonic()
+        attachment_obj = self.env['ftp.attachment']
+        last_attachment_id = attachment_obj.search([], order='id desc', limit=1).id or 0
+        finished, error = True, False
+        try:
+            if self.ftp_list_id:
+                finished = self.ftp_list_id._sync_inner_files(budget)
+            elif self.ftp_syncing_id:
+                finished = self.ftp_syncing_id.sync_inner_files(budget=budget)
+            else:
+                finished = self.sftp_syncing_id.sync_sftp_inner_files(budget=budget)
+        except Exception as e:
+            self.env.cr.rollback()
+            error = str(e)
+            _logger.warning("EDI schedule [{}] failed => {}".format(self.name, e))
+        # Directories of a server are synced with cursors of their own threads, so new transaction is started
+        # to see their attachments (cursor keeps snapshot of its transaction).
+        self.env.cr.commit()
+        directories = self.ftp_list_id or self._get_server().ftp_directory_ids.filtered(lambda x: x.download_this)
+        file_count = attachment_obj.search_count([
+            ('id', '>', last_attachment_id),
+            ('ftp_list_id', 'in', directories.ids),
+        ])
+        vals = {
+            'last_run': fields.Datetime.now(),
+            'last_duration': time.monotonic() - started_at,
+            'last_error': error,
+        }
+        if not error:
+            vals.update(self._record_poll_statistics(file_count, vals['last_run']))
+        if finished is False:
+            vals['next_run'] = fields.Datetime.now()
+        self.write(vals)
+        self.env.cr.commit()
+        return finished
+
+    @api.model
+    def run_due_schedules(self, max_workers=4, time_budget=None):
+        """
+        This method is used by the dispatcher cron to run all due schedules across a bounded pool of threads,
+        while keeping allowed sessions of each server.
+        Next run of schedules is planned & committed before running, so a crashed run doesn't repeat immediately.
+        Author: DG
+        """
+        budget = EDIRunBudget(time_budget=time_budget)
+        now = fields.Datetime.now()
+        due_schedules = self.search([('next_run', '<=', now)])
+        if not due_schedules:
+            return
+        for schedule in due_schedules:
+            schedule.next_run = schedule._get_next_run(now)
+        self.env.cr.commit()
+
+        lanes = due_schedules._plan_lanes()
+        with ThreadPoolExecutor(max_workers=max(min(max_workers, len(lanes)), 1)) as executor:
+            for lane in lanes:
+                executor.submit(_run_schedule_lane, self.pool, self.env.uid, dict(self.env.context), lane, budget)
+
+        if budget.exhausted() or self.search_count([('next_run', '<=', fields.Datetime.now())]):
+            budget.reschedule(self.env, cron_xml_id='odoo_edi_integration.edi_schedule_dispatcher_cronjob')
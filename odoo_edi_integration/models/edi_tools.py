@@ -0,0 +1,328 @@
+import ftplib
+import logging
+import os
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import paramiko
+import psycopg2
+from lxml import etree
+from odoo import api
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+# Part of worker's real time limit which a scheduled action run may use before it yields.
+TIME_BUDGET_RATIO = 0.8
+
+# Errors after which the same transfer can succeed later (network, timeout, FTP 4xx replies).
+TRANSIENT_ERRORS = (OSError, EOFError, ftplib.error_temp, paramiko.SSHException)
+# Errors which will happen again on retry (FTP 5xx replies, authentication, missing/forbidden paths).
+PERMANENT_ERRORS = (ftplib.error_perm, paramiko.AuthenticationException, paramiko.BadHostKeyException,
+                    FileNotFoundError, PermissionError, IsADirectoryError, NotADirectoryError)
+# Upper limit of delay between two retries, in seconds.
+MAX_RETRY_DELAY = 24 * 60 * 60
+
+# First key of PostgreSQL advisory locks, so EDI locks never collide with locks of other modules.
+DIRECTORY_LOCK_NAMESPACE = 0x45444931
+SERVER_LOCK_NAMESPACE = {'ftp.syncing': 0x45444932, 'sftp.syncing': 0x45444933}
+
+# System parameter with base directory of job scratch directories (e.g. /dev/shm to keep them on tmpfs).
+SCRATCH_DIR_PARAMETER = 'odoo_edi_integration.scratch_dir'
+
+# Characters of XML content fed to the parser at a time while looking for the root tag.
+SNIFF_CHUNK_SIZE = 8 * 1024
+
+# First key of advisory locks of server session slots, second key is server id * MAX_SESSION_SLOTS + slot number.
+SESSION_LOCK_NAMESPACE = {'ftp.syncing': 0x45444934, 'sftp.syncing': 0x45444935}
+MAX_SESSION_SLOTS = 1000
+# Seconds to wait for a free session slot & interval between two tries.
+SESSION_WAIT_TIMEOUT = 5 * 60
+SESSION_TEST_TIMEOUT = 30
+SESSION_WAIT_INTERVAL = 1
+
+
+def is_transient_error(error):
+    """
+    This method is used to classify error as transient or permanent.
+    Error is checked with its causes (raise ... from ...), because connection errors are wrapped into UserError.
+    Author: DG
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, PERMANENT_ERRORS):
+            return False
+        if isinstance(error, TRANSIENT_ERRORS):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+
+def normalize_key_value(value, field_type=False):
+    """
+    This method is used to normalize value of a search key, so a value read from an incoming file & the value
+    of an exported record give the same key (e.g. ' 5 ', '5.0' & 5.0 of a float field are all '5').
+    Author: DG
+    """
+    if value is None or value is False:
+        return ''
+    if isinstance(value, str):
+        value = value.strip()
+        if field_type not in ('integer', 'float', 'monetary'):
+            return value
+        try:
+            value = float(value)
+        except ValueError:
+            return value
+    if isinstance(value, bool):
+        return str(value)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+
+def retry_delay(attempt, base_delay):
+    """
+    This method is used to get delay in seconds before next attempt, exponential on attempt with jitter,
+    so transactions failed together are not retried at the same moment.
+    Author: DG
+    """
+    delay = min(base_delay * 2 ** max(attempt - 1, 0), MAX_RETRY_DELAY)
+    return random.uniform(delay / 2, delay)
+
+
+def _try_session_slots(cr, server, count, held):
+    """
+    This method is used to try free session slots of the server with advisory locks on cr, until count slots are held.
+    Advisory locks are re-entrant for the same database session, so slots already held by cr (e.g. by an outer
+    session of the same job) are skipped, otherwise they would be counted twice.
+    Author: DG
+    """
+    namespace = SESSION_LOCK_NAMESPACE[server._name]
+    cr.execute("""
+        SELECT objid FROM pg_locks
+         WHERE locktype = 'advisory' AND pid = pg_backend_pid() AND classid = %s AND objsubid = 2 AND granted
+    """, (namespace,))
+    own_keys = {row[0] for row in cr.fetchall()}
+    size = min(max(server.max_sessions, 1), MAX_SESSION_SLOTS)
+    for slot in range(size):
+        if len(held) >= count:
+            return
+        key = server.id * MAX_SESSION_SLOTS + slot
+        if key in own_keys:
+            continue
+        cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (namespace, key))
+        if cr.fetchone()[0]:
+            held.append(key)
+
+
+@contextmanager
+def server_sessions(server, count, blocking=True, timeout=SESSION_WAIT_TIMEOUT):
+    """
+    This method is used to hold up to count session slots of the server, it yields number of slots acquired.
+    Slots are session level PostgreSQL advisory locks on the caller's cursor, like advisory_lock, so 'Max Sessions'
+    is shared by all workers, cron processes & threads, locks are kept over commits & rollbacks of the caller,
+    and slots of a died worker are freed with its connection.
+    Only the first slot is waited for (when blocking), others are taken only if free, so two callers
+    can never wait for each other's slots. TimeoutError is raised if no slot is free within timeout.
+    Author: DG
+    """
+    held = []
+    if count <= 0:
+        yield 0
+        return
+    cr = server.env.cr
+    namespace = SESSION_LOCK_NAMESPACE[server._name]
+    try:
+        deadline = time.monotonic() + timeout
+        _try_session_slots(cr, server, count, held)
+        while blocking and not held:
+            if time.monotonic() >= deadline:
+                raise TimeoutError("All session slots of server [{}] are busy for {} seconds.".format(
+                    server.display_name, timeout))
+            time.sleep(SESSION_WAIT_INTERVAL)
+            _try_session_slots(cr, server, 1, held)
+        yield len(held)
+    finally:
+        if held:
+            try:
+                for key in held:
+                    cr.execute("SELECT pg_advisory_unlock(%s, %s)", (namespace, key))
+            except psycopg2.Error:
+                # Transaction is aborted by the error which ended the block.
+                cr.rollback()
+                for key in held:
+                    cr.execute("SELECT pg_advisory_unlock(%s, %s)", (namespace, key))
+
+
+@contextmanager
+def server_session(server, timeout=SESSION_WAIT_TIMEOUT):
+    """
+    This method is used to hold one of the server's session slots while a connection to it is open,
+    so all workers together never open more connections to a server than its 'Max Sessions'.
+    Author: DG
+    """
+    with server_sessions(server, 1, timeout=timeout):
+        yield
+
+
+@contextmanager
+def advisory_lock(cr, namespace, key):
+    """
+    This method is used to try a session level PostgreSQL advisory lock, it yields whether lock is acquired.
+    Lock doesn't wait, so an overlapping run can skip its work. Session level lock is kept over commits
+    & it's released at the end, or by PostgreSQL if the worker dies.
+    Author: DG
+    """
+    cr.execute("SELECT pg_try_advisory_lock(%s, %s)", (namespace, key))
+    acquired = cr.fetchone()[0]
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            try:
+                cr.execute("SELECT pg_advisory_unlock(%s, %s)", (namespace, key))
+            except psycopg2.Error:
+                # Transaction is aborted by the error which ended the block.
+                cr.rollback()
+                cr.execute("SELECT pg_advisory_unlock(%s, %s)", (namespace, key))
+
+
+@contextmanager
+def scratch_directory(env, prefix='edi_'):
+    """
+    This method is used to give a job its own empty scratch directory, which is removed with all its files
+    at the end, even when the job fails. Base directory is taken from system parameter, system temp by default.
+    Author: DG
+    """
+    base_directory = env['ir.config_parameter'].sudo().get_param(SCRATCH_DIR_PARAMETER) or None
+    if base_directory:
+        os.makedirs(base_directory, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=prefix, dir=base_directory)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def sniff_xml_root_tag(content):
+    """
+    This method is used to get name of root element of XML content, as xmltodict names it (prefix:name).
+    Content is fed to an incremental parser in small chunks & parsing stops at the first start tag,
+    so cost doesn't depend on file size. Empty string is returned if no root element is found.
+    Author: DG
+    """
+    if not content:
+        return ''
+    parser = etree.XMLPullParser(events=('start',), resolve_entities=False, no_network=True)
+    try:
+        for position in range(0, len(content), SNIFF_CHUNK_SIZE):
+            chunk = content[position:position + SNIFF_CHUNK_SIZE]
+            parser.feed(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+            for _event, element in parser.read_events():
+                name = etree.QName(element).localname
+                return f"{element.prefix}:{name}" if element.prefix else name
+    except etree.XMLSyntaxError as e:
+        _logger.info("Root tag of XML content not found => %s", e)
+    return ''
+
+
+def close_connection(connection):
+    """
+    This method is used to close FTP/SFTP connection, errors are ignored as the session is not used anymore.
+    Author: DG
+    """
+    try:
+        if isinstance(connection, ftplib.FTP):
+            connection.quit()
+        elif isinstance(connection, paramiko.SFTPClient):
+            transport = connection.get_channel().get_transport()
+            connection.close()
+            transport.close()
+    except Exception as e:
+        _logger.debug("Error while closing connection => %s", e)
+
+
+def sync_directories_in_parallel(server, directories, budget, method_name):
+    """
+    This method is used to sync directories of a server concurrently, each directory is synced by its own thread
+    with its own cursor & connection, at most 'Max Sessions' directories at the same time.
+    Each thread opens its connection inside a shared session slot, so syncs of other workers are counted too.
+    method_name is the server method which syncs one directory, it returns False if the budget is used up.
+    Author: DG
+    """
+    registry, uid, context = server.pool, server.env.uid, dict(server.env.context)
+    server_model, server_id = server._name, server.id
+
+    def _sync_directory(directory_id):
+        with registry.cursor() as cr:
+            env = api.Environment(cr, uid, context)
+            thread_server = env[server_model].browse(server_id)
+            return getattr(thread_server, method_name)(env['ftp.list'].browse(directory_id), budget=budget)
+
+    with ThreadPoolExecutor(max_workers=min(max(server.max_sessions, 1), len(directories))) as executor:
+        results = list(executor.map(_sync_directory, directories.ids))
+    return all(result is not False for result in results)
+
+
+class EDIRunBudget:
+    """
+    Time & item budget of one scheduled action run.
+    Work is checked against it between units of work, so the run can commit & reschedule itself
+    before it gets killed by worker's limit_time_real.
+    Author: DG
+    """
+
+    def __init__(self, time_budget=None, item_budget=None):
+        if time_budget is None:
+            limit_time_real = config.get('limit_time_real_cron') or 0
+            if limit_time_real < 0:
+                limit_time_real = config.get('limit_time_real') or 0
+            time_budget = limit_time_real * TIME_BUDGET_RATIO if limit_time_real > 0 else 0
+        self.time_budget = time_budget or 0
+        self.item_budget = item_budget or 0
+        self.started_at = time.monotonic()
+        self.done = 0
+
+    def consume(self, count=1):
+        """
+        This method is used to count done units of work.
+        Author: DG
+        """
+        self.done += count
+
+    def remaining_items(self, default):
+        """
+        This method is used to get how many units of work can still be taken, at most default.
+        Author: DG
+        """
+        if not self.item_budget:
+            return default
+        return max(min(default, self.item_budget - self.done), 0)
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    def exhausted(self):
+        """
+        This method is used to check whether the time or item budget is used up.
+        Author: DG
+        """
+        if self.item_budget and self.done >= self.item_budget:
+            return True
+        return bool(self.time_budget and self.elapsed >= self.time_budget)
+
+    def reschedule(self, env, cron_xml_id):
+        """
+        This method is used to commit done work & trigger the scheduled action again immediately,
+        so the remaining work is continued in a next run.
+        Author: DG
+        """
+        _logger.info("EDI run budget exhausted after %s units in %.1fs, rescheduling.", self.done, self.elapsed)
+        env['ir.cron'].sudo().trigger_edi_cron(cron_xml_id)
+        env.cr.commit()
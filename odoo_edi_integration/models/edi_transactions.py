@@ -1,10 +1,18 @@
 from odoo import fields, models, api
 from odoo.exceptions import ValidationError
 from odoo.tools.convert import safe_eval
-from dateutil import parser
-import xmltodict
+from .logs_details import EDILogBuffer
+from .edi_tools import EDIRunBudget, is_transient_error, retry_delay, scratch_directory, server_session, \
+    close_connection
+from .edi_xml import get_xml_value
+from .edi_dates import parse_date_value, to_utc_naive
+from collections import defaultdict
+from datetime import timedelta
+import psycopg2
 import logging
 import os
+import socket
+import threading
 
 _logger = logging.getLogger(__name__)
 
@@ -37,8 +45,8 @@ class EDITransactions(models.Model):
         tracking=True,
     )
     state = fields.Selection(
-        selection=[("Draft", "Draft"), ("Failed", "Failed"), ("Partially_Done", "Partially Done"),
-                   ("Done", "Done"), ("Cancel", "Cancel")],
+        selection=[("Draft", "Draft"), ("Processing", "Processing"), ("Failed", "Failed"),
+                   ("Partially_Done", "Partially Done"), ("Done", "Done"), ("Cancel", "Cancel")],
         default="Draft",
         tracking=True
     )
@@ -62,6 +70,55 @@ class EDITransactions(models.Model):
         comodel_name="res.partner",
         string="EDI Partner"
     )
+    import_checkpoint = fields.Integer(
+        string="Import Checkpoint",
+        copy=False,
+        readonly=True,
+        help="Number of records of the file which are already imported & committed. "
+             "When the transaction is processed again, import resumes from this record."
+    )
+    import_done_count = fields.Integer(
+        copy=False,
+        readonly=True
+    )
+    import_failed_count = fields.Integer(
+        copy=False,
+        readonly=True
+    )
+    processing_owner = fields.Char(
+        string="Processing Worker",
+        copy=False,
+        readonly=True,
+        help="Worker (host:pid:thread) which claimed this transaction for processing."
+    )
+    processing_date = fields.Datetime(
+        string="Processing Since",
+        copy=False,
+        readonly=True
+    )
+    attempt_count = fields.Integer(
+        string="Attempts",
+        copy=False,
+        readonly=True
+    )
+    next_attempt_date = fields.Datetime(
+        string="Next Attempt",
+        copy=False,
+        readonly=True,
+        index=True,
+        help="Transaction failed with transient error is not processed again before this time."
+    )
+    last_error = fields.Text(
+        string="Last Error",
+        copy=False,
+        readonly=True
+    )
+    priority = fields.Integer(
+        string="Priority",
+        default=0,
+        help="Transactions with higher priority are processed first, "
+             "by default it is the higher one of mapping table & partner priority."
+    )
 
     @api.model
     def _reference_models(self):
@@ -73,15 +130,86 @@ class EDITransactions(models.Model):
         models = edi_tables.mapped("model_id")
         return [(model.model, model.name) for model in models]
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        This method is used to set priority of new transaction from mapping table & partner, unless it's given.
+        Author: DG
+        """
+        for vals in vals_list:
+            if 'priority' not in vals:
+                vals['priority'] = max(
+                    self.env['edi.config.table'].browse(vals.get('edi_config_table_id')).transaction_priority,
+                    self.env['res.partner'].browse(vals.get('edi_partner_id')).edi_priority)
+        return super(EDITransactions, self).create(vals_list)
+
+    def _get_default_priority(self):
+        """
+        This method is used to get default priority of transaction, higher one of mapping table & partner priority.
+        Author: DG
+        """
+        self.ensure_one()
+        return max(self.edi_config_table_id.transaction_priority, self.edi_partner_id.edi_priority)
+
+    @api.model
+    def _get_transactions_with_default_priority(self, domain):
+        """
+        This method is used to find 'Draft' transactions of domain whose priority is not set by hand,
+        so those can follow a change of mapping table or partner priority.
+        Author: DG
+        """
+        return self.search(domain + [('state', '=', 'Draft')]).filtered(
+            lambda transaction: transaction.priority == transaction._get_default_priority())
+
+    def _update_default_priority(self):
+        """
+        This method is used to set default priority on transactions again, with one write per priority.
+        Author: DG
+        """
+        transactions_by_priority = defaultdict(lambda: self.browse())
+        for record in self:
+            transactions_by_priority[record._get_default_priority()] |= record
+        for priority, transactions in transactions_by_priority.items():
+            transactions.write({'priority': priority})
+
     def reset(self):
         """
-        This method is used to reset state to 'Draft'.
+        This method is used to reset state to 'Draft', import checkpoint is cleared so file is processed from first item.
         Author: DG
         """
         for record in self:
             if record.reference and record.edi_type == "Incoming":
                 raise ValidationError("This EDI transaction already processed, you can't reset it.")
-        self.write({"state": "Draft"})
+        self.write({"state": "Draft", "processing_owner": False, "processing_date": False,
+                    "attempt_count": 0, "next_attempt_date": False, "last_error": False,
+                    "import_checkpoint": 0, "import_done_count": 0, "import_failed_count": 0})
+
+    def _schedule_retry_or_fail(self, error, main_log_id):
+        """
+        This method is used to schedule next attempt of transaction after transient error with exponential backoff.
+        Transaction is set as 'Failed' for permanent error or when all attempts are used.
+        Author: DG
+        """
+        config_table = self.edi_config_table_id
+        attempt_count = self.attempt_count + 1
+        vals = {
+            'attempt_count': attempt_count,
+            'last_error': str(error),
+            'log_id': main_log_id.id,
+        }
+        if is_transient_error(error) and attempt_count < config_table.retry_max_attempts:
+            next_attempt_date = fields.Datetime.now() + timedelta(
+                seconds=retry_delay(attempt_count, config_table.retry_base_delay * 60))
+            vals.update({'state': 'Draft', 'next_attempt_date': next_attempt_date})
+            log_msg = "Attempt {} of {} failed, it will be retried after {} => {}".format(
+                attempt_count, config_table.retry_max_attempts, next_attempt_date, error)
+        else:
+            vals.update({'state': 'Failed', 'next_attempt_date': False})
+            log_msg = "Something went wrong => {}".format(error)
+        _logger.warning("EDI transaction [{}] => {}".format(self.name, log_msg))
+        self.env['log.book.lines'].create_log(log_msg, main_log_id, fault_operation=True)
+        self.write(vals)
+        self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
 
     def process(self):
         """
@@ -98,12 +226,15 @@ class EDITransactions(models.Model):
             if not self.xml_content:
                 raise ValidationError("XML Data is Required to create a Record.")
             try:
-                python_dict = xmltodict.parse(self.xml_content)
+                document = self.edi_config_table_id._parse_import_content(self.xml_content)
             except Exception as e:
                 raise ValidationError("Something wrong in XML content: \n {}".format(e))
+            python_dict = document
             for header in (self.edi_config_table_id.xml_header or "").split("/"):
                 if header in python_dict:
                     python_dict = python_dict[header]
+            if not self._validate_import_content(document, python_dict):
+                return
             self._create_record_from_attachment(python_dict, self.edi_config_table_id)
 
         # Process for outgoing type transactions.
@@ -152,39 +283,45 @@ class EDITransactions(models.Model):
                 })
                 self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
                 return
+            # Connection is opened inside one of the server's session slots, shared with syncs of all workers.
             try:
-                server = server_record.check_sftp_connection() if self.edi_config_table_id.server_type == 'sftp' else server_record.check_ftp_connection()
-            except ConnectionResetError as error:
-                _logger.warning("Error due to ConnectionResetError")
-                self.env['log.book.lines'].create_log("Error due to ConnectionResetError => {}".format(error),
-                                                      main_log_id, fault_operation=True)
-                self.write({
-                    'state': 'Failed',
-                    'log_id': main_log_id.id
-                })
-                self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
+                with server_session(server_record):
+                    server = server_record.check_sftp_connection() if self.edi_config_table_id.server_type == 'sftp' else server_record.check_ftp_connection()
+                    try:
+                        self._upload_export_file(server_record, server, main_log_id)
+                    finally:
+                        close_connection(server)
+            except Exception as error:
+                self._schedule_retry_or_fail(error, main_log_id)
                 return
+            if main_log_id and not main_log_id.log_detail_ids:
+                main_log_id.unlink()
 
-            # From XML content create xml file in tmp folder, from tmp export to specific server.
-            file = self.name
-            with open("/tmp/" + self.name, "w+") as fp:
+    def _upload_export_file(self, server_record, server, main_log_id):
+        """
+        This method is used to upload XML content of outgoing transaction to export directory on open connection.
+        Author: DG
+        """
+        # From XML content create xml file in job's scratch directory, from there export to specific server.
+        file = self.name
+        with scratch_directory(self.env, 'edi_export_') as scratch_dir:
+            file_path = os.path.join(scratch_dir, file)
+            with open(file_path, "w+") as fp:
                 if self.xml_content:
                     fp.write(self.xml_content)
-                fp.close()
             source = self.edi_config_table_id.export_ftp_folder.name.strip("/")
             try:
                 if server:
+                    # Upload interrupted in a previous attempt is resumed from bytes already on server.
+                    partial_transfer = self.env["edi.partial.transfer"]
                     if self.edi_config_table_id.server_type == 'ftp':
                         server.cwd(source)
-                        server.storlines("STOR " + file, open(os.path.join("/tmp/", file), "rb"))
-                        _logger.info("Uploaded: {} from {} ".format(file, "/tmp/"))
+                        partial_transfer.upload_ftp(server_record, server, file_path, file)
+                        _logger.info("Uploaded: {} from {} ".format(file, scratch_dir))
                     else:
                         server.chdir(self.edi_config_table_id.export_ftp_folder.name)
-                        file_path = os.path.join("/tmp/", file)
-                        with open(file_path, "rb") as file_obj:
-                            server.putfo(file_obj, file)
-                    os.remove("/tmp/" + file)
-                    self.state = "Done"
+                        partial_transfer.upload_sftp(server_record, server, file_path, file)
+                    self.write({"state": "Done", "next_attempt_date": False})
 
                     # In processed record/records is_processed set as true.
                     if self.reference_data:
@@ -207,15 +344,25 @@ class EDITransactions(models.Model):
                     })
                     self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
             except Exception as e:
-                self.env['log.book.lines'].create_log("Something went wrong => {}".format(e),
-                                                      main_log_id, fault_operation=True)
-                self.write({
-                    'state': 'Failed',
-                    'log_id': main_log_id.id
-                })
-                self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
-            if main_log_id and not main_log_id.log_detail_ids:
-                main_log_id.unlink()
+                self._schedule_retry_or_fail(e, main_log_id)
+
+    def _validate_import_content(self, document, python_dict):
+        """
+        This method is used to validate incoming file before any record is imported, on the parsed file.
+        If it's invalid, then all problems are logged as one report & transaction is set as 'Failed'.
+        Author: DG
+        """
+        errors = self.edi_config_table_id._get_import_validation_errors(document, python_dict)
+        if not errors:
+            return True
+        main_log_id = self.log_id or self.env['log.book'].create_main_log(self.name)
+        log_buffer = EDILogBuffer(main_log_id)
+        log_buffer.add("File is rejected by validation of mapping table [{}], {} problem(s) found, "
+                       "no record is imported.".format(self.edi_config_table_id.name, len(errors)))
+        for message, row in errors:
+            log_buffer.add(message, row)
+        self._post_log_buffer(log_buffer, failed_state=True)
+        return False
 
     def _prepare_vals_from_attachment(self, odoo_line, line, mapped_field):
         """
@@ -278,32 +425,27 @@ class EDITransactions(models.Model):
         # Vals prepared for date/datetime type fields
         elif mapped_field.ttype in ['date', 'datetime']:
             if isinstance(line, str):
-                parsed_date = parser.parse(line, yearfirst=True, dayfirst=False)
+                parsed_date = parse_date_value(line, odoo_line.date_format or False)
                 # Format the date object to yyyy-mm-dd
                 if mapped_field.ttype == 'date':
                     line = parsed_date.strftime('%Y-%m-%d')
-                # Format the datetime object to yyyy-mm-dd h-m-s
+                # Format the datetime object to yyyy-mm-dd h-m-s, Odoo stores datetimes in UTC
                 elif mapped_field.ttype == 'datetime':
-                    line = parsed_date.strftime('%Y-%m-%d %H:%M:%S')
+                    line = to_utc_naive(parsed_date).strftime('%Y-%m-%d %H:%M:%S')
             vals_dict = {mapped_field.name: line}
             return vals_dict, create_record, log_msg
 
         # Vals prepared for selection type fields
         elif mapped_field.ttype == 'selection':
-            if line in mapped_field.selection_ids.mapped('value'):
-                vals_dict = {mapped_field.name: line}
+            to_value = odoo_line._get_selection_maps()[0]
+            if isinstance(line, str) and line in to_value:
+                vals_dict = {mapped_field.name: to_value[line]}
                 return vals_dict, create_record, log_msg
             else:
-                if line in mapped_field.selection_ids.mapped('name'):
-                    selection_value = mapped_field.selection_ids.filtered(
-                        lambda a: a.name == line).value
-                    vals_dict = {mapped_field.name: selection_value}
-                    return vals_dict, create_record, log_msg
-                else:
-                    create_record = False
-                    log_msg = "Your [{}] field's value [{}] is not matched with Odoo records, so this particular row/record is skipped.".format(
-                        odoo_line.xml_element, line)
-                    return vals_dict, create_record, log_msg
+                create_record = False
+                log_msg = "Your [{}] field's value [{}] is not matched with Odoo records, so this particular row/record is skipped.".format(
+                    odoo_line.xml_element, line)
+                return vals_dict, create_record, log_msg
 
         # Vals prepared for other type fields
         else:
@@ -337,59 +479,25 @@ class EDITransactions(models.Model):
                     raise ValidationError("Please configure Mapping XML Elements with Fields in the EDI config table.")
             next_process_after_create = []
             create_record = True
+            log_buffer = EDILogBuffer(main_log_id)
 
             # Handled logic to search existing record from multiple values & prepare domain based in those values.
             existing_main_record = self.env[mapping_edi_table.model_id.model]
-            if mapping_edi_table.search_record_from_this_value:
-                search_values = mapping_edi_table.search_record_from_this_value.split(',')
-                search_domain = []
-
-                for value in search_values:
-                    field_line = mapping_edi_table.line_ids.filtered(lambda line: line.xml_element == value.strip())
-                    if field_line:
-                        # Split search values if nested, so we can go through upto final element and get proper value from dict.
-                        # example: brand/default_code
-                        xml_path = value.strip().split("/")
-                        nested_value = python_dict
-                        for key in xml_path:
-                            nested_value = nested_value.get(key, None)  # Get next level; if key missing, return None
-                            if nested_value is None:
-                                break
-                        search_value = nested_value
-                        if search_value:
-                            search_domain.append((field_line[0].odoo_field.name, '=', search_value))
-                if search_domain:
-                    existing_main_record = self.env[mapping_edi_table.model_id.model].search(search_domain, limit=1)
+            search_key = self._prepare_search_key_from_item(python_dict, mapping_edi_table,
+                                                            self.env['stock.location'])
+            if search_key:
+                existing_main_record = self._find_existing_records_by_search_keys(
+                    existing_main_record, [search_key], mapping_edi_table).get(search_key, existing_main_record)
 
             for odoo_line in mapping_edi_table.line_ids:
-                element_exist_or_not_python_dict = python_dict
-                for header in (odoo_line.xml_element or "").split("/"):
-                    if header in element_exist_or_not_python_dict:
-                        element_exist_or_not_python_dict = element_exist_or_not_python_dict[header]
-                    else:
-                        log_msg = "%s element not found" % (odoo_line.xml_element)
-                        self.env['log.book.lines'].create_log(log_msg, main_log_id, fault_operation=True)
-                        self.write({
-                            'state': 'Failed',
-                            'log_id': main_log_id.id
-                        })
-                        self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
-                        continue
-                line = python_dict
-                for header in (odoo_line.xml_element or "").split("/"):
-                    if header in line:
-                        line = line[header]
-                    else:
-                        line = None
+                line = get_xml_value(python_dict, odoo_line.xml_element)
+                if line is None:
+                    log_msg = "%s element not found" % (odoo_line.xml_element)
+                    log_buffer.add(log_msg)
 
                 # If translation is required, then from translation table find corresponding Odoo value.
                 if line and mapping_edi_table.is_translation_required:
-                    translation_record = self.env['translation.table'].sudo().search(
-                        [('edi_config_table_id', '=', mapping_edi_table.id),
-                         ('xml_element', '=', odoo_line.xml_element),
-                         ('xml_value', '=', line)], limit=1)
-                    if translation_record and translation_record.corresponding_odoo_value:
-                        line = translation_record.corresponding_odoo_value
+                    line = mapping_edi_table._translate_value(odoo_line.xml_element, line)
                 else:
                     continue
 
@@ -403,12 +511,7 @@ class EDITransactions(models.Model):
                                 vals.update(vals_dict)
                         else:
                             # Value not matched with Odoo records then skip that row, not import that record.
-                            self.env['log.book.lines'].create_log(log_msg, main_log_id, fault_operation=True)
-                            self.write({
-                                'state': 'Failed',
-                                'log_id': main_log_id.id
-                            })
-                            self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
+                            log_buffer.add(log_msg)
                             break
                     else:
                         sub_table_for_o2m = odoo_line.sub_edi_config_table_id
@@ -417,21 +520,11 @@ class EDITransactions(models.Model):
                         for value in line:
                             vals_for_o2m = {}
                             for o2m_field_line in sub_table_for_o2m.line_ids:
-                                o2m_line = value
-                                for header in (o2m_field_line.xml_element or "").split("/"):
-                                    if header in o2m_line:
-                                        o2m_line = o2m_line[header]
-                                    else:
-                                        o2m_line = None
+                                o2m_line = get_xml_value(value, o2m_field_line.xml_element)
 
                                 # If translation is required, then from translation table find corresponding Odoo value.
                                 if o2m_line and sub_table_for_o2m.is_translation_required:
-                                    translation_record = self.env['translation.table'].sudo().search(
-                                        [('edi_config_table_id', '=', sub_table_for_o2m.id),
-                                         ('xml_element', '=', o2m_field_line.xml_element),
-                                         ('xml_value', '=', o2m_line)], limit=1)
-                                    if translation_record and translation_record.corresponding_odoo_value:
-                                        o2m_line = translation_record.corresponding_odoo_value
+                                    o2m_line = sub_table_for_o2m._translate_value(o2m_field_line.xml_element, o2m_line)
                                 else:
                                     continue
                                 o2m_field = o2m_field_line.odoo_field
@@ -442,12 +535,7 @@ class EDITransactions(models.Model):
                                     if vals_dict:
                                         vals_for_o2m.update(vals_dict)
                                 else:
-                                    self.env['log.book.lines'].create_log(log_msg, main_log_id, fault_operation=True)
-                                    self.write({
-                                        'state': 'Failed',
-                                        'log_id': main_log_id.id
-                                    })
-                                    self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
+                                    log_buffer.add(log_msg)
                                     break
                             if not create_record:
                                 break
@@ -455,12 +543,7 @@ class EDITransactions(models.Model):
                                 next_process_after_create.append((odoo_line, vals_for_o2m, sub_table_for_o2m))
                 except Exception as e:
                     error_message = "Something went wrong! {}".format(e)
-                    self.env['log.book.lines'].create_log(error_message, main_log_id, fault_operation=True)
-                    self.write({
-                        'state': 'Failed',
-                        'log_id': main_log_id.id
-                    })
-                    self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
+                    log_buffer.add(error_message)
                 if not create_record:
                     break
             if create_record:
@@ -472,266 +555,610 @@ class EDITransactions(models.Model):
                 else:
                     existing_main_record.write(vals)
                     created_record = existing_main_record
+                self.env['edi.xref'].sudo().register_records(mapping_edi_table, self.edi_partner_id,
+                                                             [(search_key, created_record)])
 
                 # Process for o2m values, which we processed after the creation of the main record.
-                for o2m_main_line, o2m_field_value, sub_table in next_process_after_create:
-                    o2m_vals = {}
-                    if sub_table.default_value:
-                        o2m_vals = safe_eval(sub_table.default_value)
-                    o2m_vals.update(o2m_field_value)
-                    o2m_vals.update({o2m_main_line.odoo_field.relation_field: created_record.id})
-                    search_domain = [(key, '=', value) for key, value in o2m_vals.items()]
-                    if sub_table.search_record_from_this_value:
-                        search_values = sub_table.search_record_from_this_value.split(',')
-                        for value in search_values:
-                            field_line = sub_table.line_ids.filtered(lambda line: line.xml_element == value.strip())
-                            if field_line:
-                                # Split search values if nested, so we can go through upto final element and get proper value from dict.
-                                # example: brand/default_code
-                                xml_path = value.strip().split("/")
-                                nested_value = python_dict
-                                for key in xml_path:
-                                    nested_value = nested_value.get(key, None)  # Get next level; if key missing, return None
-                                    if nested_value is None:
-                                        break
-                                search_value = nested_value
-                                if search_value:
-                                    search_domain.append((field_line[0].odoo_field.name, '=', search_value))
-                        existing_child_record = self.env[sub_table.model_id.model].search(search_domain)
-                        if existing_child_record:
-                            existing_child_record.write(o2m_vals)
-                        else:
-                            self.env[sub_table.model_id.model].create(o2m_vals)
-                    else:
-                        self.env[sub_table.model_id.model].create(o2m_vals)
+                self._create_o2m_records_after_create([(created_record, next_process_after_create, python_dict)],
+                                                      first_match_only=False)
                 self.state = 'Done'
                 self.reference = "%s,%s" % (created_record._name, created_record.id)
+            self._post_log_buffer(log_buffer, failed_state=not create_record)
             self._cr.commit()
             if main_log_id and not main_log_id.log_detail_ids:
                 main_log_id.unlink()
 
-    def _create_multiple_record_from_single_attachment(self, python_dict, mapping_edi_table, main_table_xml_element,
-                                                 main_log_id):
+    def _post_log_buffer(self, log_buffer, failed_state=False):
         """
-        This method is used to create multiple records from a single attachment.
-        Also inside it regarding stock.quant some customizations implemented.
+        This method is used to write collected log lines of the run & post only one message on transaction.
+        Author: DG
+        """
+        log_buffer.flush()
+        if not log_buffer.logged:
+            return
+        vals = {'log_id': log_buffer.main_log.id}
+        if failed_state:
+            vals['state'] = 'Failed'
+        self.write(vals)
+        self.message_post(body=f"Please check log [{log_buffer.main_log.name}] for more details.")
+
+    def _prepare_vals_from_item(self, item, mapping_edi_table, log_buffer, log_reasons, row):
+        """
+        This method is used to prepare vals of main record & o2m values for a single item of a multiple records file.
         Author: DG
         """
         create_record = True
+        next_process_after_create = []
+        vals = {}
+        if mapping_edi_table.default_value:
+            vals = safe_eval(mapping_edi_table.default_value)
 
-        inventory_location = self.env['stock.location']
-        if mapping_edi_table.model_id.model == 'stock.quant' and mapping_edi_table.location_id:
-            inventory_location = mapping_edi_table.location_id
-        for header in (main_table_xml_element or "").split("/"):
-            if header in python_dict:
-                python_dict = python_dict[header]
+        for odoo_line in mapping_edi_table.line_ids:
 
-        log_reasons = []
-        if not isinstance(python_dict, list):
-            python_dict = [python_dict]
-        for item in python_dict:
-            next_process_after_create = []
-            vals = {}
-            if mapping_edi_table.default_value:
-                vals = safe_eval(mapping_edi_table.default_value)
+            nested_value = get_xml_value(item, odoo_line.xml_element)
+            if nested_value is None:
+            # if odoo_line.xml_element not in item:
+                log_msg = "%s element not found" % (odoo_line.xml_element)
+                log_buffer.add(log_msg, row)
+                log_reasons.append('Failed')
+                continue
 
-            # Handled logic to search existing record from multiple values & prepare domain based in those values.
-            existing_main_record = self.env[mapping_edi_table.model_id.model]
-            if mapping_edi_table.search_record_from_this_value:
-                search_values = mapping_edi_table.search_record_from_this_value.split(',')
-                search_domain = []
-
-                for value in search_values:
-                    field_line = mapping_edi_table.line_ids.filtered(lambda line: line.xml_element == value.strip())
-                    if field_line:
-                        # Split search values if nested, so we can go through upto final element and get proper value from dict.
-                        # example: brand/default_code
-                        xml_path = value.strip().split("/")
-                        nested_value = item
-                        for key in xml_path:
-                            nested_value = nested_value.get(key, None)  # Get next level; if key missing, return None
-                            if nested_value is None:
-                                break
-                        search_value = nested_value
-                        if search_value:
-                            search_domain.append((field_line[0].odoo_field.name, '=', search_value))
-                if inventory_location and mapping_edi_table.model_id.model == 'stock.quant' and not any(
-                        condition[0] == 'location_id' for condition in search_domain):
-                    search_domain.append(('location_id', '=', inventory_location.id))
-                if search_domain:
-                    existing_main_record = self.env[mapping_edi_table.model_id.model].sudo().search(search_domain, limit=1)
+            line = nested_value
 
-            for odoo_line in mapping_edi_table.line_ids:
+            # If translation is required, then from translation table find corresponding Odoo value.
+            if line and mapping_edi_table.is_translation_required:
+                line = mapping_edi_table._translate_value(odoo_line.xml_element, line)
+            else:
+                continue
 
-                xml_path = odoo_line.xml_element.split("/")  # Split sub_directories into list items
-                # Traverse the dictionary
-                nested_value = item
-                for key in xml_path:
-                    nested_value = nested_value.get(key, None)  # Get next level; if key missing, return None
-                    if nested_value is None:
+            mapped_field = odoo_line.odoo_field
+            try:
+                if mapped_field.ttype != 'one2many':
+                    vals_dict, create_record, log_msg = self._prepare_vals_from_attachment(odoo_line, line,
+                                                                                           mapped_field)
+                    if create_record:
+                        if vals_dict:
+                            vals.update(vals_dict)
+                    else:
+                        # Value not matched with Odoo records then skip that row, not import that record.
+                        log_buffer.add(log_msg, row)
+                        log_reasons.append('Failed')
                         break
+                else:
+                    sub_table_for_o2m = odoo_line.sub_edi_config_table_id
+                    if not isinstance(line, list):
+                        line = [line]
+                    for value in line:
+                        vals_for_o2m = {}
+                        for o2m_field_line in sub_table_for_o2m.line_ids:
+                            o2m_line = get_xml_value(value, o2m_field_line.xml_element)
 
-                if nested_value is None:
-                # if odoo_line.xml_element not in item:
-                    log_msg = "%s element not found" % (odoo_line.xml_element)
-                    self.env['log.book.lines'].create_log(log_msg, main_log_id, fault_operation=True)
-                    self.write({
-                        'log_id': main_log_id.id
-                    })
-                    log_reasons.append('Failed')
-                    self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
-                    continue
+                            # If translation is required, then from translation table find corresponding Odoo value.
+                            if o2m_line and sub_table_for_o2m.is_translation_required:
+                                o2m_line = sub_table_for_o2m._translate_value(o2m_field_line.xml_element, o2m_line)
+                            else:
+                                continue
+                            o2m_field = o2m_field_line.odoo_field
+                            vals_dict, create_record, log_msg = self._prepare_vals_from_attachment(o2m_field_line,
+                                                                                                   o2m_line,
+                                                                                                   o2m_field)
+                            if create_record:
+                                if vals_dict:
+                                    vals_for_o2m.update(vals_dict)
+                            else:
+                                log_buffer.add(log_msg, row)
+                                log_reasons.append('Failed')
+                                break
+                        if not create_record:
+                            break
+                        if vals_for_o2m:
+                            next_process_after_create.append((odoo_line, vals_for_o2m, sub_table_for_o2m))
+            except Exception as e:
+                if isinstance(e, psycopg2.Error):
+                    # Database error aborts the transaction, so it's handled by item's savepoint.
+                    raise
+                error_message = "Something went wrong! {}".format(e)
+                log_buffer.add(error_message, row)
+                log_reasons.append('Failed')
+            if not create_record:
+                break
+        return create_record, vals, next_process_after_create
 
-                line = nested_value
+    def _prepare_search_key_from_item(self, item, mapping_edi_table, inventory_location):
+        """
+        This method is used to prepare search key of an item, based on search_record_from_this_value of config table.
+        Search key is a tuple of (field name, value) pairs which is used to find existing record,
+        if there is no search value then it returns False.
+        Author: DG
+        """
+        if not mapping_edi_table.search_record_from_this_value:
+            return False
+        search_key = []
+        for value in mapping_edi_table.search_record_from_this_value.split(','):
+            field_line = mapping_edi_table.line_ids.filtered(lambda line: line.xml_element == value.strip())
+            if field_line:
+                # Search value may be nested, example: brand/default_code
+                search_value = get_xml_value(item, value.strip())
+                if search_value:
+                    search_key.append((field_line[0].odoo_field.name, search_value))
+        if inventory_location and mapping_edi_table.model_id.model == 'stock.quant' and not any(
+                condition[0] == 'location_id' for condition in search_key):
+            search_key.append(('location_id', inventory_location.id))
+        return tuple(search_key) or False
 
-                # If translation is required, then from translation table find corresponding Odoo value.
-                if line and mapping_edi_table.is_translation_required:
-                    translation_record = self.env['translation.table'].sudo().search(
-                        [('edi_config_table_id', '=', mapping_edi_table.id),
-                         ('xml_element', '=', odoo_line.xml_element),
-                         ('xml_value', '=', line)], limit=1)
-                    if translation_record and translation_record.corresponding_odoo_value:
-                        line = translation_record.corresponding_odoo_value
-                else:
+    def _is_search_key_matchable(self, model, search_key):
+        """
+        This method is used to check whether search key values can be compared with record values in Python,
+        so that existing records of a whole chunk can be fetched with a single query.
+        Author: DG
+        """
+        for field_name, value in search_key:
+            field = model._fields.get(field_name)
+            if not field:
+                return False
+            if field.type in ('char', 'text', 'selection') and isinstance(value, str):
+                continue
+            if field.type == 'many2one' and isinstance(value, int):
+                continue
+            return False
+        return True
+
+    def _search_key_of_record(self, record, key_fields):
+        """
+        This method is used to prepare search key from existing record values.
+        Author: DG
+        """
+        return tuple(
+            (field_name, record[field_name].id if record._fields[field_name].type == 'many2one' else record[field_name])
+            for field_name in key_fields)
+
+    def _find_existing_records_by_search_keys(self, model, search_keys, mapping_edi_table):
+        """
+        This method is used to find existing records for all search keys of a chunk.
+        First linked records are taken from EDI cross-reference table, then remaining search keys
+        having same fields are fetched together in one query & mapped as key => record.
+        Author: DG
+        """
+        existing_records = {
+            search_key: record.with_env(model.env)
+            for search_key, record in self.env['edi.xref'].sudo().get_records(
+                mapping_edi_table, self.edi_partner_id, model._name, search_keys).items()
+        }
+        keys_by_fields = {}
+        for search_key in search_keys:
+            if search_key in existing_records:
+                continue
+            key_fields = tuple(field_name for field_name, value in search_key)
+            keys_by_fields.setdefault(key_fields, set()).add(search_key)
+
+        for key_fields, keys in keys_by_fields.items():
+            if not all(self._is_search_key_matchable(model, search_key) for search_key in keys):
+                # Values can't be compared in Python (e.g. name search on many2one), so search them one by one.
+                for search_key in keys:
+                    existing_records[search_key] = model.search(
+                        [(field_name, '=', value) for field_name, value in search_key], limit=1)
+                continue
+            domain = []
+            for index, field_name in enumerate(key_fields):
+                domain.append((field_name, 'in', list({search_key[index][1] for search_key in keys})))
+            for record in model.search(domain):
+                record_key = self._search_key_of_record(record, key_fields)
+                # Keep the first record as per model order, same as search with limit=1.
+                if record_key in keys and record_key not in existing_records:
+                    existing_records[record_key] = record
+        return existing_records
+
+    def _is_o2m_condition_matchable(self, model, field_name, value):
+        """
+        This method is used to check whether a child search condition can be compared with record value in Python.
+        Author: DG
+        """
+        field = model._fields.get(field_name)
+        if not field or field.type in ('one2many', 'many2many', 'html', 'binary'):
+            return False
+        if field.type == 'many2one' and not isinstance(value, int):
+            # String on many2one means name search, which can be done only by database.
+            return False
+        return True
+
+    def _record_matches_o2m_conditions(self, record, search_conditions):
+        """
+        This method is used to check record values with child search conditions, same as '=' domain.
+        Author: DG
+        """
+        for field_name, value in search_conditions:
+            field = record._fields[field_name]
+            try:
+                if field.convert_to_cache(record[field_name], record) != field.convert_to_cache(value, record):
+                    return False
+            except Exception:
+                return False
+        return True
+
+    def _create_o2m_records_after_create(self, parent_jobs, first_match_only=True):
+        """
+        This method is used to create/write o2m records, which we processed after the creation of the main records.
+        parent_jobs is a list of (main record, o2m values to process, dict used for search values).
+        Child records of all main records are matched with one query per sub-table & created with one multi-create.
+        Author: DG
+        """
+        entries_by_sub_table = {}
+        for created_record, next_process_after_create, python_dict in parent_jobs:
+            for o2m_main_line, o2m_field_value, sub_table in next_process_after_create:
+                relation_field = o2m_main_line.odoo_field.relation_field
+                o2m_vals = {}
+                if sub_table.default_value:
+                    o2m_vals = safe_eval(sub_table.default_value)
+                o2m_vals.update(o2m_field_value)
+                o2m_vals.update({relation_field: created_record.id})
+                search_conditions = False
+                if sub_table.search_record_from_this_value:
+                    search_conditions = list(o2m_vals.items())
+                    search_values = sub_table.search_record_from_this_value.split(',')
+                    for value in search_values:
+                        field_line = sub_table.line_ids.filtered(lambda line: line.xml_element == value.strip())
+                        if field_line:
+                            # Search value may be nested, example: brand/default_code
+                            search_value = get_xml_value(python_dict, value.strip())
+                            if search_value:
+                                search_conditions.append((field_line[0].odoo_field.name, search_value))
+                entries_by_sub_table.setdefault(sub_table, []).append({
+                    'vals': o2m_vals,
+                    'search_conditions': search_conditions,
+                    'relation_field': relation_field,
+                    'parent_id': created_record.id,
+                })
+
+        for sub_table, entries in entries_by_sub_table.items():
+            model = self.env[sub_table.model_id.model]
+
+            # Fetch existing child records of all main records at once & group them by main record.
+            candidates = {}
+            entries_to_match = [entry for entry in entries if entry['search_conditions']]
+            for relation_field in {entry['relation_field'] for entry in entries_to_match}:
+                parent_ids = list({entry['parent_id'] for entry in entries_to_match
+                                   if entry['relation_field'] == relation_field})
+                for child in model.search([(relation_field, 'in', parent_ids)]):
+                    candidates.setdefault((relation_field, child[relation_field].id), []).append(child)
+
+            vals_to_create = []
+            matched_vals_to_create = set()
+            for entry in entries:
+                if not entry['search_conditions']:
+                    vals_to_create.append(entry['vals'])
                     continue
+                if not all(self._is_o2m_condition_matchable(model, field_name, value)
+                           for field_name, value in entry['search_conditions']):
+                    domain = [(field_name, '=', value) for field_name, value in entry['search_conditions']]
+                    existing_child_record = model.search(domain, limit=1 if first_match_only else None)
+                else:
+                    matched = [child for child in candidates.get((entry['relation_field'], entry['parent_id']), [])
+                               if self._record_matches_o2m_conditions(child, entry['search_conditions'])]
+                    if first_match_only:
+                        matched = matched[:1]
+                    existing_child_record = model.concat(*matched) if matched else model
+                if existing_child_record:
+                    existing_child_record.write(entry['vals'])
+                elif repr(entry['search_conditions']) not in matched_vals_to_create:
+                    # Same child line twice in one file is created once, as the later one would match the first one.
+                    matched_vals_to_create.add(repr(entry['search_conditions']))
+                    vals_to_create.append(entry['vals'])
+            if vals_to_create:
+                model.create(vals_to_create)
 
-                mapped_field = odoo_line.odoo_field
-                try:
-                    if mapped_field.ttype != 'one2many':
-                        vals_dict, create_record, log_msg = self._prepare_vals_from_attachment(odoo_line, line,
-                                                                                               mapped_field)
-                        if create_record:
-                            if vals_dict:
-                                vals.update(vals_dict)
-                        else:
-                            # Value not matched with Odoo records then skip that row, not import that record.
-                            self.env['log.book.lines'].create_log(log_msg, main_log_id, fault_operation=True)
-                            self.write({
-                                'log_id': main_log_id.id
-                            })
-                            log_reasons.append('Failed')
-                            self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
-                            break
-                    else:
-                        sub_table_for_o2m = odoo_line.sub_edi_config_table_id
-                        if not isinstance(line, list):
-                            line = [line]
-                        for value in line:
-                            vals_for_o2m = {}
-                            for o2m_field_line in sub_table_for_o2m.line_ids:
-                                o2m_line = value
-                                for header in (o2m_field_line.xml_element or "").split("/"):
-                                    if header in o2m_line:
-                                        o2m_line = o2m_line[header]
-                                    else:
-                                        o2m_line = None
+    def _flush_import_chunk(self, chunk, mapping_edi_table, inventory_location, log_buffer, log_reasons):
+        """
+        This method is used to create/write main records of a chunk together.
+        Existing records are fetched with one query per chunk, new records are created with one multi-create
+        and existing records are updated with grouped writes. If bulk operation fails, then records are processed
+        one by one, so one bad row only fails itself.
+        Author: DG
+        """
+        if not chunk:
+            return
+        model = self.env[mapping_edi_table.model_id.model]
+        search_keys = [entry['search_key'] for entry in chunk if entry['search_key']]
+        existing_records = self._find_existing_records_by_search_keys(
+            model.sudo(), search_keys, mapping_edi_table) if search_keys else {}
 
-                                # If translation is required, then from translation table find corresponding Odoo value.
-                                if o2m_line and sub_table_for_o2m.is_translation_required:
-                                    translation_record = self.env['translation.table'].sudo().search(
-                                        [('edi_config_table_id', '=', sub_table_for_o2m.id),
-                                         ('xml_element', '=', o2m_field_line.xml_element),
-                                         ('xml_value', '=', o2m_line)], limit=1)
-                                    if translation_record and translation_record.corresponding_odoo_value:
-                                        o2m_line = translation_record.corresponding_odoo_value
-                                else:
-                                    continue
-                                o2m_field = o2m_field_line.odoo_field
-                                vals_dict, create_record, log_msg = self._prepare_vals_from_attachment(o2m_field_line,
-                                                                                                       o2m_line,
-                                                                                                       o2m_field)
-                                if create_record:
-                                    if vals_dict:
-                                        vals_for_o2m.update(vals_dict)
-                                else:
-                                    self.env['log.book.lines'].create_log(log_msg, main_log_id, fault_operation=True)
-                                    self.write({
-                                        'log_id': main_log_id.id
-                                    })
-                                    log_reasons.append('Failed')
-                                    self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
-                                    break
-                            if not create_record:
-                                break
-                            if vals_for_o2m:
-                                next_process_after_create.append((odoo_line, vals_for_o2m, sub_table_for_o2m))
+        to_create = []
+        to_write = {}
+        for entry in chunk:
+            existing_main_record = entry['search_key'] and existing_records.get(entry['search_key'])
+            vals = entry['vals']
+            if not existing_main_record:
+                # If import records of stock quant then in vals adding location.
+                if inventory_location and mapping_edi_table.model_id.model == 'stock.quant':
+                    if 'location_id' not in vals:
+                        vals['location_id'] = inventory_location.id
+                # In creating record adding x_is_processed value as true.
+                if 'x_is_processed' not in vals:
+                    vals['x_is_processed'] = True
+                to_create.append(entry)
+            else:
+                entry['record'] = existing_main_record
+                to_write.setdefault(repr(sorted(vals.items())), []).append(entry)
+
+        if to_create:
+            try:
+                with self.env.cr.savepoint():
+                    created_records = model.create([entry['vals'] for entry in to_create])
+                for entry, created_record in zip(to_create, created_records):
+                    entry['record'] = created_record
+            except Exception:
+                for entry in to_create:
+                    try:
+                        with self.env.cr.savepoint():
+                            entry['record'] = model.create(entry['vals'])
+                    except Exception as e:
+                        entry['error'] = e
+
+        for entries in to_write.values():
+            records = entries[0]['record'].concat(*[entry['record'] for entry in entries[1:]])
+            try:
+                with self.env.cr.savepoint():
+                    records.write(entries[0]['vals'])
+            except Exception:
+                for entry in entries:
+                    try:
+                        with self.env.cr.savepoint():
+                            entry['record'].write(entry['vals'])
+                    except Exception as e:
+                        entry['error'] = e
+
+        done_entries = []
+        for entry in chunk:
+            if entry.get('error'):
+                error_message = "Something went wrong! {}".format(entry['error'])
+                log_buffer.add(error_message, entry['row'])
+                log_reasons.append('Failed')
+                continue
+            # if inventory_location and mapping_edi_table.model_id.model == 'stock.quant':
+            #    created_record.action_apply_inventory()
+
+            done_entries.append(entry)
+        self.env['edi.xref'].sudo().register_records(
+            mapping_edi_table, self.edi_partner_id,
+            [(entry['search_key'], entry['record']) for entry in done_entries])
+
+        # Process for o2m values of the whole chunk, which we processed after the creation of the main records.
+        try:
+            with self.env.cr.savepoint():
+                self._create_o2m_records_after_create(
+                    [(entry['record'], entry['next_process_after_create'], entry['item']) for entry in done_entries])
+        except Exception:
+            # Process o2m values record by record, so only records having wrong child values are failed.
+            for entry in list(done_entries):
+                try:
+                    with self.env.cr.savepoint():
+                        self._create_o2m_records_after_create(
+                            [(entry['record'], entry['next_process_after_create'], entry['item'])])
                 except Exception as e:
+                    done_entries.remove(entry)
                     error_message = "Something went wrong! {}".format(e)
-                    self.env['log.book.lines'].create_log(error_message, main_log_id, fault_operation=True)
-                    self.write({
-                        'log_id': main_log_id.id
-                    })
+                    log_buffer.add(error_message, entry['row'])
                     log_reasons.append('Failed')
-                    self.message_post(body=f"Please check log [{main_log_id.name}] for more details.")
-                if not create_record:
-                    break
-            if create_record and vals:
-                if not existing_main_record:
-                    # If import records of stock quant then in vals adding location.
-                    if inventory_location and mapping_edi_table.model_id.model == 'stock.quant':
-                        if 'location_id' not in vals:
-                            vals['location_id'] = inventory_location.id
-                    # In creating record adding x_is_processed value as true.
-                    if 'x_is_processed' not in vals:
-                        vals['x_is_processed'] = True
-                    created_record = self.env[mapping_edi_table.model_id.model].create(vals)
-                else:
-                    existing_main_record.write(vals)
-                    created_record = existing_main_record
-                # if inventory_location and mapping_edi_table.model_id.model == 'stock.quant':
-                #    created_record.action_apply_inventory()
+        log_reasons.extend('Done' for entry in done_entries)
+
+    def _commit_import_checkpoint(self, next_index, log_reasons, log_buffer):
+        """
+        This method is used to commit imported records & store checkpoint, so that if process is killed
+        then on next process import resumes from next_index instead of starting over.
+        Author: DG
+        """
+        self.write({
+            'import_checkpoint': next_index,
+            'import_done_count': log_reasons.count('Done'),
+            'import_failed_count': log_reasons.count('Failed'),
+            'log_id': log_buffer.main_log.id,
+        })
+        log_buffer.flush()
+        self._cr.commit()
+
+    def _create_multiple_record_from_single_attachment(self, python_dict, mapping_edi_table, main_table_xml_element,
+                                                 main_log_id):
+        """
+        This method is used to create multiple records from a single attachment.
+        Records are processed in chunks (Import Batch Size of config table) to reduce queries per record.
+        Also inside it regarding stock.quant some customizations implemented.
+        Author: DG
+        """
+        inventory_location = self.env['stock.location']
+        if mapping_edi_table.model_id.model == 'stock.quant' and mapping_edi_table.location_id:
+            inventory_location = mapping_edi_table.location_id
+        for header in (main_table_xml_element or "").split("/"):
+            if header in python_dict:
+                python_dict = python_dict[header]
+
+        # If previous process is interrupted, then skip committed records & continue its counts.
+        checkpoint = self.import_checkpoint
+        log_reasons = ['Done'] * self.import_done_count + ['Failed'] * self.import_failed_count
+        if not isinstance(python_dict, list):
+            python_dict = [python_dict]
+        batch_size = self.edi_config_table_id.import_batch_size or len(python_dict)
+        commit_batch_size = self.edi_config_table_id.commit_batch_size
+        last_commit_index = checkpoint
+
+        chunk = []
+        chunk_search_keys = set()
+        log_buffer = EDILogBuffer(main_log_id)
+        for index, item in enumerate(python_dict):
+            if index < checkpoint:
+                continue
+            row = index + 1
+            try:
+                # Savepoint for each record, so one bad record doesn't affect other records of the chunk.
+                with self.env.cr.savepoint():
+                    create_record, vals, next_process_after_create = self._prepare_vals_from_item(
+                        item, mapping_edi_table, log_buffer, log_reasons, row)
+            except Exception as e:
+                error_message = "Something went wrong! {}".format(e)
+                log_buffer.add(error_message, row)
+                log_reasons.append('Failed')
+                continue
+            if not (create_record and vals):
+                continue
+            search_key = self._prepare_search_key_from_item(item, mapping_edi_table, inventory_location)
+
+            # Same record found twice in the chunk, so flush the chunk first & then later item will update it.
+            if (search_key and search_key in chunk_search_keys) or len(chunk) >= batch_size:
+                self._flush_import_chunk(chunk, mapping_edi_table, inventory_location, log_buffer, log_reasons)
+                chunk = []
+                chunk_search_keys = set()
+                if commit_batch_size and index - last_commit_index >= commit_batch_size:
+                    self._commit_import_checkpoint(index, log_reasons, log_buffer)
+                    last_commit_index = index
+            chunk.append({
+                'vals': vals,
+                'search_key': search_key,
+                'next_process_after_create': next_process_after_create,
+                'item': item,
+                'row': row,
+            })
+            if search_key:
+                chunk_search_keys.add(search_key)
+        self._flush_import_chunk(chunk, mapping_edi_table, inventory_location, log_buffer, log_reasons)
 
-                # Process for o2m values, which we processed after the creation of the main record.
-                for o2m_main_line, o2m_field_value, sub_table in next_process_after_create:
-                    o2m_vals = {}
-                    if sub_table.default_value:
-                        o2m_vals = safe_eval(sub_table.default_value)
-                    o2m_vals.update(o2m_field_value)
-                    o2m_vals.update({o2m_main_line.odoo_field.relation_field: created_record.id})
-                    search_domain = [(key, '=', value) for key, value in o2m_vals.items()]
-                    if sub_table.search_record_from_this_value:
-                        search_values = sub_table.search_record_from_this_value.split(',')
-                        for value in search_values:
-                            field_line = sub_table.line_ids.filtered(lambda line: line.xml_element == value.strip())
-                            if field_line:
-                                # Split search values if nested, so we can go through upto final element and get proper value from dict.
-                                # example: brand/default_code
-                                xml_path = value.strip().split("/")
-                                nested_value = python_dict
-                                for key in xml_path:
-                                    nested_value = nested_value.get(key, None)  # Get next level; if key missing, return None
-                                    if nested_value is None:
-                                        break
-                                search_value = nested_value
-                                if search_value:
-                                    search_domain.append((field_line[0].odoo_field.name, '=', search_value))
-                        existing_child_record = self.env[sub_table.model_id.model].search(search_domain, limit=1)
-                        if existing_child_record:
-                            existing_child_record.write(o2m_vals)
-                        else:
-                            self.env[sub_table.model_id.model].create(o2m_vals)
-                    else:
-                        self.env[sub_table.model_id.model].create(o2m_vals)
-                log_reasons.append('Done')
         if all(line == 'Done' for line in log_reasons):
             self.state = 'Done'
         elif all(line == 'Failed' for line in log_reasons):
             self.state = 'Failed'
         else:
             self.state = 'Partially_Done'
+        self.write({
+            'import_checkpoint': 0,
+            'import_done_count': 0,
+            'import_failed_count': 0,
+        })
+        self._post_log_buffer(log_buffer)
         self._cr.commit()
         if main_log_id and not main_log_id.log_detail_ids:
             main_log_id.unlink()
 
-    def auto_process_edi_transactions(self):
+    def _claim_draft_transactions(self, batch_size, edi_types=("Incoming", "Outgoing")):
+        """
+        This method is used to claim a batch of 'Draft' transactions for this worker.
+        Transactions are taken by priority, then round-robin across partners (oldest first for each partner),
+        so bulk files of one partner don't starve urgent documents of others.
+        Rows are locked with FOR UPDATE SKIP LOCKED, so parallel workers never claim the same transaction,
+        and claim is committed immediately so other workers see those transactions as 'Processing'.
+        Author: DG
+        """
+        if batch_size <= 0:
+            return self.browse()
+        owner = "%s:%s:%s" % (socket.gethostname(), os.getpid(), threading.get_ident())
+        self.flush_model(['state', 'edi_type', 'edi_partner_id', 'priority', 'next_attempt_date'])
+        self._cr.execute("""
+            SELECT t.id
+              FROM edi_transactions t
+              JOIN (
+                    SELECT id, COALESCE(priority, 0) AS priority,
+                           ROW_NUMBER() OVER (PARTITION BY COALESCE(edi_partner_id, 0)
+                                              ORDER BY COALESCE(priority, 0) DESC, id) AS partner_rank
+                      FROM edi_transactions
+                     WHERE state = 'Draft'
+                       AND edi_type IN %s
+                       AND (next_attempt_date IS NULL OR next_attempt_date <= (now() at time zone 'UTC'))
+                   ) ranked ON ranked.id = t.id
+             WHERE t.state = 'Draft'
+             ORDER BY ranked.priority DESC, ranked.partner_rank, t.id
+             LIMIT %s
+               FOR UPDATE OF t SKIP LOCKED
+        """, (tuple(edi_types), batch_size))
+        transaction_ids = [row[0] for row in self._cr.fetchall()]
+        if transaction_ids:
+            self._cr.execute("""
+                UPDATE edi_transactions
+                   SET state = 'Processing', processing_owner = %s, processing_date = (now() at time zone 'UTC')
+                 WHERE id IN %s
+            """, (owner, tuple(transaction_ids)))
+            self.invalidate_model(['state', 'processing_owner', 'processing_date'])
+        self._cr.commit()
+        return self.browse(transaction_ids)
+
+    def _claim_transaction_batch(self, batch_size, lane=False, outgoing_share=50):
+        """
+        This method is used to claim next batch of transactions from Incoming & Outgoing lanes.
+        If lane is given then only that type is claimed, otherwise outgoing_share percentage of batch is
+        reserved for Outgoing transactions & free places of one lane are filled from the other lane.
+        Author: DG
+        """
+        if lane:
+            return self._claim_draft_transactions(batch_size, edi_types=(lane,))
+        outgoing_size = -(-batch_size * max(min(outgoing_share, 100), 0) // 100)
+        transactions = self._claim_draft_transactions(outgoing_size, edi_types=("Outgoing",))
+        transactions |= self._claim_draft_transactions(batch_size - len(transactions), edi_types=("Incoming",))
+        if len(transactions) < batch_size:
+            transactions |= self._claim_draft_transactions(batch_size - len(transactions), edi_types=("Outgoing",))
+        return transactions
+
+    def _release_stale_transactions(self, stale_after_minutes):
+        """
+        This method is used to set 'Processing' transactions back to 'Draft' if their worker is died
+        before completing them.
+        Author: DG
+        """
+        self._cr.execute("""
+            UPDATE edi_transactions SET state = 'Draft', processing_owner = NULL, processing_date = NULL
+             WHERE state = 'Processing'
+               AND processing_date < (now() at time zone 'UTC') - make_interval(mins => %s)
+        """, (stale_after_minutes,))
+        self.invalidate_model(['state', 'processing_owner', 'processing_date'])
+        self._cr.commit()
+
+    def _process_claimed_transaction(self):
+        """
+        This method is used to process a claimed transaction & commit it.
+        If processing raised an error, then it's rolled back & transaction is retried later or set as 'Failed'.
+        Author: DG
+        """
+        try:
+            self.process()
+            self._cr.commit()
+        except Exception as e:
+            self._cr.rollback()
+            main_log_id = self.log_id or self.env['log.book'].create_main_log(self.name)
+            self._schedule_retry_or_fail(e, main_log_id)
+            self._cr.commit()
+
+    def auto_process_edi_transactions(self, batch_size=50, stale_after_minutes=60, time_budget=None, item_budget=None,
+                                      lane=False, outgoing_share=50):
         """
         This method is used to process EDI transactions automatically from scheduled action,
         process those records which are in 'Draft' state.
+        Each call claims batches of transactions with SKIP LOCKED, so this scheduled action can be duplicated
+        to drain the queue with several workers in parallel.
+        A duplicated scheduled action can be dedicated to one lane with lane='Incoming' or lane='Outgoing',
+        otherwise outgoing_share percentage of each batch is given to Outgoing transactions.
+        Run stops when time/item budget is used up & scheduled action is triggered again for remaining transactions.
         Author: DG
         """
-        to_be_process_transactions = self.search([('state', '=', 'Draft')])
-        for rec in to_be_process_transactions:
-            rec.process()
+        budget = EDIRunBudget(time_budget=time_budget, item_budget=item_budget)
+        self._release_stale_transactions(stale_after_minutes)
+        unfinished_transactions = self.browse()
+        while not budget.exhausted():
+            transactions = self._claim_transaction_batch(budget.remaining_items(batch_size), lane=lane,
+                                                         outgoing_share=outgoing_share)
+            if not transactions:
+                break
+            for rec in transactions:
+                if budget.exhausted():
+                    unfinished_transactions |= rec
+                    continue
+                rec._process_claimed_transaction()
+                budget.consume()
+                if rec.state == 'Processing':
+                    unfinished_transactions |= rec
+                else:
+                    rec.write({'processing_owner': False, 'processing_date': False})
+            self._cr.commit()
+
+        # Nothing is done on these transactions, so they remain in queue as before.
+        if unfinished_transactions:
+            unfinished_transactions.write({'state': 'Draft', 'processing_owner': False, 'processing_date': False})
+            self._cr.commit()
+        if budget.exhausted():
+            budget.reschedule(self.env, cron_xml_id='odoo_edi_integration.auto_process_edi_transactions_cronjob')
 
     def recompute_xml(self):
         """
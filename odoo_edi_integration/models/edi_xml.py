@@ -0,0 +1,193 @@
+import functools
+from lxml import etree
+
+
+@functools.lru_cache(maxsize=1024)
+def compile_xml_path(path, from_document=False):
+    """
+    This method is used to compile mapping line path (e.g. Items/Item/@code) into XPath, relative to a record node.
+    Steps are matched by qualified name as written in the file (prefix:name), same as keys of xmltodict,
+    '@name' selects an attribute & '#text' the text of the element. Returns None for an invalid path.
+    From document, first step is the root element itself, as XPath is evaluated on root element.
+    Author: DG
+    """
+    steps = []
+    for key in (path or '').strip().split('/'):
+        key = key.strip()
+        if not key or "'" in key:
+            return None
+        if from_document and not steps:
+            if key.startswith(('@', '#')):
+                return None
+            steps.append("self::*[name()='%s']" % key)
+        elif key == '#text':
+            steps.append('text()')
+        elif key.startswith('@'):
+            steps.append("@*[name()='%s']" % key[1:])
+        else:
+            steps.append("*[name()='%s']" % key)
+    return etree.XPath('/'.join(steps))
+
+
+def _convert_xml_result(result):
+    """
+    This method is used to convert XPath result item into value as xmltodict gives it:
+    text of a simple element (None if empty), node of an element having children or attributes, string of attribute.
+    Author: DG
+    """
+    if not isinstance(result, etree._Element):
+        return str(result).strip() or None
+    if len(result) or result.attrib:
+        return XMLNode(result)
+    text = ''.join(result.itertext()).strip()
+    return text or None
+
+
+def get_xml_value(data, path):
+    """
+    This method is used to get value of mapping line path from parsed XML content.
+    data is either dict of xmltodict or node of lxml engine, both give same values: None when element is not found,
+    list when element is repeated.
+    Author: DG
+    """
+    if isinstance(data, XMLNode):
+        return data.value(path)
+    value = data
+    for key in (path or '').split('/'):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(key)
+        if value is None:
+            return None
+    return value
+
+
+def _parse_xml_element(content):
+    """
+    This method is used to parse XML content into lxml root element, without resolving entities or network access.
+    Author: DG
+    """
+    parser = etree.XMLParser(encoding='utf-8', huge_tree=True, remove_comments=True, remove_pis=True,
+                             resolve_entities=False, no_network=True)
+    data = content.encode('utf-8') if isinstance(content, str) else content
+    return etree.fromstring(data, parser)
+
+
+def parse_xml_document(content):
+    """
+    This method is used to parse XML content with lxml, it returns document node to read values from.
+    Author: DG
+    """
+    return XMLNode(_parse_xml_element(content), is_document=True)
+
+
+def compile_xsd(xsd_content):
+    """
+    This method is used to compile XSD schema, it raises etree.XMLSchemaParseError/XMLSyntaxError if it's invalid.
+    Author: DG
+    """
+    return etree.XMLSchema(_parse_xml_element(xsd_content))
+
+
+def get_xsd_errors(schema, document, limit=100):
+    """
+    This method is used to validate already parsed XML (document node or root element) with compiled XSD schema,
+    so file is not parsed again for validation. It returns errors of the file (at most limit).
+    Author: DG
+    """
+    if isinstance(document, XMLNode):
+        document = document.node
+    if schema.validate(document):
+        return []
+    error_log = schema.error_log
+    errors = ["Line %s: %s" % (error.line, error.message) for error in list(error_log)[:limit]]
+    if len(error_log) > limit:
+        errors.append("%s more errors are not shown" % (len(error_log) - limit))
+    return errors
+
+
+def get_structure_errors(data, spec, row=False):
+    """
+    This method is used to check parsed XML content with structure spec of a mapping table.
+    spec is tuple of (xml_element, required, sub spec), sub spec is set for one2many elements & None for values.
+    It yields (message, row) for each problem, row is record number of the file for multiple records files.
+    Author: DG
+    """
+    for xml_element, required, sub_spec in spec:
+        value = get_xml_value(data, xml_element)
+        if value is None or value == '':
+            if required:
+                yield "[%s] element is required" % xml_element, row
+            continue
+        if sub_spec is None:
+            if isinstance(value, list):
+                yield "[%s] element must occur only once" % xml_element, row
+            elif not isinstance(value, str):
+                yield "[%s] element must have a value, not child elements" % xml_element, row
+            continue
+        for child in value if isinstance(value, list) else [value]:
+            if isinstance(child, (dict, XMLNode)):
+                yield from get_structure_errors(child, sub_spec, row)
+            elif child is not None:
+                yield "[%s] element must have child elements" % xml_element, row
+
+
+class XMLNode:
+    """
+    Read-only view of an lxml element (or of document, whose only key is root element) with the dict interface used by import process,
+    so import code works same on xmltodict dicts & lxml trees. Each step of mapping line path is evaluated with
+    compiled XPath & walk stops where xmltodict walk stops: at a repeated element (list) or at an element
+    without children & attributes (plain value), only the last step may give many nodes.
+    Author: DG
+    """
+    __slots__ = ('node', 'is_document')
+
+    def __init__(self, node, is_document=False):
+        self.node = node
+        self.is_document = is_document
+
+    def __repr__(self):
+        return 'XMLNode(%s)' % self.node.tag
+
+    def _select(self, path):
+        steps = (path or '').strip().split('/')
+        node, is_document = self.node, self.is_document
+        for step in steps[:-1]:
+            xpath = compile_xml_path(step, is_document)
+            results = xpath(node) if xpath is not None else []
+            if len(results) != 1 or not isinstance(results[0], etree._Element):
+                return []
+            node, is_document = results[0], False
+            if not len(node) and not node.attrib:
+                return []
+        xpath = compile_xml_path(steps[-1], is_document)
+        return xpath(node) if xpath is not None else []
+
+    def _convert(self, path, results):
+        if path.strip().endswith('#text'):
+            # xmltodict joins text around child elements into one '#text' value.
+            return ''.join(results).strip() or None
+        if len(results) == 1:
+            return _convert_xml_result(results[0])
+        return [_convert_xml_result(result) for result in results]
+
+    def value(self, path):
+        """
+        This method is used to get value of path relative to this node.
+        Author: DG
+        """
+        results = self._select(path)
+        return self._convert(path, results) if results else None
+
+    def get(self, key, default=None):
+        results = self._select(key)
+        return self._convert(key, results) if results else default
+
+    def __contains__(self, key):
+        return bool(self._select(key))
+
+    def __getitem__(self, key):
+        results = self._select(key)
+        if not results:
+            raise KeyError(key)
+        return self._convert(key, results)
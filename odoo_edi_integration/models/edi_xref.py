@@ -0,0 +1,130 @@
+import json
+from odoo import models, fields, api
+from odoo.tools.sql import create_unique_index, index_exists
+from .edi_tools import normalize_key_value
+
+
+class EDIXref(models.Model):
+    _name = "edi.xref"
+    _description = "EDI External Reference"
+    _rec_name = "external_key"
+    _order = "id desc"
+
+    edi_config_table_id = fields.Many2one(
+        comodel_name="edi.config.table",
+        string="Mapping Table",
+        required=True,
+        index=True,
+        ondelete="cascade"
+    )
+    partner_id = fields.Many2one(
+        comodel_name="res.partner",
+        string="Trading Partner",
+        index=True,
+        ondelete="cascade"
+    )
+    external_key = fields.Char(
+        string="External Key",
+        required=True,
+        index=True,
+        help="Values of 'Search record from this value' elements, which identify the record in partner's files."
+    )
+    res_model = fields.Char(
+        string="Model",
+        required=True
+    )
+    res_id = fields.Many2oneReference(
+        string="Record ID",
+        model_field="res_model",
+        required=True
+    )
+
+    def init(self):
+        """
+        This method is used to create unique index on (mapping table, partner, external key).
+        Partner is optional, so it is compared through COALESCE.
+        Author: DG
+        """
+        if not index_exists(self._cr, 'edi_xref_unique_external_key'):
+            create_unique_index(self._cr, 'edi_xref_unique_external_key', self._table,
+                                ['edi_config_table_id', 'COALESCE(partner_id, 0)', 'external_key'])
+
+    @api.model
+    def _serialize_search_key(self, search_key, model_name):
+        """
+        This method is used to convert search key (tuple of field name & value pairs) into external key string.
+        Values are normalized as per field type, so keys of imported & exported records are same.
+        Author: DG
+        """
+        model_fields = self.env[model_name]._fields
+        return json.dumps([
+            [field_name, normalize_key_value(value, field_name in model_fields and model_fields[field_name].type)]
+            for field_name, value in search_key])
+
+    @api.model
+    def _search_xrefs(self, config_table, partner, external_keys):
+        """
+        This method is used to search cross-reference records of given external keys.
+        Author: DG
+        """
+        return self.search([
+            ('edi_config_table_id', '=', config_table.id),
+            ('partner_id', '=', partner.id or False),
+            ('external_key', 'in', list(external_keys)),
+        ])
+
+    @api.model
+    def get_records(self, config_table, partner, model_name, search_keys):
+        """
+        This method is used to find already linked Odoo records for search keys with one indexed lookup.
+        Returns dictionary of search key => record, links of deleted records are removed.
+        Author: DG
+        """
+        keys_by_external_key = {
+            self._serialize_search_key(search_key, model_name): search_key for search_key in search_keys
+        }
+        if not keys_by_external_key:
+            return {}
+        xrefs = self._search_xrefs(config_table, partner, keys_by_external_key).filtered(
+            lambda xref: xref.res_model == model_name)
+        existing_ids = set(self.env[model_name].browse(xrefs.mapped('res_id')).exists().ids)
+        stale_xrefs = xrefs.filtered(lambda xref: xref.res_id not in existing_ids)
+        if stale_xrefs:
+            stale_xrefs.unlink()
+        return {
+            keys_by_external_key[xref.external_key]: self.env[model_name].browse(xref.res_id)
+            for xref in xrefs - stale_xrefs
+        }
+
+    @api.model
+    def register_records(self, config_table, partner, key_record_pairs):
+        """
+        This method is used to create/update links of external keys with Odoo records.
+        key_record_pairs is a list of (search key, record). Links are upserted with one INSERT ... ON CONFLICT
+        on the unique index, so concurrent imports of the same key never abort each other with a unique violation.
+        Author: DG
+        """
+        records_by_external_key = {
+            self._serialize_search_key(search_key, record._name): record
+            for search_key, record in key_record_pairs if search_key
+        }
+        if not records_by_external_key:
+            return
+        self.flush_model()
+        rows = []
+        params = []
+        for external_key, record in records_by_external_key.items():
+            rows.append("(%s, %s, %s, %s, %s, %s, %s, now() at time zone 'UTC', now() at time zone 'UTC')")
+            params.extend([config_table.id, partner.id or None, external_key, record._name, record.id,
+                           self.env.uid, self.env.uid])
+        self.env.cr.execute("""
+            INSERT INTO edi_xref (edi_config_table_id, partner_id, external_key, res_model, res_id,
+                                  create_uid, write_uid, create_date, write_date)
+            VALUES %s
+            ON CONFLICT (edi_config_table_id, COALESCE(partner_id, 0), external_key)
+            DO UPDATE SET res_model = EXCLUDED.res_model, res_id = EXCLUDED.res_id,
+                          write_uid = EXCLUDED.write_uid, write_date = EXCLUDED.write_date
+                    WHERE edi_xref.res_model IS DISTINCT FROM EXCLUDED.res_model
+                       OR edi_xref.res_id IS DISTINCT FROM EXCLUDED.res_id
+        """ % ', '.join(rows), params)
+        self.invalidate_model(['res_model', 'res_id', 'write_uid', 'write_date'])
@@ -1,9 +1,16 @@
 from odoo import fields, models, api
-import xmltodict
+from .edi_tools import sniff_xml_root_tag
+import base64
+import hashlib
 import logging
+import os
+import tempfile
 
 _logger = logging.getLogger(__name__)
 
+# Size of blocks in which downloaded file is hashed & copied into filestore.
+FILESTORE_BLOCK_SIZE = 64 * 1024
+
 
 class FtpAttachment(models.Model):
     _name = "ftp.attachment"
@@ -54,29 +61,94 @@ class FtpAttachment(models.Model):
             _logger.info("Skipping edi.transaction creation because attachment is created from controller.")
             return attachments
         for rec in attachments:
-            edi_transaction = self.env["edi.transactions"]
-            edi_config_table_id = self.env['edi.config.table']
-            if rec.ftp_list_id and rec.ftp_list_id.download_this and rec.ftp_list_id.mapping_table_search_using_xml_header:
-                python_dict = xmltodict.parse(rec.file_content)
-                xml_header = ''
-                for key, value in python_dict.items():
-                    xml_header = key
-                if xml_header:
-                    edi_config_table_id = self.env['edi.config.table'].search([('xml_header', '=', xml_header)], limit=1)
-                if not edi_config_table_id:
-                    _logger.info("Using XML header [{}] mapping table not found.".format(xml_header))
-            elif rec.ftp_list_id.edi_config_table_id and rec.ftp_list_id.edi_config_table_id.edi_type == "Incoming":
-                edi_config_table_id = rec.ftp_list_id.edi_config_table_id
-            
-            if edi_config_table_id and not edi_transaction.search([('name', '=', rec.name)]):
-                edi_transaction.create(
-                    {
-                        "name": rec.name,
-                        "edi_type": edi_config_table_id.edi_type,
-                        "edi_config_table_id": edi_config_table_id.id,
-                        "ftp_attachment_id": rec.id,
-                        "xml_content": rec.file_content,
-                        "edi_partner_id": rec.ftp_list_id.partner_id and rec.ftp_list_id.partner_id.id or False,
-                    }
-                )
+            rec._create_edi_transaction()
         return attachments
+
+    @api.model
+    def _store_file(self, local_path):
+        """
+        This method is used to store downloaded file into filestore in fixed size blocks, without reading it
+        into memory. Returns attachment values of the stored file, or raw content when attachments are stored
+        in database.
+        Author: DG
+        """
+        attachment_obj = self.env['ir.attachment'].sudo()
+        if attachment_obj._storage() != 'file':
+            with open(local_path, 'rb') as fp:
+                return {'raw': fp.read()}
+        digest = hashlib.sha1()
+        with open(local_path, 'rb') as fp:
+            for block in iter(lambda: fp.read(FILESTORE_BLOCK_SIZE), b''):
+                digest.update(block)
+        checksum = digest.hexdigest()
+        fname, full_path = attachment_obj._get_path(b'', checksum)
+        if not os.path.exists(full_path):
+            # Copied under a temporary name & renamed, so other workers never see a half written file.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(full_path), prefix='.edi_')
+            try:
+                with os.fdopen(fd, 'wb') as target, open(local_path, 'rb') as source:
+                    for block in iter(lambda: source.read(FILESTORE_BLOCK_SIZE), b''):
+                        target.write(block)
+                os.replace(tmp_path, full_path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            attachment_obj._mark_for_gc(fname)
+        return {'store_fname': fname, 'checksum': checksum, 'file_size': os.path.getsize(local_path)}
+
+    @api.model
+    def _prepare_values_from_file(self, local_path, file_name, errors='ignore'):
+        """
+        This method is used to prepare attachment values of downloaded file: file goes to filestore in blocks &
+        XML content is read once as text for import, without keeping raw bytes beside it.
+        Author: DG
+        """
+        if ("xml" in file_name) or ("tmp" in file_name):
+            with open(local_path, 'r', encoding='utf-8', errors=errors) as fp:
+                file_content = fp.read()
+        else:
+            with open(local_path, 'rb') as fp:
+                file_content = base64.b64encode(fp.read())
+        values = self._store_file(local_path)
+        values['file_content'] = file_content
+        return values
+
+    def _get_edi_config_table(self):
+        """
+        This method is used to find mapping table of the attachment, by root tag of its XML content
+        when directory searches mapping table using XML header, otherwise from directory.
+        Author: DG
+        """
+        self.ensure_one()
+        directory = self.ftp_list_id
+        if directory and directory.download_this and directory.mapping_table_search_using_xml_header:
+            xml_header = sniff_xml_root_tag(self.file_content)
+            edi_config_table_id = self.env['edi.config.table']._get_config_by_xml_header(xml_header)
+            if not edi_config_table_id:
+                _logger.info("Using XML header [{}] mapping table not found.".format(xml_header))
+            return edi_config_table_id
+        if directory.edi_config_table_id and directory.edi_config_table_id.edi_type == "Incoming":
+            return directory.edi_config_table_id
+        return self.env['edi.config.table']
+
+    def _create_edi_transaction(self):
+        """
+        This method is used to create EDI transaction of the attachment, if it has a mapping table
+        & transaction is not created yet.
+        Author: DG
+        """
+        self.ensure_one()
+        edi_transaction = self.env["edi.transactions"]
+        edi_config_table_id = self._get_edi_config_table()
+        if edi_config_table_id and not edi_transaction.search([('name', '=', self.name)], limit=1):
+            edi_transaction.create(
+                {
+                    "name": self.name,
+                    "edi_type": edi_config_table_id.edi_type,
+                    "edi_config_table_id": edi_config_table_id.id,
+                    "ftp_attachment_id": self.id,
+                    "xml_content": self.file_content,
+                    "edi_partner_id": self.ftp_list_id.partner_id and self.ftp_list_id.partner_id.id or False,
+                }
+            )
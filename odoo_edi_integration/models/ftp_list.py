@@ -1,5 +1,8 @@
-from odoo import models, fields
+import os
+import time
+from odoo import api, models, fields
 from odoo.exceptions import ValidationError
+from .edi_tools import EDIRunBudget
 
 
 class FtpDirectory(models.Model):
@@ -77,49 +80,167 @@ class FtpDirectory(models.Model):
         default=False,
         copy=False
     )
+    files_per_commit = fields.Integer(
+        string="Commit Every N Files",
+        default=20,
+        help="Downloaded files are committed after every N files instead of after each file."
+    )
+    stability_check = fields.Selection(
+        selection=[
+            ('none', 'No Check'),
+            ('two_listings', 'Unchanged Across Two Listings'),
+            ('age', 'Unchanged For N Seconds'),
+            ('marker', 'Marker File Present'),
+        ],
+        string="Stable File Check",
+        default='none',
+        required=True,
+        help="Files which partner may still be writing are not downloaded until they are stable:\n"
+             "- Unchanged Across Two Listings: size & modification time are same as in previous sync.\n"
+             "- Unchanged For N Seconds: size & modification time didn't change for the given seconds.\n"
+             "- Marker File Present: a companion marker file (e.g. invoice.xml.done) exists."
+    )
+    stability_seconds = fields.Integer(
+        string="Stable After (Seconds)",
+        default=60
+    )
+    stability_marker_suffixes = fields.Char(
+        string="Marker Suffixes",
+        default=".done,.ok",
+        help="Comma separated suffixes of marker files, added to the full file name or to the name without extension."
+    )
+    stability_snapshot = fields.Json(
+        string="Stable File Snapshot",
+        copy=False,
+        help="Size & modification time of not yet downloaded files seen in last listing, with time they were first seen."
+    )
 
-    def create_cron(self):
+    def _is_marked_stable(self, name, listed_names):
         """
-        This method is used to create cron directory wise from button.
+        This method is used to check whether a marker file of the file exists in the listing.
         Author: DG
         """
-        code_method = 'model.sync_inner_files_directory_wise({0})'.format(self.id)
-        existing_cron = self.env['ir.cron'].search([('code', '=', code_method), ('active', 'in', [True, False])],
-                                                   limit=1)
-        if self.ftp_syncing_id:
-            name = self.ftp_syncing_id.name
-        else:
-            name = self.sftp_syncing_id.name
-        if existing_cron:
-            existing_cron.name = "EDI [{0}] Directory: [{1}] Sync Inner Files Directory Wise".format(
-                name, self.name)
-            return True
-        cron_name = "EDI [{0}] Directory: [{1}] Sync Inner Files Directory Wise".format(
-                name, self.name)
-        model_name = 'ftp.list'
-        if self.ftp_syncing_id:
-            self.ftp_syncing_id.create_cron_for_automation_task(cron_name, model_name, code_method,
-                                                 interval_type='minutes', interval_number=40,
-                                                 nextcall_timegap_minutes=20)
+        suffixes = [suffix.strip() for suffix in (self.stability_marker_suffixes or '').split(',') if suffix.strip()]
+        base_name = name.rsplit('.', 1)[0]
+        return any(name + suffix in listed_names or base_name + suffix in listed_names for suffix in suffixes)
+
+    def _filter_stable_files(self, files, file_facts, destination):
+        """
+        This method is used to keep only files which are completely written by the partner, as per stable file check.
+        file_facts is listing of the directory, file name => (size, modification time).
+        Files which are already downloaded from destination are kept without check & not tracked.
+        Snapshot of other listed files is stored, so next sync can compare with it; names which are not listed
+        anymore are dropped from it & it's written only when something changed.
+        Author: DG
+        """
+        self.ensure_one()
+        if self.stability_check == 'none':
+            return files
+        downloaded_names = set()
+        if not self.daily_new_file:
+            # With daily new file, a downloaded name is downloaded again as new file, so it's checked too.
+            downloaded_names = set(self.env['ftp.attachment'].search([
+                ('ftp_list_id', '=', self.id),
+                ('name', 'in', [os.path.join(destination, name).strip() for name in files]),
+            ]).mapped('name'))
+        new_files = [name for name in files if os.path.join(destination, name).strip() not in downloaded_names]
+
+        stable_files = set()
+        if self.stability_check == 'marker':
+            listed_names = set(file_facts)
+            stable_files = {name for name in new_files if self._is_marked_stable(name, listed_names)}
         else:
-            self.sftp_syncing_id.create_cron_for_automation_task(cron_name, model_name, code_method,
-                                                                interval_type='minutes', interval_number=40,
-                                                                nextcall_timegap_minutes=20)
+            now = time.time()
+            snapshot = self.stability_snapshot or {}
+            new_snapshot = {}
+            for name in new_files:
+                size, mtime = file_facts.get(name, (None, None))
+                previous = snapshot.get(name)
+                if previous and previous[0] == size and previous[1] == mtime:
+                    first_seen = previous[2]
+                else:
+                    previous, first_seen = None, now
+                if self.stability_check == 'two_listings':
+                    is_stable = bool(previous)
+                else:
+                    # Uploaders may keep an old modification time, so time since first unchanged listing counts too.
+                    is_stable = now - max(first_seen, mtime or 0) >= self.stability_seconds
+                if is_stable:
+                    stable_files.add(name)
+                # Stable files are kept in snapshot, so they stay stable until they are downloaded.
+                new_snapshot[name] = [size, mtime, first_seen]
+            if new_snapshot != snapshot:
+                self.stability_snapshot = new_snapshot
+        new_names = set(new_files)
+        return [name for name in files if name in stable_files or name not in new_names]
+
+    @api.model
+    def _reconcile_server_directories(self, server, remote_directories, crawler=None, complete=True):
+        """
+        This method is used to make directory records of a server same as its remote directories,
+        with one read of existing names, one multi create & one unlink, only for this server's directories.
+        In incremental mode (crawler is given), nothing is read or written when crawl found no changed directory
+        & count of records is same as remote directories.
+        When remote directories are not complete (listing of some directory failed), records are only created,
+        as missing directories may still exist on the server.
+        Author: DG
+        """
+        server_field = 'ftp_syncing_id' if server._name == 'ftp.syncing' else 'sftp_syncing_id'
+        server_domain = [(server_field, '=', server.id)]
+        remote_directories = set(remote_directories)
+        if crawler is not None and crawler.cache and not crawler.changed_directories \
+                and self.search_count(server_domain) == len(remote_directories):
+            return False
+
+        existing_directories = self.search_read(server_domain, ['name'])
+        existing_names = {directory['name'] for directory in existing_directories}
+        self.create([{
+            'name': name,
+            server_field: server.id,
+            'server_type': 'ftp' if server._name == 'ftp.syncing' else 'sftp',
+        } for name in sorted(remote_directories - existing_names)])
+
+        # If any extra directory/old directory is still there in Odoo, then we find out & unlink it.
+        obsolete_ids = [directory['id'] for directory in existing_directories
+                        if directory['name'] not in remote_directories]
+        if obsolete_ids and complete:
+            self.browse(obsolete_ids).unlink()
+        return True
+
+    def create_cron(self):
+        """
+        This method is used to create sync schedule directory wise from button,
+        schedule is run by the EDI dispatcher cron.
+        Author: DG
+        """
+        self.env['edi.schedule']._ensure_schedule(directory=self)
         self.cron_created = True
         return True
 
-    def sync_inner_files_directory_wise(self, directory_id):
+    def _sync_inner_files(self, budget=None):
+        """
+        This method is used to sync inner files of this directory from its FTP/SFTP server.
+        It returns False when the budget is used up before all files are downloaded.
+        Author: DG
+        """
+        self.ensure_one()
+        if not self.download_this:
+            raise ValidationError("You need to enable download configuration for this directory.")
+        if self.ftp_syncing_id:
+            return self.ftp_syncing_id.sync_inner_files(ftp_list_obj=self, budget=budget)
+        return self.sftp_syncing_id.sync_sftp_inner_files(sftp_list_obj=self, budget=budget)
+
+    def sync_inner_files_directory_wise(self, directory_id, time_budget=None, item_budget=None):
         """
         This method is used to sync inner files Directory wise from FTP folders.
+        If time/item budget is used up before all files are downloaded, then schedule of the directory is made due
+        & the schedule dispatcher is triggered again, as per directory crons are replaced by schedules.
         Author: DG
         """
         if directory_id:
             self = self.browse(directory_id)
         self.ensure_one()
-        if self.download_this:
-            if self.ftp_syncing_id:
-                self.ftp_syncing_id.sync_inner_files(ftp_list_obj=self)
-            else:
-                self.sftp_syncing_id.sync_sftp_inner_files(sftp_list_obj=self)
-        else:
-            raise ValidationError("You need to enable download configuration for this directory.")
+        budget = EDIRunBudget(time_budget=time_budget, item_budget=item_budget)
+        if self._sync_inner_files(budget) is False:
+            self.env['edi.schedule']._ensure_schedule(directory=self).next_run = fields.Datetime.now()
+            budget.reschedule(self.env, cron_xml_id='odoo_edi_integration.edi_schedule_dispatcher_cronjob')
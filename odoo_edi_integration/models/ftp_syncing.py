@@ -1,13 +1,14 @@
 import logging
 import os
 import ftplib
-import xmltodict
 import tempfile
 from odoo import api, fields, models, _
 from datetime import datetime, timedelta
-import base64
 from odoo.exceptions import UserError, ValidationError
 from lxml import etree
+from .edi_tools import server_session, close_connection, sync_directories_in_parallel, advisory_lock, \
+    DIRECTORY_LOCK_NAMESPACE, SERVER_LOCK_NAMESPACE, server_sessions, scratch_directory, SESSION_TEST_TIMEOUT
+from .edi_crawler import RemoteTreeCrawler, list_ftp_subdirectories, ftp_directory_mtime, list_ftp_files
 
 _logger = logging.getLogger(__name__)
 
@@ -48,6 +49,36 @@ class FTPSyncing(models.Model):
         string="DIRECTORY LISTS",
         auto_join=True
     )
+    max_sessions = fields.Integer(
+        string="Max Sessions",
+        default=2,
+        help="Maximum number of connections opened at the same time to this server by the EDI scheduler."
+    )
+    lock_server_sync = fields.Boolean(
+        string="One Sync at a Time",
+        default=False,
+        help="If enabled, a sync of this server is skipped while another sync of it is running. "
+             "A directory is never synced twice at the same time in any case."
+    )
+    crawl_max_depth = fields.Integer(
+        string="Directory Depth Limit",
+        default=0,
+        help="Sub directories deeper than this level are not fetched, 0 means no limit."
+    )
+    crawl_exclude_patterns = fields.Char(
+        string="Exclude Directories",
+        help="Comma separated patterns of directory names or paths which are not fetched, e.g. archive,*/backup*"
+    )
+    directory_tree_cache = fields.Json(
+        string="Directory Tree Cache",
+        copy=False,
+        help="Last fetched directory tree with modification time of each directory."
+    )
+    incremental_directory_sync = fields.Boolean(
+        string="Incremental Directory Sync",
+        default=True,
+        help="If enabled, directory records are updated only when fetched directory tree is changed since last sync."
+    )
 
     def check_ftp_connection(self):
         """
@@ -62,7 +93,7 @@ class FTPSyncing(models.Model):
             return f
         except Exception as e:
             if not self._context.get('ftp_password'):
-                raise UserError(_("FTP Connection Test Failed! Here is what we got instead:\n %s") % (e))
+                raise UserError(_("FTP Connection Test Failed! Here is what we got instead:\n %s") % (e)) from e
 
     def action_check_ftp_disconnect(self):
         """
@@ -77,7 +108,9 @@ class FTPSyncing(models.Model):
         Author: DG
         """
         try:
-            self.check_ftp_connection()
+            # Test connection is counted in server's session slots too, & it's closed right after the test.
+            with server_session(self, timeout=SESSION_TEST_TIMEOUT):
+                close_connection(self.check_ftp_connection())
             # title = _("Connection Test Succeeded!")
             # message = _("Everything seems properly set up!")
             self.with_context({'is_check_connection_from_write': True}).write({'is_verified': True})
@@ -116,18 +149,10 @@ class FTPSyncing(models.Model):
 
     def setup_sync_inner_files_cron(self):
         """
-        From this method fetch inner files cron creation process declared.
-        """
-        code_method = 'model.sync_inner_files({0})'.format(self.id)
-        existing_cron = self.env['ir.cron'].search([('code', '=', code_method), ('active', 'in', [True, False])], limit=1)
-        if existing_cron:
-            existing_cron.name = "EDI: [{0}] Sync Inner Files from FTP".format(self.name)
-            return True
-        cron_name = "EDI: [{0}] Sync Inner Files from FTP".format(self.name)
-        model_name = 'ftp.syncing'
-        self.create_cron_for_automation_task(cron_name, model_name, code_method,
-                                             interval_type='minutes', interval_number=40,
-                                             nextcall_timegap_minutes=20)
+        From this method fetch inner files schedule creation process declared,
+        schedule is run by the EDI dispatcher cron instead of a cron per server.
+        """
+        self.env['edi.schedule']._ensure_schedule(server=self)
         return True
 
     @api.model_create_multi
@@ -154,93 +179,66 @@ class FTPSyncing(models.Model):
                 rec.setup_sync_inner_files_cron()
         return res
 
+    def _get_crawl_exclude_patterns(self):
+        """
+        This method is used to get list of exclude patterns of directory crawler.
+        Author: DG
+        """
+        return (self.crawl_exclude_patterns or '').split(',')
+
     def fetch_directories(self, ftp, path='/'):
         """
-        Recursively fetch root directories and subdirectories from the given FTP path.
+        Fetch root directories and subdirectories from the given FTP path, breadth first on the given connection.
         Author: DG
         """
-        directories = []
-        try:
-            _logger.info(f"Fetching directories under: {path}")
-            ftp.encoding = 'latin-1'
-            is_nlst = False
+        crawler = RemoteTreeCrawler([ftp], list_ftp_subdirectories, ftp_directory_mtime,
+                                    max_depth=self.crawl_max_depth,
+                                    exclude_patterns=self._get_crawl_exclude_patterns())
+        return crawler.crawl(path)
 
+    def _crawl_directory_tree(self, ftp, path='/'):
+        """
+        This method is used to fetch directory tree with extra pooled connections (as per free session slots)
+        & with cached listing of unchanged directories. Returns the crawler, its cache is stored on server.
+        Author: DG
+        """
+        with server_sessions(self, self.max_sessions - 1, blocking=False) as extra_sessions:
+            connections = [ftp]
             try:
-                entries = list(ftp.mlsd(path))  # Ensure entries is a list
-            except Exception as e:
-                _logger.info(f"MLSD failed, falling back to NLST.\n{e}")
-                is_nlst = True
-                try:
-                    entries = [(name, {}) for name in ftp.nlst(path)]  # Convert NLST result to MLSD-like format
-                except Exception as e:
-                    _logger.error(f"Failed to list directories using MLSD & NLST: {e}")
-                    return []
-
-            if not isinstance(entries, list):  # Ensure entries is iterable
-                _logger.error(f"Unexpected response type from FTP: {type(entries)}")
-                return []
-
-            for entry in entries:
-                if not isinstance(entry, tuple) or len(entry) != 2:
-                    _logger.warning(f"Skipping unexpected entry format: {entry}")
-                    continue  # Skip malformed entries
-
-                name, facts = entry
-
-                # Set entry_path based on whether MLSD or NLST was used
-                if is_nlst:
-                    entry_path = name  # NLST returns full path, no need to modify
-                else:
-                    entry_path = f"{path}/{name}".replace('//', '/')  # Ensure correct formatting for MLSD
-
-                is_directory = facts.get('type') == 'dir' if facts else True  # Assume NLST entries are directories
-
-                if is_directory:
-                    try:
-                        _logger.info(f"Trying to enter: {entry_path}")
-                        ftp.cwd(entry_path)  # Confirm it's a directory
-                        _logger.info(f"Found directory: {entry_path}")
-                        directories.append(entry_path)
-
-                        # Recursively fetch subdirectories
-                        directories.extend(self.fetch_directories(ftp, entry_path))
-
-                        ftp.cwd('..')  # Move back up after recursion
-                    except Exception as e:
-                        _logger.warning(f"Skipping {entry_path}: {e}")
-
-        except Exception as e:
-            _logger.error(f"Unexpected error while accessing {path}: {e}")
-
-        return directories
+                for _index in range(extra_sessions):
+                    connections.append(self.check_ftp_connection())
+                crawler = RemoteTreeCrawler(connections, list_ftp_subdirectories, ftp_directory_mtime,
+                                            max_depth=self.crawl_max_depth,
+                                            exclude_patterns=self._get_crawl_exclude_patterns(),
+                                            cache=self.directory_tree_cache)
+                crawler.crawl(path)
+            finally:
+                for connection in connections[1:]:
+                    close_connection(connection)
+        self.with_context(is_check_connection_from_write=True).write({'directory_tree_cache': crawler.new_cache})
+        return crawler
 
     def ftp_fetch_directory(self, ftp):
         """
-        This method is used to check connection at the time of write record of FTP Syncing.
+        This method is used to sync FTP directories with Odoo records.
+        With incremental directory sync, records are reconciled only when crawl found changes.
         Author: DG
         """
-        mlsd_directory = self.fetch_directories(ftp, '/')
-        _logger.info(f"Final directory list: {mlsd_directory}")  # Debugging output
-
-        for subdir in sorted(mlsd_directory):
-            if not self.env["ftp.list"].search([("name", "=", subdir), ("ftp_syncing_id", "=", self.id)]):
-                self.env["ftp.list"].create({"name": subdir, "ftp_syncing_id": self.id, "server_type": 'ftp'})
+        crawler = self._crawl_directory_tree(ftp, '/')
+        _logger.info(f"Final directory list: {crawler.directories}")  # Debugging output
+        self.env["ftp.list"]._reconcile_server_directories(
+            self, crawler.directories, crawler=crawler if self.incremental_directory_sync else None,
+            complete=not crawler.failed_directories)
 
-        # If any extra directory/old directory is still there in Odoo, then we find out & unlink it.
-        difference_result = []
-        for item in self.mapped("ftp_directory_ids.name"):
-            if item not in sorted(mlsd_directory):
-                difference_result.append(item)
-        if difference_result:
-            for directory in difference_result:
-                self.env['ftp.list'].search([('name', '=', directory)]).unlink()
-
-    def ftp_attachment_create(self, destination, ftp, ftp_folder):
+    def ftp_attachment_create(self, destination, ftp, ftp_folder, budget=None, scratch_dir=None):
         """
         This method is used to create FTP attachment from FTP files.
+        When budget is given, it returns False if the budget is used up before all files are downloaded.
+        Local files of the job are written in scratch_dir, which is owned & removed by the caller.
         Author: DG
         """
         self.ensure_one()
+        scratch_dir = scratch_dir or tempfile.gettempdir()
         ftp_attach = self.env["ftp.attachment"]
         ftp.cwd(destination)
 
@@ -249,6 +247,9 @@ class FTPSyncing(models.Model):
         valid_extensions = {'.xml'}
         files = [file for file in files if
                  file not in {'.', '..'} and any(file.endswith(ext) for ext in valid_extensions)]
+        if ftp_folder and ftp_folder.stability_check != 'none':
+            # Files which partner is still writing are left for a next sync.
+            files = ftp_folder._filter_stable_files(files, list_ftp_files(ftp, destination), destination)
 
         ftp_split = False
         if ftp_folder and ftp_folder.split_records:
@@ -271,18 +272,18 @@ class FTPSyncing(models.Model):
 
             split_matched_files = []
             for file in files:
-                local_file = os.path.join(tempfile.gettempdir(), file)
+                local_file = os.path.join(scratch_dir, file)
                 with open(local_file, 'wb') as f:
                     ftp.retrbinary(f"RETR {original_path}/{file}", f.write)
                 _logger.info(f"Downloaded file: {file}")
 
                 # From the original file create parts if records more than 2000.
-                split_files = self.split_xml_file(local_file, split_tag, 2000)
+                split_files = self.split_xml_file(local_file, split_tag, 2000, output_dir=scratch_dir)
 
                 for split_file in split_files:
                     # Uploads a local file which is divided into parts to the FTP server inside split folder.
                     self.upload_ftp_file(ftp, split_file, f"{original_path}/{split_dir}")
-                    split_matched_files.append(split_file.lstrip('/tmp/'))
+                    split_matched_files.append(os.path.basename(split_file))
 
                 # Remove the original file inside tmp folder.
                 os.remove(local_file)
@@ -292,7 +293,8 @@ class FTPSyncing(models.Model):
             files = split_matched_files  # Update matched_files
             _logger.info("New matched files => {}".format(split_matched_files))
 
-        for name in files:
+        files_per_commit = ftp_folder.files_per_commit or 1
+        for file_index, name in enumerate(files, 1):
             file_name = os.path.join(destination, name)
             match_attach_rec = ftp_attach.search(
                 [("name", "=", file_name.strip()), ("ftp_list_id", "=", ftp_folder.id)], limit=1)
@@ -307,26 +309,24 @@ class FTPSyncing(models.Model):
                     file_name = os.path.join(destination, f_name)
                     match_attach_rec = None
 
-            local_file = os.path.join(tempfile.gettempdir(), name)
+            local_file = os.path.join(scratch_dir, name)
+            transfer = self.env["edi.partial.transfer"]
             if not ftp_split:
-                with open(local_file, 'wb') as f:
-                    ftp.retrbinary(f"RETR {destination}/{name}", f.write)
-            with open(local_file, 'rb') as fp:
-                file_data = fp.read()
+                # Interrupted download is resumed from its partial file on next sync.
+                transfer, local_file = transfer.download_ftp(self, ftp, f"{destination}/{name}")
+            if not match_attach_rec:
                 attachment_value = {
                     "name": file_name,
                     "res_model": "ftp.syncing",
                     "public": True,
                     "ftp_list_id": ftp_folder.id,
                     "sync_date": fields.Datetime.now(),
-                    "file_content": file_data.decode("utf-8", errors="ignore") if ("xml" in file_name) or (
-                            "tmp" in file_name) else base64.b64encode(file_data),
-                    "datas": base64.b64encode(file_data),
                 }
-
-            if not match_attach_rec:
+                # File is copied into filestore in blocks, only XML text is read for import.
+                attachment_value.update(ftp_attach._prepare_values_from_file(local_file, file_name))
                 try:
-                    ftp_attach.create(attachment_value)
+                    with self.env.cr.savepoint():
+                        ftp_attach.create(attachment_value)
                 except Exception as error:
                     _logger.info("Something went wrong at the time of creating attachment => {}".format(error))
                     attachment_value.update({"file_content": ""})
@@ -334,33 +334,18 @@ class FTPSyncing(models.Model):
                 _logger.info(_("Created the attachment %s") % file_name)
             else:
                 # If attachment already exists and if EDI transaction not created, so below process will create it.
-                edi_transaction = self.env["edi.transactions"]
-                edi_config_table_id = self.env['edi.config.table']
-                if match_attach_rec.ftp_list_id and match_attach_rec.ftp_list_id.download_this and match_attach_rec.ftp_list_id.mapping_table_search_using_xml_header:
-                    python_dict = xmltodict.parse(match_attach_rec.file_content)
-                    xml_header = ''
-                    for key, value in python_dict.items():
-                        xml_header = key
-                    if xml_header:
-                        edi_config_table_id = self.env['edi.config.table'].search([('xml_header', '=', xml_header)],
-                                                                                  limit=1)
-                    if not edi_config_table_id:
-                        _logger.info("Using XML header [{}] mapping table not found.".format(xml_header))
-                elif match_attach_rec.ftp_list_id.edi_config_table_id and match_attach_rec.ftp_list_id.edi_config_table_id.edi_type == "Incoming":
-                    edi_config_table_id = match_attach_rec.ftp_list_id.edi_config_table_id
-
-                if edi_config_table_id and not edi_transaction.search([('name', '=', match_attach_rec.name)]):
-                    edi_transaction.create(
-                        {
-                            "name": match_attach_rec.name,
-                            "edi_type": edi_config_table_id.edi_type,
-                            "edi_config_table_id": edi_config_table_id.id,
-                            "ftp_attachment_id": match_attach_rec.id,
-                            "xml_content": match_attach_rec.file_content,
-                            "edi_partner_id": match_attach_rec.ftp_list_id.partner_id and match_attach_rec.ftp_list_id.partner_id.id or False,
-                        }
-                    )
-            self._cr.commit()
+                match_attach_rec._create_edi_transaction()
+            transfer._finish()
+            if file_index % files_per_commit == 0:
+                self._cr.commit()
+            # Renamed daily files & split parts can't be resumed safely, so those directories are not yielded.
+            if budget and not ftp_split and not ftp_folder.daily_new_file:
+                budget.consume()
+                if budget.exhausted():
+                    self._cr.commit()
+                    return False
+        self._cr.commit()
+        return True
 
     def sync_directory(self):
         """
@@ -369,20 +354,46 @@ class FTPSyncing(models.Model):
         """
         self.ensure_one()
         try:
-            ftp = self.check_ftp_connection()
-            self.ftp_fetch_directory(ftp)
+            with server_session(self):
+                ftp = self.check_ftp_connection()
+                try:
+                    self.ftp_fetch_directory(ftp)
+                finally:
+                    close_connection(ftp)
         except Exception as e:
             raise ValidationError("Something went wrong \n {}".format(e))
 
-    def sync_inner_files(self, ftp_sync_id=False, ftp_list_obj= False):
+    def _sync_directory_files(self, ftp_folder, budget=None):
+        """
+        This method is used to sync inner files of one directory on its own FTP connection.
+        Directory is locked with advisory lock, if it's already being synced then it's skipped.
+        Author: DG
+        """
+        self.ensure_one()
+        with advisory_lock(self._cr, DIRECTORY_LOCK_NAMESPACE, ftp_folder.id) as acquired:
+            if not acquired:
+                _logger.info("Directory [{}] is already being synced, skipped.".format(ftp_folder.name))
+                return True
+            with server_session(self), scratch_directory(self.env, 'edi_ftp_') as scratch_dir:
+                ftp = self.check_ftp_connection()
+                try:
+                    return self.ftp_attachment_create(ftp_folder.name, ftp, ftp_folder, budget=budget,
+                                                      scratch_dir=scratch_dir)
+                except Exception as e:
+                    raise ValidationError("Something went wrong \n {}".format(e))
+                finally:
+                    close_connection(ftp)
+
+    def sync_inner_files(self, ftp_sync_id=False, ftp_list_obj=False, budget=None):
         """
         This method is used to sync inner files from FTP folders.
+        When more than one directory is synced & server allows more sessions, directories are synced concurrently.
+        It returns False when the budget is used up before all directories are synced.
         Author: DG
         """
         if ftp_sync_id:
             self = self.browse(ftp_sync_id)
         self.ensure_one()
-        ftp = self.check_ftp_connection()
         if not ftp_list_obj:
             ftp_list_obj = self.ftp_directory_ids.filtered(lambda x: x.download_this)
         is_edi_config_table = ftp_list_obj.filtered(
@@ -390,12 +401,26 @@ class FTPSyncing(models.Model):
         if is_edi_config_table:
             raise ValidationError("Mapping table not set on these directories %s" % (is_edi_config_table.mapped('name')))
 
+        if not self.lock_server_sync:
+            return self._sync_directories(ftp_list_obj, budget=budget)
+        with advisory_lock(self._cr, SERVER_LOCK_NAMESPACE[self._name], self.id) as acquired:
+            if not acquired:
+                _logger.info("FTP [{}] is already being synced, skipped.".format(self.name))
+                return True
+            return self._sync_directories(ftp_list_obj, budget=budget)
+
+    def _sync_directories(self, ftp_list_obj, budget=None):
+        """
+        This method is used to sync given directories, concurrently when server allows more sessions.
+        Author: DG
+        """
         # Find out directories in which a download option configured, based on those directories fetch inner files of it.
+        if len(ftp_list_obj) > 1 and self.max_sessions > 1:
+            return sync_directories_in_parallel(self, ftp_list_obj, budget, '_sync_directory_files')
         for ftp_folder in ftp_list_obj:
-            try:
-                self.ftp_attachment_create(ftp_folder.name, ftp, ftp_folder)
-            except Exception as e:
-                raise ValidationError("Something went wrong \n {}".format(e))
+            if self._sync_directory_files(ftp_folder, budget=budget) is False:
+                return False
+        return True
 
     def get_root_hierarchy(self, file_path, split_tag):
         """
@@ -410,10 +435,10 @@ class FTPSyncing(models.Model):
                 return "/".join(hierarchy[:-1])  # Exclude the split_tag itself
         return None
 
-    def split_xml_file(self, file_path, split_tag, records_per_file):
+    def split_xml_file(self, file_path, split_tag, records_per_file, output_dir=None):
         """
         Splits an XML file dynamically while preserving the root structure.
-        Handles cases where root structure may vary.
+        Handles cases where root structure may vary. Parts are written in output_dir, system temp by default.
         Author: DG
         """
         # Determine the root hierarchy dynamically
@@ -446,7 +471,7 @@ class FTPSyncing(models.Model):
                         current_file.close()
 
                     split_filename = f"{os.path.basename(file_path.rsplit('.', 1)[0])}_part{file_index}.xml"
-                    split_filepath = os.path.join(tempfile.gettempdir(), split_filename)
+                    split_filepath = os.path.join(output_dir or tempfile.gettempdir(), split_filename)
 
                     # Open a new file and write the XML header and root structure dynamically
                     current_file = open(split_filepath, "wb")
@@ -1,4 +1,4 @@
-from odoo import models, fields
+from odoo import api, models, fields
 
 
 class IrCron(models.Model):
@@ -14,3 +14,14 @@ class IrCron(models.Model):
         string='SFTP',
         ondelete="cascade"
     )
+
+    @api.model
+    def trigger_edi_cron(self, cron_xml_id):
+        """
+        This method is used to trigger EDI scheduled action of given XML ID again as soon as possible.
+        Author: DG
+        """
+        cron = self.env.ref(cron_xml_id, raise_if_not_found=False)
+        if cron and cron.active:
+            cron._trigger()
+        return bool(cron)
@@ -0,0 +1,25 @@
+from odoo import models, api
+
+
+class IrModelFieldsSelection(models.Model):
+    _inherit = 'ir.model.fields.selection'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        This method is used to drop cached selection maps of EDI mapping lines, when selection values are added.
+        Author: DG
+        """
+        res = super(IrModelFieldsSelection, self).create(vals_list)
+        self.env.registry.clear_cache()
+        return res
+
+    def write(self, vals):
+        res = super(IrModelFieldsSelection, self).write(vals)
+        self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super(IrModelFieldsSelection, self).unlink()
+        self.env.registry.clear_cache()
+        return res
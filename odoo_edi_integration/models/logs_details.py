@@ -1,7 +1,77 @@
 import datetime
+import csv
+import gzip
+import io
+import logging
 from odoo import models, fields, api
 from datetime import datetime, timedelta
 
+_logger = logging.getLogger(__name__)
+
+
+def reserve_sequence_names(sequence, count):
+    """
+    This method is used to get next names of a sequence for multiple records together.
+    For standard sequence all numbers are reserved with one query, otherwise it falls back to next_by_id.
+    Author: DG
+    """
+    if not sequence:
+        return ['/'] * count
+    if sequence.implementation == 'standard' and not sequence.use_date_range:
+        sequence._cr.execute("SELECT nextval('ir_sequence_%03d') FROM generate_series(1, %%s)" % sequence.id,
+                             (count,))
+        return [sequence.get_next_char(row[0]) for row in sequence._cr.fetchall()]
+    return [sequence.next_by_id() for i in range(count)]
+
+
+class EDILogBuffer:
+    """
+    This class is used to collect log messages of one EDI run in memory.
+    Same message of multiple records is aggregated into one log line & lines are created together on flush.
+    Author: DG
+    """
+    max_rows_in_message = 20
+
+    def __init__(self, main_log, fault_operation=True):
+        self.main_log = main_log
+        self.fault_operation = fault_operation
+        self.pending = {}
+        self.logged = False
+
+    def add(self, log_message, row=False, fault_operation=None):
+        """
+        This method is used to add log message, row is the record number of the file for which message is logged.
+        Author: DG
+        """
+        if fault_operation is None:
+            fault_operation = self.fault_operation
+        rows = self.pending.setdefault((log_message, fault_operation), [])
+        if row:
+            rows.append(row)
+
+    def flush(self):
+        """
+        This method is used to create all collected log lines with one multi-create.
+        Author: DG
+        """
+        if not self.pending:
+            return
+        vals_list = []
+        for (log_message, fault_operation), rows in self.pending.items():
+            if rows:
+                shown_rows = ", ".join(str(row) for row in rows[:self.max_rows_in_message])
+                if len(rows) > self.max_rows_in_message:
+                    shown_rows += " and %s more" % (len(rows) - self.max_rows_in_message)
+                log_message = "%s (Record: %s)" % (log_message, shown_rows)
+            vals_list.append({
+                'log_message': log_message,
+                'log_id': self.main_log and self.main_log.id,
+                'fault_operation': fault_operation
+            })
+        self.main_log.env['log.book.lines'].create(vals_list)
+        self.pending = {}
+        self.logged = True
+
 
 class LogBook(models.Model):
     _name = "log.book"
@@ -28,24 +98,112 @@ class LogBook(models.Model):
     def create(self, vals_list):
         """
         This method is used to provide sequence name & company in created record.
+        Sequence names of all records are reserved together.
         Author: DG
         """
-        for vals in vals_list:
-            sequence = self.env.ref("odoo_edi_integration.seq_edi_log_main_log")
-            name = sequence and sequence.next_by_id() or '/'
-            company_id = self._context.get('company_id', self.env.user.company_id.id)
+        sequence = self.env.ref("odoo_edi_integration.seq_edi_log_main_log")
+        names = reserve_sequence_names(sequence, len(vals_list))
+        company_id = self._context.get('company_id', self.env.user.company_id.id)
+        for vals, name in zip(vals_list, names):
             if type(vals) == dict:
-                vals.update({'name': name, 'company_id': company_id})
+                vals.update({'name': name or '/', 'company_id': company_id})
         return super(LogBook, self).create(vals_list)
 
     def auto_delete_log_message(self):
         """
-        This method is used to auto delete log messages through cron process which are older than 13 days.
+        This method is used to auto delete log messages through cron process as per company's retention configuration.
+        Fault & non-fault log lines have separate retention, those are deleted in committed batches with set-based
+        deletes, then main logs which don't have any line are deleted.
+        Author: DG
+        """
+        companies = self.env['res.company'].sudo().search([])
+        for company in companies:
+            # Logs without company are purged with first company's configuration.
+            with_empty_company = company == companies[:1]
+            fault_cutoff = datetime.now() - timedelta(days=company.edi_fault_log_retention_days)
+            non_fault_cutoff = datetime.now() - timedelta(days=company.edi_log_retention_days)
+            self._purge_log_lines(company, with_empty_company, "fault_operation IS TRUE", fault_cutoff)
+            self._purge_log_lines(company, with_empty_company, "fault_operation IS NOT TRUE", non_fault_cutoff)
+            self._purge_empty_logs(company, with_empty_company, min(fault_cutoff, non_fault_cutoff))
+
+    def _purge_log_lines(self, company, with_empty_company, level_condition, cutoff):
+        """
+        This method is used to delete log lines of a company older than cutoff in committed batches.
+        Author: DG
+        """
+        batch_size = company.edi_log_purge_batch_size or 5000
+        while True:
+            self._cr.execute("""
+                DELETE FROM log_book_lines WHERE id IN (
+                    SELECT id FROM log_book_lines
+                     WHERE (company_id = %s OR (company_id IS NULL AND %s))
+                       AND {} AND create_date < %s
+                     LIMIT %s
+                )
+                RETURNING id, name, log_id, fault_operation, log_message, create_date
+            """.format(level_condition), (company.id, with_empty_company, cutoff, batch_size))
+            rows = self._cr.fetchall()
+            if not rows:
+                break
+            if company.edi_log_archive_before_purge:
+                self._archive_purged_rows(company, 'log.book.lines',
+                                          ['id', 'name', 'log_id', 'fault_operation', 'log_message', 'create_date'],
+                                          rows)
+            self._cr.commit()
+            _logger.info("Purged %s EDI log lines of company %s", len(rows), company.name)
+            if len(rows) < batch_size:
+                break
+        self.env['log.book.lines'].invalidate_model()
+
+    def _purge_empty_logs(self, company, with_empty_company, cutoff):
+        """
+        This method is used to delete main logs of a company older than cutoff which don't have any log line.
+        Author: DG
+        """
+        batch_size = company.edi_log_purge_batch_size or 5000
+        while True:
+            self._cr.execute("""
+                DELETE FROM log_book WHERE id IN (
+                    SELECT log.id FROM log_book log
+                     WHERE (log.company_id = %s OR (log.company_id IS NULL AND %s))
+                       AND log.create_date < %s
+                       AND NOT EXISTS (SELECT 1 FROM log_book_lines line WHERE line.log_id = log.id)
+                     LIMIT %s
+                )
+                RETURNING id, name, file_name, create_date
+            """, (company.id, with_empty_company, cutoff, batch_size))
+            rows = self._cr.fetchall()
+            if not rows:
+                break
+            if company.edi_log_archive_before_purge:
+                self._archive_purged_rows(company, 'log.book', ['id', 'name', 'file_name', 'create_date'], rows)
+            self._cr.commit()
+            _logger.info("Purged %s EDI logs of company %s", len(rows), company.name)
+            if len(rows) < batch_size:
+                break
+        self.invalidate_model()
+
+    def _archive_purged_rows(self, company, model_name, columns, rows):
+        """
+        This method is used to store purged rows as gzip compressed CSV attachment.
+        Attachment is created in the same transaction as delete, so archived rows & deleted rows are always same.
         Author: DG
         """
-        for obj in self.search([('create_date', '<', datetime.now() - timedelta(days=13))]):
-            obj.log_detail_ids.unlink()
-            obj.unlink()
+        buffer = io.BytesIO()
+        with gzip.GzipFile(fileobj=buffer, mode='wb') as gzip_file:
+            text_file = io.TextIOWrapper(gzip_file, encoding='utf-8', newline='')
+            writer = csv.writer(text_file)
+            writer.writerow(columns)
+            writer.writerows(rows)
+            text_file.flush()
+            text_file.detach()
+        self.env['ir.attachment'].sudo().create({
+            'name': "%s_purged_%s.csv.gz" % (model_name.replace('.', '_'), datetime.now().strftime('%Y%m%d_%H%M%S_%f')),
+            'raw': buffer.getvalue(),
+            'mimetype': 'application/gzip',
+            'res_model': self._name,
+            'company_id': company.id,
+        })
 
     def create_main_log(self, file_name):
         """
@@ -85,14 +243,15 @@ class LogBookLines(models.Model):
     def create(self, vals_list):
         """
         This method is used to provide sequence name & company in created record.
+        Sequence names of all records are reserved together.
         Author: DG
         """
-        for vals in vals_list:
-            sequence = self.env.ref("odoo_edi_integration.seq_edi_log_logs_line")
-            name = sequence and sequence.next_by_id() or '/'
-            company_id = self._context.get('company_id', self.env.user.company_id.id)
+        sequence = self.env.ref("odoo_edi_integration.seq_edi_log_logs_line")
+        names = reserve_sequence_names(sequence, len(vals_list))
+        company_id = self._context.get('company_id', self.env.user.company_id.id)
+        for vals, name in zip(vals_list, names):
             if type(vals) == dict:
-                vals.update({'name': name, 'company_id': company_id})
+                vals.update({'name': name or '/', 'company_id': company_id})
         return super(LogBookLines, self).create(vals_list)
 
     def create_log(self, log_message, main_log, fault_operation=False):
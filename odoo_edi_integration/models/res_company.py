@@ -0,0 +1,26 @@
+from odoo import models, fields
+
+
+class ResCompany(models.Model):
+    _inherit = 'res.company'
+
+    edi_log_retention_days = fields.Integer(
+        string="EDI Log Retention (Days)",
+        default=13,
+        help="Non-fault EDI log lines older than these days are deleted by the purge scheduled action."
+    )
+    edi_fault_log_retention_days = fields.Integer(
+        string="EDI Fault Log Retention (Days)",
+        default=13,
+        help="Fault EDI log lines older than these days are deleted by the purge scheduled action."
+    )
+    edi_log_purge_batch_size = fields.Integer(
+        string="EDI Log Purge Batch Size",
+        default=5000,
+        help="Number of log lines deleted & committed together by the purge scheduled action."
+    )
+    edi_log_archive_before_purge = fields.Boolean(
+        string="Archive EDI Logs Before Purge",
+        default=False,
+        help="If enabled, purged logs are stored as a compressed CSV attachment before they are deleted."
+    )
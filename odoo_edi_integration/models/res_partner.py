@@ -0,0 +1,24 @@
+from odoo import models, fields
+
+
+class ResPartner(models.Model):
+    _inherit = 'res.partner'
+
+    edi_priority = fields.Integer(
+        string="EDI Priority",
+        default=0,
+        help="EDI transactions of this partner are processed before transactions with lower priority."
+    )
+
+    def write(self, vals):
+        """
+        This method is used to update priority of 'Draft' EDI transactions of partner when EDI priority is changed,
+        priorities set by hand & processed transactions are kept.
+        Author: DG
+        """
+        transactions = self.env['edi.transactions']
+        if 'edi_priority' in vals:
+            transactions = transactions._get_transactions_with_default_priority([('edi_partner_id', 'in', self.ids)])
+        res = super(ResPartner, self).write(vals)
+        transactions._update_default_priority()
+        return res
@@ -1,14 +1,15 @@
 import logging
-import stat
 import os
 import tempfile
 import paramiko
-import xmltodict
 import io
 import base64
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
 from datetime import datetime, timedelta
+from .edi_tools import server_session, close_connection, sync_directories_in_parallel, advisory_lock, \
+    DIRECTORY_LOCK_NAMESPACE, SERVER_LOCK_NAMESPACE, server_sessions, scratch_directory, SESSION_TEST_TIMEOUT
+from .edi_crawler import RemoteTreeCrawler, list_sftp_subdirectories, sftp_directory_mtime, list_sftp_files
 # from cryptography.hazmat.primitives import serialization
 
 _logger = logging.getLogger(__name__)
@@ -48,6 +49,58 @@ class SFTPSyncing(models.Model):
         string="DIRECTORY LISTS",
         auto_join=True
     )
+    max_sessions = fields.Integer(
+        string="Max Sessions",
+        default=2,
+        help="Maximum number of connections opened at the same time to this server by the EDI scheduler."
+    )
+    lock_server_sync = fields.Boolean(
+        string="One Sync at a Time",
+        default=False,
+        help="If enabled, a sync of this server is skipped while another sync of it is running. "
+             "A directory is never synced twice at the same time in any case."
+    )
+    crawl_max_depth = fields.Integer(
+        string="Directory Depth Limit",
+        default=0,
+        help="Sub directories deeper than this level are not fetched, 0 means no limit."
+    )
+    crawl_exclude_patterns = fields.Char(
+        string="Exclude Directories",
+        help="Comma separated patterns of directory names or paths which are not fetched, e.g. archive,*/backup*"
+    )
+    directory_tree_cache = fields.Json(
+        string="Directory Tree Cache",
+        copy=False,
+        help="Last fetched directory tree with modification time of each directory."
+    )
+    incremental_directory_sync = fields.Boolean(
+        string="Incremental Directory Sync",
+        default=True,
+        help="If enabled, directory records are updated only when fetched directory tree is changed since last sync."
+    )
+    sftp_window_size = fields.Integer(
+        string="Window Size (Bytes)",
+        help="SSH channel window size of SFTP session, larger window keeps more data in flight on high latency links. "
+             "0 means paramiko default."
+    )
+    sftp_max_packet_size = fields.Integer(
+        string="Max Packet Size (Bytes)",
+        help="Maximum SSH packet size of SFTP session. 0 means paramiko default."
+    )
+    sftp_compression = fields.Boolean(
+        string="SSH Compression",
+        help="If enabled, SSH transport is compressed (zlib), XML files are transferred much faster on slow links."
+    )
+    sftp_prefetch = fields.Boolean(
+        string="Prefetch Downloads",
+        default=True,
+        help="If enabled, read requests of a download are sent ahead, without waiting for each answer."
+    )
+    sftp_max_concurrent_requests = fields.Integer(
+        string="Max Concurrent Reads",
+        help="Maximum number of read requests in flight while prefetching a download. 0 means no limit."
+    )
 
     # Authentication Option Fields
     sftp_auth_method = fields.Selection(
@@ -143,13 +196,18 @@ class SFTPSyncing(models.Model):
                     connect_parameters['passphrase'] = self.sftp_pem_passphrase
                 _logger.info(f"----------Login to SFTP via PEM/PPK Key.----------")
 
+            connect_parameters['compress'] = self.sftp_compression
             ssh.connect(**connect_parameters)
-            sftp_client = ssh.open_sftp()
+            sftp_client = paramiko.SFTPClient.from_transport(
+                ssh.get_transport(),
+                window_size=self.sftp_window_size or None,
+                max_packet_size=self.sftp_max_packet_size or None
+            )
             return sftp_client
 
         except Exception as e:
             if not self._context.get('sftp_password'):
-                raise UserError(_("SFTP Connection Test Failed! Here is what we got instead:\n %s") % (e))
+                raise UserError(_("SFTP Connection Test Failed! Here is what we got instead:\n %s") % (e)) from e
 
         # finally:
         #     if temp_key_file_path and os.path.exists(temp_key_file_path):
@@ -168,7 +226,10 @@ class SFTPSyncing(models.Model):
         Author: JJ
         """
         try:
-            sftp_client = self.check_sftp_connection()
+            # Test connection is counted in server's session slots too, & it's closed right after the test.
+            with server_session(self, timeout=SESSION_TEST_TIMEOUT):
+                sftp_client = self.check_sftp_connection()
+                close_connection(sftp_client)
             if sftp_client:
                 # title = _("SFTP Connection Test Succeeded!")
                 # message = _("Everything seems properly set up!")
@@ -207,18 +268,10 @@ class SFTPSyncing(models.Model):
 
     def setup_sync_inner_files_cron(self):
         """
-        From this method fetch inner files cron creation process declared.
+        From this method fetch inner files schedule creation process declared,
+        schedule is run by the EDI dispatcher cron instead of a cron per server.
         """
-        code_method = 'model.sync_sftp_inner_files({0})'.format(self.id)
-        existing_cron = self.env['ir.cron'].search([('code', '=', code_method), ('active', 'in', [True, False])], limit=1)
-        if existing_cron:
-            existing_cron.name = "EDI: [{0}] Sync Inner Files from SFTP".format(self.name)
-            return True
-        cron_name = "EDI: [{0}] Sync Inner Files from SFTP".format(self.name)
-        model_name = 'sftp.syncing'
-        self.create_cron_for_automation_task(cron_name, model_name, code_method,
-                                             interval_type='minutes', interval_number=40,
-                                             nextcall_timegap_minutes=20)
+        self.env['edi.schedule']._ensure_schedule(server=self)
         return True
 
     @api.model_create_multi
@@ -245,63 +298,69 @@ class SFTPSyncing(models.Model):
                 rec.setup_sync_inner_files_cron()
         return res
 
+    def _get_crawl_exclude_patterns(self):
+        """
+        This method is used to get list of exclude patterns of directory crawler.
+        Author: DG
+        """
+        return (self.crawl_exclude_patterns or '').split(',')
+
     def fetch_sftp_directories(self, sftp, path):
         """
-        Recursively fetch root directories and subdirectories from the given SFTP path,
+        Fetch root directories and subdirectories from the given SFTP path, breadth first on the given connection,
         using the file_import_path for the initial directory.
         Author: JJ
         """
-        directories = []
-
-        try:
-            print(f"Fetching directories under: {path}")
-            entries = sftp.listdir_attr(path)  # Use listdir_attr for structured directory information
-        except Exception as e:
-            print(f"Error accessing {path}: {e}")
-            return directories  # Return an empty list if the path is inaccessible
-
-        for file_attr in entries:
-            entry_path = f"{path}/{file_attr.filename}".replace('//', '/')
-
-            if stat.S_ISDIR(file_attr.st_mode):  # Check if it's a directory
-                print(f"Found directory: {entry_path}")
-                directories.append(entry_path)
-                # Recursively fetch subdirectories
-                directories.extend(self.fetch_sftp_directories(sftp, entry_path))
+        crawler = RemoteTreeCrawler([sftp], list_sftp_subdirectories, sftp_directory_mtime,
+                                    max_depth=self.crawl_max_depth,
+                                    exclude_patterns=self._get_crawl_exclude_patterns())
+        return crawler.crawl(path)
 
-        return directories
+    def _crawl_directory_tree(self, sftp, path):
+        """
+        This method is used to fetch directory tree with extra pooled connections (as per free session slots)
+        & with cached listing of unchanged directories. Returns the crawler, its cache is stored on server.
+        Author: DG
+        """
+        with server_sessions(self, self.max_sessions - 1, blocking=False) as extra_sessions:
+            connections = [sftp]
+            try:
+                for _index in range(extra_sessions):
+                    connections.append(self.check_sftp_connection())
+                crawler = RemoteTreeCrawler(connections, list_sftp_subdirectories, sftp_directory_mtime,
+                                            max_depth=self.crawl_max_depth,
+                                            exclude_patterns=self._get_crawl_exclude_patterns(),
+                                            cache=self.directory_tree_cache)
+                crawler.crawl(path)
+            finally:
+                for connection in connections[1:]:
+                    close_connection(connection)
+        self.with_context(is_check_connection_from_write=True).write({'directory_tree_cache': crawler.new_cache})
+        return crawler
 
     def sftp_fetch_directory(self, sftp):
         """
         Sync SFTP directories with Odoo records.
+        With incremental directory sync, records are reconciled only when crawl found changes.
         Author: JJ
         """
         # Fetch all directories from SFTP (starting from root)
-        path = self.file_import_path
-        listdir_attr = sorted(self.fetch_sftp_directories(sftp, path))
-        print("Directories fetched from SFTP:", listdir_attr)
-
-        # Fetch all existing directories in Odoo for this syncing record
-        existing_directories = {
-            rec.name for rec in self.env["ftp.list"].search([("sftp_syncing_id", "=", self.id)])
-        }
-
-        # Identify new directories to add
-        new_directories = set(listdir_attr) - existing_directories
-        for subdir in new_directories:
-            self.env["ftp.list"].create({"name": subdir, "sftp_syncing_id": self.id, "server_type": 'sftp'})
-
-        # Identify old directories to remove
-        obsolete_directories = existing_directories - set(listdir_attr)
-        if obsolete_directories:
-            self.env["ftp.list"].search([("name", "in", list(obsolete_directories))]).unlink()
-
-    def sftp_attachment_create(self, destination, sftp, sftp_folder):
+        path = self.file_import_path or '/'
+        crawler = self._crawl_directory_tree(sftp, path)
+        _logger.info(f"Directories fetched from SFTP: {crawler.directories}")
+        self.env["ftp.list"]._reconcile_server_directories(
+            self, crawler.directories, crawler=crawler if self.incremental_directory_sync else None,
+            complete=not crawler.failed_directories)
+
+    def sftp_attachment_create(self, destination, sftp, sftp_folder, budget=None, scratch_dir=None):
         """
         This method is used to create SFTP attachment from SFTP files.
+        When budget is given, it returns False if the budget is used up before all files are downloaded.
+        Local files of the job are written in scratch_dir, which is owned & removed by the caller.
         Author: JJ
         """
         self.ensure_one()
+        scratch_dir = scratch_dir or tempfile.gettempdir()
         sftp_attach = self.env["ftp.attachment"]
 
         try:
@@ -317,6 +376,9 @@ class SFTPSyncing(models.Model):
             valid_extensions = {'.xml'}
             files = [file for file in files if
                      file not in {'.', '..'} and any(file.endswith(ext) for ext in valid_extensions)]
+            if sftp_folder and sftp_folder.stability_check != 'none':
+                # Files which partner is still writing are left for a next sync.
+                files = sftp_folder._filter_stable_files(files, list_sftp_files(sftp, destination), destination)
 
             sftp_split = False
             if sftp_folder and sftp_folder.split_records:
@@ -340,18 +402,19 @@ class SFTPSyncing(models.Model):
 
                 split_matched_files = []
                 for file in files:
-                    local_file = os.path.join(tempfile.gettempdir(), file)
+                    local_file = os.path.join(scratch_dir, file)
                     with open(local_file, 'wb') as f:
                         sftp.get(f"{original_path}/{file}", local_file)
                     _logger.info(f"Downloaded file: {file}")
 
                     # From the original file create parts if records more than 2000.
-                    split_files = sftp_folder.ftp_syncing_id.split_xml_file(local_file, split_tag, 2000)
+                    split_files = sftp_folder.ftp_syncing_id.split_xml_file(local_file, split_tag, 2000,
+                                                                            output_dir=scratch_dir)
 
                     for split_file in split_files:
                         # Uploads a local file which is divided into parts to the SFTP server inside split folder.
                         self.upload_sftp_file(sftp, split_file, f"{original_path}/{split_dir}")
-                        split_matched_files.append(split_file.lstrip('/tmp/'))
+                        split_matched_files.append(os.path.basename(split_file))
 
                     # Remove the original file inside tmp folder.
                     os.remove(local_file)
@@ -361,7 +424,8 @@ class SFTPSyncing(models.Model):
                 files = split_matched_files  # Update matched_files
                 _logger.info("New matched files => {}".format(split_matched_files))
 
-            for name in files:
+            files_per_commit = sftp_folder.files_per_commit or 1
+            for file_index, name in enumerate(files, 1):
 
                 file_name = os.path.join(destination, name)
                 match_attach_rec = sftp_attach.search(
@@ -377,31 +441,30 @@ class SFTPSyncing(models.Model):
                         file_name = os.path.join(destination, f_name)
                         match_attach_rec = None
 
-                local_file = os.path.join(tempfile.gettempdir(), name)
+                local_file = os.path.join(scratch_dir, name)
+                transfer = self.env["edi.partial.transfer"]
                 try:
                     if not sftp_split:
-                        with open(local_file, "wb") as fp:
-                            sftp.get(f"{destination}/{name}", local_file)
+                        # Interrupted download is resumed from its partial file on next sync.
+                        transfer, local_file = transfer.download_sftp(self, sftp, f"{destination}/{name}")
                 except Exception as e:
                     _logger.error(f"Failed to retrieve file {name}: {e}")
                     continue
 
-                with open(local_file, 'rb') as fp:
-                    file_data = fp.read()
+                if not match_attach_rec:
                     attachment_value = {
                         "name": file_name,
                         "res_model": "sftp.syncing",
                         "public": True,
                         "ftp_list_id": sftp_folder.id,
                         "sync_date": fields.Datetime.now(),
-                        "file_content": file_data.decode("utf-8") if ("xml" in file_name) or (
-                                "tmp" in file_name) else base64.b64encode(file_data),
-                        "datas": base64.b64encode(file_data),
                     }
-
-                if not match_attach_rec:
+                    # File is copied into filestore in blocks, only XML text is read for import.
+                    attachment_value.update(sftp_attach._prepare_values_from_file(local_file, file_name,
+                                                                                  errors='strict'))
                     try:
-                        sftp_attach.create(attachment_value)
+                        with self.env.cr.savepoint():
+                            sftp_attach.create(attachment_value)
                     except Exception as error:
                         _logger.info("Something went wrong at the time of creating attachment => {}".format(error))
                         attachment_value.update({"file_content": ""})
@@ -409,33 +472,18 @@ class SFTPSyncing(models.Model):
                     _logger.info(_("Created the attachment %s") % file_name)
                 else:
                     # If attachment already exists and if EDI transaction not created, so below process will create it.
-                    edi_transaction = self.env["edi.transactions"]
-                    edi_config_table_id = self.env['edi.config.table']
-                    if match_attach_rec.ftp_list_id and match_attach_rec.ftp_list_id.download_this and match_attach_rec.ftp_list_id.mapping_table_search_using_xml_header:
-                        python_dict = xmltodict.parse(match_attach_rec.file_content)
-                        xml_header = ''
-                        for key, value in python_dict.items():
-                            xml_header = key
-                        if xml_header:
-                            edi_config_table_id = self.env['edi.config.table'].search([('xml_header', '=', xml_header)],
-                                                                                      limit=1)
-                        if not edi_config_table_id:
-                            _logger.info("Using XML header [{}] mapping table not found.".format(xml_header))
-                    elif match_attach_rec.ftp_list_id.edi_config_table_id and match_attach_rec.ftp_list_id.edi_config_table_id.edi_type == "Incoming":
-                        edi_config_table_id = match_attach_rec.ftp_list_id.edi_config_table_id
-
-                    if edi_config_table_id and not edi_transaction.search([('name', '=', match_attach_rec.name)]):
-                        edi_transaction.create(
-                            {
-                                "name": match_attach_rec.name,
-                                "edi_type": edi_config_table_id.edi_type,
-                                "edi_config_table_id": edi_config_table_id.id,
-                                "ftp_attachment_id": match_attach_rec.id,
-                                "xml_content": match_attach_rec.file_content,
-                                "edi_partner_id": match_attach_rec.ftp_list_id.partner_id and match_attach_rec.ftp_list_id.partner_id.id or False,
-                            }
-                        )
-                self._cr.commit()
+                    match_attach_rec._create_edi_transaction()
+                transfer._finish()
+                if file_index % files_per_commit == 0:
+                    self._cr.commit()
+                # Renamed daily files & split parts can't be resumed safely, so those directories are not yielded.
+                if budget and not sftp_split and not sftp_folder.daily_new_file:
+                    budget.consume()
+                    if budget.exhausted():
+                        self._cr.commit()
+                        return False
+            self._cr.commit()
+            return True
         except Exception as e:
             _logger.error(f"Error while processing files in {destination}: {e}")
 
@@ -446,20 +494,46 @@ class SFTPSyncing(models.Model):
         """
         self.ensure_one()
         try:
-            sftp = self.check_sftp_connection()
-            self.sftp_fetch_directory(sftp)
+            with server_session(self):
+                sftp = self.check_sftp_connection()
+                try:
+                    self.sftp_fetch_directory(sftp)
+                finally:
+                    close_connection(sftp)
         except Exception as e:
             raise ValidationError("Something went wrong \n {}".format(e))
 
-    def sync_sftp_inner_files(self, sftp_sync_id=False, sftp_list_obj=False):
+    def _sync_directory_files(self, sftp_folder, budget=None):
+        """
+        This method is used to sync inner files of one directory on its own SFTP connection.
+        Directory is locked with advisory lock, if it's already being synced then it's skipped.
+        Author: DG
+        """
+        self.ensure_one()
+        with advisory_lock(self._cr, DIRECTORY_LOCK_NAMESPACE, sftp_folder.id) as acquired:
+            if not acquired:
+                _logger.info("Directory [{}] is already being synced, skipped.".format(sftp_folder.name))
+                return True
+            with server_session(self), scratch_directory(self.env, 'edi_sftp_') as scratch_dir:
+                sftp = self.check_sftp_connection()
+                try:
+                    return self.sftp_attachment_create(sftp_folder.name, sftp, sftp_folder, budget=budget,
+                                                       scratch_dir=scratch_dir)
+                except Exception as e:
+                    raise ValidationError("Something went wrong \n {}".format(e))
+                finally:
+                    close_connection(sftp)
+
+    def sync_sftp_inner_files(self, sftp_sync_id=False, sftp_list_obj=False, budget=None):
         """
         This method is used to sync inner files from SFTP folders.
+        When more than one directory is synced & server allows more sessions, directories are synced concurrently.
+        It returns False when the budget is used up before all directories are synced.
         Author: JJ
         """
         if sftp_sync_id:
             self = self.browse(sftp_sync_id)
         self.ensure_one()
-        sftp = self.check_sftp_connection()
         if not sftp_list_obj:
             sftp_list_obj = self.ftp_directory_ids.filtered(lambda x: x.download_this)
         is_edi_config_table = sftp_list_obj.filtered(
@@ -467,12 +541,26 @@ class SFTPSyncing(models.Model):
         if is_edi_config_table:
             raise ValidationError("Mapping table not set on these directories %s" % (is_edi_config_table.mapped('name')))
 
+        if not self.lock_server_sync:
+            return self._sync_directories(sftp_list_obj, budget=budget)
+        with advisory_lock(self._cr, SERVER_LOCK_NAMESPACE[self._name], self.id) as acquired:
+            if not acquired:
+                _logger.info("SFTP [{}] is already being synced, skipped.".format(self.name))
+                return True
+            return self._sync_directories(sftp_list_obj, budget=budget)
+
+    def _sync_directories(self, sftp_list_obj, budget=None):
+        """
+        This method is used to sync given directories, concurrently when server allows more sessions.
+        Author: DG
+        """
         # Find out directories in which a download option configured, based on those directories fetch inner files of it.
+        if len(sftp_list_obj) > 1 and self.max_sessions > 1:
+            return sync_directories_in_parallel(self, sftp_list_obj, budget, '_sync_directory_files')
         for sftp_folder in sftp_list_obj:
-            try:
-                self.sftp_attachment_create(sftp_folder.name, sftp, sftp_folder)
-            except Exception as e:
-                raise ValidationError("Something went wrong \n {}".format(e))
+            if self._sync_directory_files(sftp_folder, budget=budget) is False:
+                return False
+        return True
 
     def upload_sftp_file(self, sftp, local_path, sftp_directory):
         """
@@ -1,4 +1,4 @@
-from odoo import models, fields
+from odoo import models, fields, api
 
 
 class TranslationTable(models.Model):
@@ -27,3 +27,23 @@ class TranslationTable(models.Model):
         string='Corresponding Odoo Value',
         tracking=True
     )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        """
+        This method is used to drop cached translation maps of mapping tables, when translations are added.
+        Author: DG
+        """
+        res = super(TranslationTable, self).create(vals_list)
+        self.env.registry.clear_cache()
+        return res
+
+    def write(self, vals):
+        res = super(TranslationTable, self).write(vals)
+        self.env.registry.clear_cache()
+        return res
+
+    def unlink(self):
+        res = super(TranslationTable, self).unlink()
+        self.env.registry.clear_cache()
+        return res
@@ -0,0 +1,7 @@
+from . import test_edi_xml
+from . import test_edi_import_checkpoint
+from . import test_edi_tools
+from . import test_edi_claim
+from . import test_edi_schedule
+from . import test_edi_crawler
+from . import test_edi_dates
@@ -0,0 +1,76 @@
+from datetime import timedelta
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+
+class TestEDIClaim(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env['edi.transactions'].search([('state', '=', 'Draft')]).write({'state': 'Cancel'})
+        cls.config_table = cls.env['edi.config.table'].create({
+            'name': 'Claim Partners',
+            'model_id': cls.env.ref('base.model_res_partner').id,
+            'edi_type': 'Incoming',
+            'main_table': True,
+        })
+        cls.partner_a, cls.partner_b = cls.env['res.partner'].create([
+            {'name': 'EDI Partner A'}, {'name': 'EDI Partner B'}])
+
+    def setUp(self):
+        super().setUp()
+        # Claim commits immediately for other workers, test keeps everything in its own transaction.
+        self.patch(self.env.cr, 'commit', lambda: None)
+
+    def _create_transactions(self, *vals_list):
+        return self.env['edi.transactions'].create([dict({
+            'edi_config_table_id': self.config_table.id,
+            'edi_type': 'Incoming',
+        }, **vals) for vals in vals_list])
+
+    def test_round_robin_across_partners(self):
+        a1, a2, a3, b1 = self._create_transactions(
+            {'edi_partner_id': self.partner_a.id}, {'edi_partner_id': self.partner_a.id},
+            {'edi_partner_id': self.partner_a.id}, {'edi_partner_id': self.partner_b.id})
+        transactions = self.env['edi.transactions']
+        self.assertEqual(transactions._claim_draft_transactions(2).ids, [a1.id, b1.id])
+        self.assertEqual(transactions._claim_draft_transactions(5).ids, [a2.id, a3.id])
+        self.assertEqual(set((a1 | b1).mapped('state')), {'Processing'})
+        self.assertTrue(a1.processing_owner)
+        self.assertFalse(transactions._claim_draft_transactions(5))
+
+    def test_priority_first(self):
+        normal, urgent = self._create_transactions(
+            {'edi_partner_id': self.partner_a.id}, {'edi_partner_id': self.partner_a.id, 'priority': 5})
+        self.assertEqual(self.env['edi.transactions']._claim_draft_transactions(1), urgent)
+        self.assertEqual(normal.state, 'Draft')
+
+    def test_priority_from_table_and_partner(self):
+        self.config_table.transaction_priority = 2
+        draft, done, manual = self._create_transactions(
+            {'edi_partner_id': self.partner_a.id}, {'edi_partner_id': self.partner_a.id},
+            {'edi_partner_id': self.partner_b.id, 'priority': 9})
+        self.assertEqual((draft.priority, done.priority, manual.priority), (2, 2, 9))
+        done.state = 'Done'
+        self.partner_a.edi_priority = 7
+        # Only pending transactions follow the new priority, processed ones & priorities set by hand are kept.
+        self.assertEqual((draft.priority, done.priority, manual.priority), (7, 2, 9))
+        self.config_table.transaction_priority = 8
+        self.assertEqual((draft.priority, done.priority, manual.priority), (8, 2, 9))
+
+    def test_retry_date_not_reached(self):
+        waiting, ready = self._create_transactions({}, {})
+        waiting.next_attempt_date = fields.Datetime.now() + timedelta(hours=1)
+        self.assertEqual(self.env['edi.transactions']._claim_draft_transactions(5), ready)
+
+    def test_lanes_share_batch(self):
+        incoming = self._create_transactions({}, {}, {})
+        outgoing = self._create_transactions({'edi_type': 'Outgoing'}, {'edi_type': 'Outgoing'})
+        transactions = self.env['edi.transactions']
+        claimed = transactions._claim_transaction_batch(2, outgoing_share=50)
+        self.assertEqual(claimed, incoming[0] | outgoing[0])
+        # Free places of outgoing lane are filled from incoming lane.
+        claimed = transactions._claim_transaction_batch(4, outgoing_share=50)
+        self.assertEqual(claimed, incoming[1:] | outgoing[1])
+        self.assertEqual(transactions._claim_transaction_batch(2, lane='Outgoing'), transactions)
@@ -0,0 +1,101 @@
+from odoo.tests.common import BaseCase
+from odoo.addons.odoo_edi_integration.models.edi_crawler import RemoteTreeCrawler, ftp_time_to_timestamp
+
+TREE = {
+    '/in': {'/in/a': 1, '/in/b': 1, '/in/tmp': 1},
+    '/in/a': {'/in/a/x': 1},
+    '/in/a/x': {},
+    '/in/b': {},
+    '/in/tmp': {'/in/tmp/c': 1},
+    '/in/tmp/c': {},
+}
+
+
+class FakeRemote:
+
+    def __init__(self, tree):
+        self.tree = {path: dict(children) for path, children in tree.items()}
+        self.mtimes = {path: 1 for path in tree}
+        self.listed = []
+
+    def list_directory(self, connection, path):
+        self.listed.append(path)
+        if path not in self.tree:
+            raise FileNotFoundError(path)
+        return dict(self.tree[path])
+
+    def directory_mtime(self, connection, path):
+        return self.mtimes.get(path)
+
+    def crawler(self, **kwargs):
+        return RemoteTreeCrawler(['first', 'second'], self.list_directory, self.directory_mtime, **kwargs)
+
+
+class TestRemoteTreeCrawler(BaseCase):
+
+    def test_crawl_all_levels(self):
+        remote = FakeRemote(TREE)
+        crawler = remote.crawler()
+        self.assertEqual(crawler.crawl('/in'),
+                         ['/in/a', '/in/a/x', '/in/b', '/in/tmp', '/in/tmp/c'])
+        self.assertEqual(crawler.listed_count, 6)
+        self.assertEqual(crawler.reused_count, 0)
+        self.assertEqual(set(crawler.new_cache), set(TREE))
+        self.assertEqual(crawler.connections.qsize(), 2)
+
+    def test_max_depth(self):
+        crawler = FakeRemote(TREE).crawler(max_depth=1)
+        self.assertEqual(crawler.crawl('/in'), ['/in/a', '/in/b', '/in/tmp'])
+
+    def test_exclude_patterns(self):
+        remote = FakeRemote(TREE)
+        self.assertEqual(remote.crawler(exclude_patterns=['tmp', ' ', '']).crawl('/in'), ['/in/a', '/in/a/x', '/in/b'])
+        self.assertNotIn('/in/tmp', remote.listed)
+        self.assertEqual(FakeRemote(TREE).crawler(exclude_patterns=['/in/a*']).crawl('/in'),
+                         ['/in/b', '/in/tmp', '/in/tmp/c'])
+
+    def test_unchanged_directories_reused_from_cache(self):
+        remote = FakeRemote(TREE)
+        first_crawler = remote.crawler()
+        first_crawler.crawl('/in')
+
+        remote.listed = []
+        remote.tree['/in/b'] = {'/in/b/new': 2}
+        remote.tree['/in/b/new'] = {}
+        remote.mtimes['/in/b'] = 2
+        remote.mtimes['/in/b/new'] = 2
+        remote.tree['/in']['/in/b'] = 2
+        remote.mtimes['/in'] = 2
+        crawler = remote.crawler(cache=first_crawler.new_cache)
+        self.assertEqual(crawler.crawl('/in'),
+                         ['/in/a', '/in/a/x', '/in/b', '/in/b/new', '/in/tmp', '/in/tmp/c'])
+        self.assertEqual(sorted(remote.listed), ['/in', '/in/b', '/in/b/new'])
+        self.assertEqual(crawler.reused_count, 4)
+        self.assertEqual(crawler.changed_directories, {'/in', '/in/b', '/in/b/new'})
+
+    def test_failed_listing_recorded(self):
+        remote = FakeRemote(TREE)
+        del remote.tree['/in/a']
+        crawler = remote.crawler()
+        self.assertEqual(crawler.crawl('/in'), ['/in/a', '/in/b', '/in/tmp', '/in/tmp/c'])
+        self.assertEqual(crawler.failed_directories, {'/in/a'})
+
+    def test_failed_listing_keeps_cached_subtree(self):
+        remote = FakeRemote(TREE)
+        first_crawler = remote.crawler()
+        first_crawler.crawl('/in')
+
+        remote.mtimes['/in/a'] = 2
+        del remote.tree['/in/a']
+        crawler = remote.crawler(cache=first_crawler.new_cache)
+        self.assertEqual(crawler.crawl('/in'), ['/in/a', '/in/a/x', '/in/b', '/in/tmp', '/in/tmp/c'])
+        self.assertEqual(crawler.failed_directories, {'/in/a'})
+        # Old modification time is kept, so the directory is listed again on next crawl.
+        self.assertEqual(crawler.new_cache['/in/a']['mtime'], 1)
+        self.assertNotIn('/in/a', crawler.changed_directories)
+
+    def test_ftp_time_to_timestamp(self):
+        self.assertEqual(ftp_time_to_timestamp('19700101000100'), 60.0)
+        self.assertEqual(ftp_time_to_timestamp('19700101000100.123'), 60.0)
+        self.assertIsNone(ftp_time_to_timestamp('invalid'))
+        self.assertIsNone(ftp_time_to_timestamp(None))
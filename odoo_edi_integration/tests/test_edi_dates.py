@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+from dateutil import parser
+from odoo.tests.common import BaseCase
+from odoo.addons.odoo_edi_integration.models.edi_dates import detect_date_format, parse_date_value, to_utc_naive
+
+PARITY_VALUES = [
+    '2024-03-05',
+    '2024-03-05T10:20:30',
+    '2024-03-05 10:20:30.123456',
+    '2024-03-05T10:20:30+02:00',
+    '20240305',
+    '20240305102030',
+    '2024/03/05',
+    '2024/03/05 10:20:30',
+    '2024.03.05',
+    '03/05/2024',
+    '03/05/2024 10:20:30',
+    '03/05/2024 10:20',
+    '03-05-2024',
+    '03.05.2024',
+    '05-Mar-2024',
+    '05 Mar 2024',
+    'Mar 05, 2024',
+    ' 2024-03-05 ',
+]
+
+
+class TestEDIDates(BaseCase):
+
+    def test_parity_with_dateutil(self):
+        for value in PARITY_VALUES:
+            self.assertEqual(parse_date_value(value), parser.parse(value.strip(), yearfirst=True, dayfirst=False),
+                             value)
+
+    def test_detected_format_kept_for_shape(self):
+        self.assertEqual(detect_date_format('2024/03/05'), '%Y/%m/%d')
+        self.assertEqual(detect_date_format('1999/12/31'), '%Y/%m/%d')
+        self.assertIsNone(detect_date_format('next monday'))
+
+    def test_explicit_format(self):
+        self.assertEqual(parse_date_value('05/03/2024', '%d/%m/%Y'), datetime(2024, 3, 5))
+        self.assertEqual(parse_date_value('05/03/2024'), datetime(2024, 5, 3))
+
+    def test_fallback_to_dateutil(self):
+        self.assertEqual(parse_date_value('5 March 2024'), datetime(2024, 3, 5))
+        self.assertEqual(parse_date_value('2024-03-05', '%d/%m/%Y'), datetime(2024, 3, 5))
+
+    def test_iso_utc_suffix(self):
+        self.assertEqual(parse_date_value('2024-03-05T10:20:30Z'), datetime(2024, 3, 5, 10, 20, 30, tzinfo=timezone.utc))
+
+    def test_to_utc_naive(self):
+        value = datetime(2024, 3, 5, 10, 20, 30, tzinfo=timezone(timedelta(hours=2)))
+        self.assertEqual(to_utc_naive(value), datetime(2024, 3, 5, 8, 20, 30))
+        self.assertEqual(to_utc_naive(datetime(2024, 3, 5, 10, 20)), datetime(2024, 3, 5, 10, 20))
@@ -0,0 +1,67 @@
+from unittest.mock import patch
+from odoo.tests.common import TransactionCase
+
+
+def _prepare_vals_from_name(self, item, mapping_edi_table, log_buffer, log_reasons, row):
+    return True, {'name': item['Name']}, []
+
+
+class TestEDIImportCheckpoint(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.config_table = cls.env['edi.config.table'].create({
+            'name': 'Checkpoint Partners',
+            'model_id': cls.env.ref('base.model_res_partner').id,
+            'file_type': 'multiple',
+            'edi_type': 'Incoming',
+            'main_table': True,
+        })
+        cls.python_dict = {'Partners': {'Partner': [{'Name': 'EDI Checkpoint %s' % row} for row in range(1, 6)]}}
+
+    def setUp(self):
+        super().setUp()
+        self.commits = []
+        self.patch(self.env.cr, 'commit', lambda: self.commits.append(
+            (self.transaction.import_checkpoint, self.transaction.import_done_count)))
+        self.startPatcher(patch.object(type(self.env['edi.transactions']), '_prepare_vals_from_item',
+                                       _prepare_vals_from_name))
+        self.transaction = self.env['edi.transactions'].create({
+            'name': 'Checkpoint',
+            'edi_config_table_id': self.config_table.id,
+            'edi_type': 'Incoming',
+        })
+
+    def _import(self):
+        main_log_id = self.env['log.book'].create_main_log(self.transaction.name)
+        self.transaction._create_multiple_record_from_single_attachment(
+            self.python_dict, self.config_table, 'Partners/Partner', main_log_id)
+
+    def _imported_names(self):
+        return self.env['res.partner'].search([('name', '=like', 'EDI Checkpoint %')]).mapped('name')
+
+    def test_checkpoint_committed_after_each_commit_batch(self):
+        self.config_table.write({'import_batch_size': 2, 'commit_batch_size': 2})
+        self._import()
+        self.assertEqual(self.commits, [(2, 2), (4, 4), (0, 0)])
+        self.assertEqual(self.transaction.state, 'Done')
+        self.assertEqual(len(self._imported_names()), 5)
+
+    def test_resume_from_checkpoint(self):
+        self.transaction.write({'import_checkpoint': 2, 'import_done_count': 1, 'import_failed_count': 1})
+        self._import()
+        self.assertEqual(sorted(self._imported_names()), ['EDI Checkpoint 3', 'EDI Checkpoint 4', 'EDI Checkpoint 5'])
+        # Counts of interrupted run are kept, so one record failed before the checkpoint makes it partially done.
+        self.assertEqual(self.transaction.state, 'Partially_Done')
+        self.assertEqual(self.transaction.import_checkpoint, 0)
+        self.assertEqual(self.transaction.import_done_count, 0)
+        self.assertEqual(self.transaction.import_failed_count, 0)
+
+    def test_reset_clears_checkpoint(self):
+        self.transaction.write({'import_checkpoint': 3, 'import_done_count': 2, 'import_failed_count': 1,
+                                'state': 'Failed'})
+        self.transaction.reset()
+        self.assertEqual(self.transaction.import_checkpoint, 0)
+        self.assertEqual(self.transaction.import_done_count, 0)
+        self.assertEqual(self.transaction.import_failed_count, 0)
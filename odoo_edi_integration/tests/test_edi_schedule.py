@@ -0,0 +1,72 @@
+from unittest.mock import patch
+from odoo import fields
+from odoo.tests.common import TransactionCase
+
+
+class TestEDISchedule(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        server_class = type(cls.env['ftp.syncing'])
+        # Servers are not reachable from tests, so connection check & cron setup on create are skipped.
+        with patch.object(server_class, 'action_check_ftp_connection'), \
+                patch.object(server_class, 'setup_sync_inner_files_cron'):
+            cls.server, cls.single_session_server = cls.env['ftp.syncing'].create([
+                {'name': 'EDI Lanes', 'max_sessions': 2},
+                {'name': 'EDI Single Session', 'max_sessions': 1},
+            ])
+
+    def _create_schedules(self, server, *vals_list):
+        return self.env['edi.schedule'].create([dict({'ftp_syncing_id': server.id}, **vals) for vals in vals_list])
+
+    def _lane_sets(self, schedules):
+        return sorted(sorted(lane) for lane in schedules._plan_lanes())
+
+    def test_lanes_balanced_by_duration(self):
+        long_run, short_run, other_run = self._create_schedules(
+            self.server, {'last_duration': 100}, {'last_duration': 30}, {'last_duration': 40})
+        self.assertEqual(self._lane_sets(long_run | short_run | other_run),
+                         sorted([[long_run.id], sorted([short_run.id, other_run.id])]))
+
+    def test_lanes_limited_by_sessions(self):
+        schedules = self._create_schedules(self.single_session_server, {}, {}, {})
+        self.assertEqual(self._lane_sets(schedules), [sorted(schedules.ids)])
+
+    def test_concurrency_group_in_one_lane(self):
+        first, second, other = self._create_schedules(
+            self.server, {'concurrency_group': 'inbox', 'last_duration': 10},
+            {'concurrency_group': 'inbox', 'last_duration': 10}, {'last_duration': 50})
+        self.assertEqual(self._lane_sets(first | second | other),
+                         sorted([sorted([first.id, second.id]), [other.id]]))
+
+    def test_lanes_per_server(self):
+        schedules = self._create_schedules(self.server, {}) | self._create_schedules(self.single_session_server, {})
+        self.assertEqual(self._lane_sets(schedules), sorted([[schedule_id] for schedule_id in schedules.ids]))
+
+    def test_adaptive_interval(self):
+        schedule = self._create_schedules(self.server, {
+            'adaptive_interval': True, 'interval_number': 40, 'min_interval_minutes': 5, 'max_interval_minutes': 240,
+            'current_interval_minutes': 40, 'poll_count': 10,
+        })
+        poll_date = fields.Datetime.now()
+
+        # Quiet directory backs off on the first empty poll.
+        self.assertEqual(schedule._record_poll_statistics(0, poll_date)['current_interval_minutes'], 80)
+        # Busy directory keeps its interval until it has empty polls in a row.
+        schedule.write({'avg_files_per_poll': 2.0, 'empty_poll_streak': 0})
+        vals = schedule._record_poll_statistics(0, poll_date)
+        self.assertAlmostEqual(vals['avg_files_per_poll'], 1.4)
+        self.assertEqual(vals['empty_poll_streak'], 1)
+        self.assertEqual(vals['current_interval_minutes'], 40)
+        schedule.empty_poll_streak = 2
+        self.assertEqual(schedule._record_poll_statistics(0, poll_date)['current_interval_minutes'], 80)
+
+        # Files shorten interval by average files per poll, at least halved & not below minimum.
+        schedule.write({'avg_files_per_poll': 0.0, 'empty_poll_streak': 0})
+        self.assertEqual(schedule._record_poll_statistics(1, poll_date)['current_interval_minutes'], 20)
+        self.assertEqual(schedule._record_poll_statistics(10, poll_date)['current_interval_minutes'], 10)
+        schedule.current_interval_minutes = 6
+        vals = schedule._record_poll_statistics(1, poll_date)
+        self.assertEqual(vals['current_interval_minutes'], 5)
+        self.assertEqual(vals['empty_poll_streak'], 0)
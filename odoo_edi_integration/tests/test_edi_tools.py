@@ -0,0 +1,104 @@
+import ftplib
+import socket
+from unittest.mock import patch
+import paramiko
+from odoo.tests.common import BaseCase
+from odoo.addons.odoo_edi_integration.models import edi_tools
+from odoo.addons.odoo_edi_integration.models.edi_tools import EDIRunBudget, is_transient_error, normalize_key_value, \
+    retry_delay
+
+
+class TestEDIRunBudget(BaseCase):
+
+    def test_item_budget(self):
+        budget = EDIRunBudget(time_budget=0, item_budget=5)
+        self.assertEqual(budget.remaining_items(10), 5)
+        self.assertEqual(budget.remaining_items(3), 3)
+        budget.consume(4)
+        self.assertEqual(budget.remaining_items(10), 1)
+        self.assertFalse(budget.exhausted())
+        budget.consume()
+        self.assertEqual(budget.remaining_items(10), 0)
+        self.assertTrue(budget.exhausted())
+        budget.consume()
+        self.assertEqual(budget.remaining_items(10), 0)
+
+    def test_no_item_budget(self):
+        budget = EDIRunBudget(time_budget=0, item_budget=0)
+        budget.consume(1000)
+        self.assertEqual(budget.remaining_items(10), 10)
+        self.assertFalse(budget.exhausted())
+
+    def test_time_budget(self):
+        with patch.object(edi_tools.time, 'monotonic', return_value=100.0) as monotonic:
+            budget = EDIRunBudget(time_budget=60)
+            monotonic.return_value = 159.0
+            self.assertFalse(budget.exhausted())
+            monotonic.return_value = 160.0
+            self.assertTrue(budget.exhausted())
+            self.assertEqual(budget.elapsed, 60.0)
+
+    def test_time_budget_from_worker_limit(self):
+        with patch.object(edi_tools, 'config', {'limit_time_real_cron': -1, 'limit_time_real': 100}):
+            self.assertEqual(EDIRunBudget().time_budget, 100 * edi_tools.TIME_BUDGET_RATIO)
+        with patch.object(edi_tools, 'config', {'limit_time_real_cron': 50, 'limit_time_real': 100}):
+            self.assertEqual(EDIRunBudget().time_budget, 50 * edi_tools.TIME_BUDGET_RATIO)
+        with patch.object(edi_tools, 'config', {'limit_time_real_cron': 0, 'limit_time_real': 0}):
+            self.assertEqual(EDIRunBudget().time_budget, 0)
+
+
+class TestEDIRetry(BaseCase):
+
+    def test_transient_errors(self):
+        for error in (ConnectionResetError(), socket.timeout(), EOFError(), ftplib.error_temp('421 Busy'),
+                      paramiko.SSHException('Error reading SSH protocol banner')):
+            self.assertTrue(is_transient_error(error), error)
+
+    def test_permanent_errors(self):
+        for error in (ftplib.error_perm('550 No such file'), paramiko.AuthenticationException(),
+                      FileNotFoundError(), PermissionError(), ValueError('Bad XML')):
+            self.assertFalse(is_transient_error(error), error)
+
+    def test_error_causes(self):
+        try:
+            try:
+                raise ConnectionRefusedError()
+            except OSError as e:
+                raise ValueError("Connection failed") from e
+        except ValueError as e:
+            self.assertTrue(is_transient_error(e))
+        try:
+            try:
+                raise ftplib.error_perm('530 Login incorrect')
+            except ftplib.Error:
+                raise ValueError("Connection failed")
+        except ValueError as e:
+            self.assertFalse(is_transient_error(e))
+
+    def test_error_cause_cycle(self):
+        first, second = ValueError(), KeyError()
+        first.__cause__, second.__cause__ = second, first
+        self.assertFalse(is_transient_error(first))
+
+    def test_retry_delay(self):
+        for attempt, delay in ((0, 60), (1, 60), (2, 120), (4, 480)):
+            for _ in range(20):
+                self.assertTrue(delay / 2 <= retry_delay(attempt, 60) <= delay)
+        for _ in range(20):
+            self.assertTrue(edi_tools.MAX_RETRY_DELAY / 2 <= retry_delay(50, 60) <= edi_tools.MAX_RETRY_DELAY)
+
+
+class TestEDIKeyNormalization(BaseCase):
+
+    def test_number_fields(self):
+        for value in (' 5 ', '5.0', 5.0, 5):
+            self.assertEqual(normalize_key_value(value, 'float'), '5', value)
+        self.assertEqual(normalize_key_value('00123', 'integer'), '123')
+        self.assertEqual(normalize_key_value('2.50', 'monetary'), '2.5')
+        self.assertEqual(normalize_key_value('N/A', 'integer'), 'N/A')
+
+    def test_text_fields(self):
+        self.assertEqual(normalize_key_value(' 00123 ', 'char'), '00123')
+        self.assertEqual(normalize_key_value(True), 'True')
+        self.assertEqual(normalize_key_value(None), '')
+        self.assertEqual(normalize_key_value(False), '')
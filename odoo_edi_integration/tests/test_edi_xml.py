@@ -0,0 +1,77 @@
+import xmltodict
+from odoo.tests.common import BaseCase
+from odoo.addons.odoo_edi_integration.models.edi_xml import XMLNode, get_xml_value, parse_xml_document
+
+PARITY_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<Root xmlns:n="urn:edi:test">
+    <Multi><A><B>1</B></A><A><B>2</B></A></Multi>
+    <One><A><B>1</B><B>2</B></A></One>
+    <Partly><A><B>1</B></A><A/></Partly>
+    <Text>value</Text>
+    <Empty/>
+    <Attr code="X1">label</Attr>
+    <n:Prefixed><n:Child>q</n:Child></n:Prefixed>
+    <Mixed>a<c>1</c>b</Mixed>
+    <Items><Item sku="A"><Qty>1</Qty></Item><Item sku="B"><Qty>2</Qty></Item></Items>
+</Root>
+"""
+
+PARITY_PATHS = [
+    'Root/Multi/A/B',
+    'Root/Multi/A',
+    'Root/One/A/B',
+    'Root/Partly/A/B',
+    'Root/Text',
+    'Root/Text/#text',
+    'Root/Text/Missing',
+    'Root/Empty',
+    'Root/Empty/Missing',
+    'Root/Attr/@code',
+    'Root/Attr/#text',
+    'Root/n:Prefixed/n:Child',
+    'Root/Mixed/#text',
+    'Root/Mixed/c',
+    'Root/Items/Item/Qty',
+    'Root/Missing/A',
+    'Other/Text',
+]
+
+
+def _comparable(value):
+    """
+    This method is used to convert value of either engine into plain value, nodes are compared by their keys.
+    Author: DG
+    """
+    if isinstance(value, list):
+        return [_comparable(item) for item in value]
+    if isinstance(value, (dict, XMLNode)):
+        return 'node'
+    return value
+
+
+class TestEDIXml(BaseCase):
+
+    def setUp(self):
+        super().setUp()
+        self.dict_data = xmltodict.parse(PARITY_XML)
+        self.lxml_data = parse_xml_document(PARITY_XML)
+
+    def test_document_paths_same_as_xmltodict(self):
+        for path in PARITY_PATHS:
+            with self.subTest(path=path):
+                self.assertEqual(_comparable(get_xml_value(self.lxml_data, path)),
+                                 _comparable(get_xml_value(self.dict_data, path)))
+
+    def test_repeated_intermediate_element_gives_none(self):
+        self.assertIsNone(get_xml_value(self.lxml_data, 'Root/Multi/A/B'))
+        self.assertIsNone(get_xml_value(self.lxml_data, 'Root/Partly/A/B'))
+        self.assertEqual(get_xml_value(self.lxml_data, 'Root/One/A/B'), ['1', '2'])
+
+    def test_record_nodes_same_as_xmltodict(self):
+        dict_items = get_xml_value(self.dict_data, 'Root/Items/Item')
+        lxml_items = get_xml_value(self.lxml_data, 'Root/Items/Item')
+        self.assertEqual(len(dict_items), len(lxml_items))
+        for dict_item, lxml_item in zip(dict_items, lxml_items):
+            for path in ('@sku', 'Qty', 'Missing', 'Qty/#text'):
+                self.assertEqual(get_xml_value(lxml_item, path), get_xml_value(dict_item, path))
+            self.assertEqual('Qty' in lxml_item, 'Qty' in dict_item)